@@ -1,16 +1,22 @@
 import logging
 import os
-import MT5Manager
 import time
 import json
 import threading
-from datetime import datetime
+from contextlib import nullcontext
+from datetime import datetime, timezone as dt_timezone
 import django
 from django.conf import settings
 from django.core.cache import cache
 
 logger = logging.getLogger(__name__)
 
+if os.environ.get('MT5_SIMULATOR'):
+    # Offline stand-in with a synthetic book, see core/mt5_simulator.py
+    from core import mt5_simulator as MT5Manager
+else:
+    import MT5Manager
+
 # Configure Django settings
 if not settings.configured:
     settings.configure(
@@ -34,6 +40,8 @@ if not settings.configured:
     django.setup()
 
 from core.models import Groups
+from core.mt5_pool import CHECKOUT_TIMEOUT, DEFAULT_POOL_SIZE, ManagerPool
+from core.utils import volume_to_lots
 
 __all__ = ['MT5Service']
 
@@ -54,6 +62,63 @@ def _read_env(dotenv_path=None):
     return env
 
 
+def position_to_dict(p):
+    """Convert an MT5 position object into the dict shape used across the RMS."""
+    return {
+        'date': getattr(p, 'TimeCreate', None),
+        'id': getattr(p, 'Position', None),
+        'symbol': getattr(p, 'Symbol', None),
+        'volume': volume_to_lots(getattr(p, 'Volume', 0)),
+        'price': getattr(p, 'PriceOpen', None),
+        'profit': getattr(p, 'Profit', None),
+        'type': 'Buy' if getattr(p, 'Action', None) == 0 else 'Sell',
+    }
+
+
+def account_to_dict(user, acc=None):
+    """Merge an MT5 user and its account state into the dict shape stored in Accounts."""
+    return {
+        'login': getattr(user, 'Login', None),
+        'name': getattr(user, 'Name', None) or f"{getattr(user, 'FirstName', '')} {getattr(user, 'LastName', '')}".strip(),
+        'email': getattr(user, 'EMail', None),
+        'group': getattr(user, 'Group', None),
+        'leverage': getattr(user, 'Leverage', None),
+        'balance': float(getattr(acc, 'Balance', 0.0)) if acc else 0.0,
+        'equity': float(getattr(acc, 'Equity', 0.0)) if acc else 0.0,
+        'profit': float(getattr(acc, 'Profit', 0.0)) if acc else 0.0,
+        'margin': float(getattr(acc, 'Margin', 0.0)) if acc else 0.0,
+        'margin_free': float(getattr(acc, 'MarginFree', 0.0)) if acc else 0.0,
+        'margin_level': float(getattr(acc, 'MarginLevel', 0.0)) if acc else 0.0,
+        'last_access': getattr(user, 'LastAccess', None),
+        'registration': getattr(user, 'Registration', None),
+    }
+
+
+def _is_closing_deal(d):
+    """True for buy/sell deals that close (Entry == 1) a non-zero volume."""
+    symbol = getattr(d, 'Symbol', None)
+    volume_closed = getattr(d, 'VolumeClosed', 0)
+    return (
+        getattr(d, 'Entry', None) == 1
+        and symbol and str(symbol).strip() != ''
+        and volume_closed and float(volume_closed) > 0
+        and getattr(d, 'Action', None) in (0, 1)
+    )
+
+
+def _group_masks(groups, max_length=1024):
+    """Join group names into comma-separated MT5 group masks of bounded length."""
+    masks, current = [], ''
+    for group in groups:
+        if current and len(current) + len(group) + 1 > max_length:
+            masks.append(current)
+            current = ''
+        current = f"{current},{group}" if current else group
+    if current:
+        masks.append(current)
+    return masks
+
+
 class MT5Service:
     """Standalone, lightweight wrapper around MT5Manager for read-only operations.
 
@@ -63,10 +128,12 @@ class MT5Service:
 
     _shared_manager = None
     _shared_lock = threading.Lock()
+    _init_lock = threading.Lock()
+    _pool = None
 
     @classmethod
     def reset_shared_manager(cls):
-        """Reset the shared manager to force a new connection."""
+        """Reset the shared manager and the session pool to force new connections."""
         with cls._shared_lock:
             if cls._shared_manager:
                 try:
@@ -74,6 +141,15 @@ class MT5Service:
                 except Exception:
                     pass
             cls._shared_manager = None
+            if cls._pool is not None:
+                cls._pool.close()
+            cls._pool = None
+
+    @classmethod
+    def pool_status(cls):
+        """Usage counters of the session pool, or None before the first checkout."""
+        pool = cls._pool
+        return pool.status() if pool is not None else None
 
     def __init__(self, host=None, port=None, login=None, password=None,
              server_id=None, pump_mode=1, timeout=120000):
@@ -174,51 +250,72 @@ class MT5Service:
         inst = os.path.join(base, pid)
         os.makedirs(inst, exist_ok=True)
         self._instance_dir = inst
-        MT5Manager.InitializeManagerAPIPath(module_path=inst, work_path=inst)
-        self.manager = MT5Manager.ManagerAPI()
-
-    def connect(self):
-        """Connect to MT5 Manager. Raises Exception on failure."""
-        with MT5Service._shared_lock:
-            if MT5Service._shared_manager and getattr(MT5Service._shared_manager, 'connected', False):
-                return MT5Service._shared_manager
-            self._init_manager()
-            MT5Service._shared_manager = self.manager
-            # Choose pump mode: prefer library constant if available, else use provided numeric
+        with MT5Service._init_lock:
+            MT5Manager.InitializeManagerAPIPath(module_path=inst, work_path=inst)
+            self.manager = MT5Manager.ManagerAPI()
+        return self.manager
+
+    def _open_manager(self):
+        """Create and connect a new manager. Raises Exception on failure."""
+        manager = self._init_manager()
+        # Choose pump mode: prefer library constant if available, else use provided numeric
+        pump = self.pump_mode
+        try:
+            # Try to use enum constant if present (safer than hardcoding numeric)
+            pump_enum = getattr(MT5Manager.ManagerAPI, 'EnPumpModes', None)
+            if pump_enum and hasattr(pump_enum, 'PUMP_MODE_FULL'):
+                pump = pump_enum.PUMP_MODE_FULL
+        except Exception:
+            # fallback to numeric pump_mode already set
             pump = self.pump_mode
-            try:
-                # Try to use enum constant if present (safer than hardcoding numeric)
-                pump_enum = getattr(MT5Manager.ManagerAPI, 'EnPumpModes', None)
-                if pump_enum and hasattr(pump_enum, 'PUMP_MODE_FULL'):
-                    pump = pump_enum.PUMP_MODE_FULL
-            except Exception:
-                # fallback to numeric pump_mode already set
-                pump = self.pump_mode
 
-            # Try to connect with login as is, if it's int, use int, else use as string
-            try:
-                login_val = int(self.login)
-            except ValueError:
-                login_val = self.login
+        # Try to connect with login as is, if it's int, use int, else use as string
+        try:
+            login_val = int(self.login)
+        except ValueError:
+            login_val = self.login
 
-            if not MT5Service._shared_manager.Connect(self.address, login_val, str(self.password), pump, int(self.timeout)):
-                # try one more time with numeric fallback 1
-                last = MT5Manager.LastError()
-                try:
-                    if pump != 1:
-                        if MT5Service._shared_manager.Connect(self.address, login_val, str(self.password), 1, int(self.timeout)):
-                            MT5Service._shared_manager.connected = True
-                            return MT5Service._shared_manager
-                except Exception:
-                    pass
-                raise Exception(f"Failed to connect to MT5 Manager: {last}")
-            # mark connected
+        if not manager.Connect(self.address, login_val, str(self.password), pump, int(self.timeout)):
+            # try one more time with numeric fallback 1
+            last = MT5Manager.LastError()
             try:
-                MT5Service._shared_manager.connected = True
+                if pump != 1:
+                    if manager.Connect(self.address, login_val, str(self.password), 1, int(self.timeout)):
+                        manager.connected = True
+                        return manager
             except Exception:
                 pass
+            raise Exception(f"Failed to connect to MT5 Manager: {last}")
+        # mark connected
+        try:
+            manager.connected = True
+        except Exception:
+            pass
+        return manager
+
+    def connect(self):
+        """Connect the shared manager (pump subscriptions live here). Raises Exception on failure."""
+        with MT5Service._shared_lock:
+            if MT5Service._shared_manager and getattr(MT5Service._shared_manager, 'connected', False):
+                return MT5Service._shared_manager
+            MT5Service._shared_manager = self._open_manager()
             return MT5Service._shared_manager
 
+    def session(self, timeout=CHECKOUT_TIMEOUT):
+        """Check out a pooled manager session: ``with svc.session() as mgr: ...``.
+
+        Reads go through the pool so concurrent requests and syncs don't queue up
+        behind each other on one connection. MT5_POOL_SIZE = 0 uses the shared manager.
+        """
+        size = getattr(settings, 'MT5_POOL_SIZE', DEFAULT_POOL_SIZE)
+        if not size:
+            return nullcontext(self.connect())
+        with MT5Service._shared_lock:
+            if MT5Service._pool is None:
+                MT5Service._pool = ManagerPool(self._open_manager, size)
+            pool = MT5Service._pool
+        return pool.session(timeout)
+
     def close(self):
         try:
             if self.manager and getattr(self.manager, 'connected', False):
@@ -229,237 +326,267 @@ class MT5Service:
 
     def get_group_list(self):
         """Return list of group names from MT5."""
-        mgr = self.connect()
-        groups = []
-        try:
-            total = mgr.GroupTotal()
-        except Exception:
-            total = 0
-        if not total:
-            return groups
-        for i in range(total):
+        with self.session() as mgr:
+            groups = []
             try:
-                g = mgr.GroupNext(i)
-                if not g:
-                    continue
-                name = None
-                for attr in ('Group', 'Name', 'group', 'name', 'GroupName'):
-                    if hasattr(g, attr):
-                        name = getattr(g, attr)
-                        break
-                if name:
-                    groups.append(name)
+                total = mgr.GroupTotal()
             except Exception:
-                continue
+                total = 0
+            if not total:
+                return groups
+            for i in range(total):
+                try:
+                    g = mgr.GroupNext(i)
+                    if not g:
+                        continue
+                    name = None
+                    for attr in ('Group', 'Name', 'group', 'name', 'GroupName'):
+                        if hasattr(g, attr):
+                            name = getattr(g, attr)
+                            break
+                    if name:
+                        groups.append(name)
+                except Exception:
+                    continue
 
-        return groups
+            return groups
 
     def get_account_details(self, login_id):
         """Return detailed account dict or None."""
-        mgr = self.connect()
-        try:
-            user = mgr.UserGet(int(login_id))
-            account = mgr.UserAccountGet(int(login_id))
-            if not user or not account:
+        with self.session() as mgr:
+            try:
+                user = mgr.UserGet(int(login_id))
+                account = mgr.UserAccountGet(int(login_id))
+                if not user or not account:
+                    return None
+                return {
+                    'login': getattr(user, 'Login', None),
+                    'name': f"{getattr(user, 'FirstName', '')} {getattr(user, 'LastName', '')}".strip(),
+                    'email': getattr(user, 'EMail', None),
+                    'balance': float(getattr(account, 'Balance', 0.0)),
+                    'equity': float(getattr(account, 'Equity', 0.0)),
+                    'margin': float(getattr(account, 'Margin', 0.0)),
+                    'margin_free': float(getattr(account, 'MarginFree', 0.0)),
+                    'margin_level': float(getattr(account, 'MarginLevel', 0.0)),
+                    'profit': float(getattr(account, 'Profit', 0.0)),
+                    'group': getattr(user, 'Group', None),
+                    'leverage': getattr(user, 'Leverage', None),
+                    'rights': getattr(user, 'Rights', None),
+                    'last_access': getattr(user, 'LastAccess', None),
+                    'registration': getattr(user, 'Registration', None),
+                }
+            except Exception:
                 return None
-            return {
-                'login': getattr(user, 'Login', None),
-                'name': f"{getattr(user, 'FirstName', '')} {getattr(user, 'LastName', '')}".strip(),
-                'email': getattr(user, 'EMail', None),
-                'balance': float(getattr(account, 'Balance', 0.0)),
-                'equity': float(getattr(account, 'Equity', 0.0)),
-                'margin': float(getattr(account, 'Margin', 0.0)),
-                'margin_free': float(getattr(account, 'MarginFree', 0.0)),
-                'margin_level': float(getattr(account, 'MarginLevel', 0.0)),
-                'profit': float(getattr(account, 'Profit', 0.0)),
-                'group': getattr(user, 'Group', None),
-                'leverage': getattr(user, 'Leverage', None),
-                'rights': getattr(user, 'Rights', None),
-                'last_access': getattr(user, 'LastAccess', None),
-                'registration': getattr(user, 'Registration', None),
-            }
-        except Exception:
-            return None
 
     def get_open_positions(self, login_id):
         """Return list of open positions for the given login id."""
-        mgr = self.connect()
-        try:
-            positions = mgr.PositionGet(int(login_id))
-            if not positions:
+        with self.session() as mgr:
+            try:
+                positions = mgr.PositionGet(int(login_id))
+                if not positions:
+                    return []
+                return [position_to_dict(p) for p in positions]
+            except Exception:
                 return []
-            out = []
-            for p in positions:
-                out.append({
-                    'date': getattr(p, 'TimeCreate', None),
-                    'id': getattr(p, 'Position', None),
-                    'symbol': getattr(p, 'Symbol', None),
-                    'volume': round(getattr(p, 'Volume', 0) / 10000, 2),
-                    'price': getattr(p, 'PriceOpen', None),
-                    'profit': getattr(p, 'Profit', None),
-                    'type': 'Buy' if getattr(p, 'Action', None) == 0 else 'Sell',
-                })
-            return out
-        except Exception:
-            return []
 
     def get_position_by_ticket(self, ticket):
         """Return position details for a specific ticket (position ID)."""
-        mgr = self.connect()
-        try:
-            position = mgr.PositionGet(ticket=int(ticket))
-            if not position:
-                return None
-            # PositionGet with ticket returns a single position or list, handle accordingly
-            if isinstance(position, list):
-                position = position[0] if position else None
-            if not position:
+        with self.session() as mgr:
+            try:
+                position = mgr.PositionGet(ticket=int(ticket))
+                if not position:
+                    return None
+                # PositionGet with ticket returns a single position or list, handle accordingly
+                if isinstance(position, list):
+                    position = position[0] if position else None
+                if not position:
+                    return None
+                return position_to_dict(position)
+            except Exception:
                 return None
-            return {
-                'date': getattr(position, 'TimeCreate', None),
-                'id': getattr(position, 'Position', None),
-                'symbol': getattr(position, 'Symbol', None),
-                'volume': round(getattr(position, 'Volume', 0) / 10000, 2),
-                'price': getattr(position, 'PriceOpen', None),
-                'profit': getattr(position, 'Profit', None),
-                'type': 'Buy' if getattr(position, 'Action', None) == 0 else 'Sell',
-            }
-        except Exception:
-            return None
+
+    def get_open_positions_by_group(self, groups=None, logins=None):
+        """
+        Fetch open positions for whole groups and index them by login.
+
+        Uses PositionGetByGroup with comma-joined group masks, so refreshing the whole
+        book costs one MT5 call per mask instead of one PositionGet per account.
+        ``groups`` may be a mask string or a list of group names and defaults to the
+        enabled groups. ``logins`` (accounts known to be in those groups) are always
+        present in the result, with an empty list when they have no positions, so the
+        caller can clear positions that were closed.
+
+        Falls back to per-login PositionGet for ``logins`` when the bulk call is not
+        available. Raises if neither path can run.
+        """
+        if groups is None:
+            groups = self.enabled_group_names() or ['*']
+        if isinstance(groups, str):
+            groups = [groups]
+
+        with self.session() as mgr:
+            request_by_group = getattr(mgr, 'PositionGetByGroup', None)
+            if request_by_group is not None:
+                started = time.time()
+                by_login = {int(login): [] for login in logins or []}
+                calls = 0
+                try:
+                    for mask in _group_masks(groups):
+                        calls += 1
+                        positions = request_by_group(mask)
+                        if positions is False or positions is None:
+                            raise Exception(f"PositionGetByGroup failed for '{mask}': {MT5Manager.LastError()}")
+                        for p in positions:
+                            by_login.setdefault(getattr(p, 'Login', None), []).append(position_to_dict(p))
+                    logger.info(f"Fetched open positions for {len(by_login)} logins in {calls} calls "
+                                f"({time.time() - started:.2f}s)")
+                    return by_login
+                except Exception as e:
+                    logger.warning(f"Bulk position request unavailable, falling back to per-login requests: {e}")
+
+        if logins is None:
+            raise Exception("PositionGetByGroup unavailable and no logins given for the per-login fallback")
+        return {int(login): self.get_open_positions(login) for login in logins}
 
     def list_accounts_by_index(self):
         """Iterate accounts using UserTotal/UserGet (index based). Returns list of dicts."""
-        mgr = self.connect()
-        accounts = []
-        try:
-            total = mgr.UserTotal()
-        except Exception:
-            return accounts
-        for i in range(total):
+        with self.session() as mgr:
+            accounts = []
             try:
-                user = mgr.UserGet(i)
-                if not user:
-                    continue
-                acc = mgr.UserAccountGet(getattr(user, 'Login', None))
-                account_data = {
-                    'login': getattr(user, 'Login', None),
-                    'name': getattr(user, 'Name', None) or f"{getattr(user, 'FirstName', '')} {getattr(user, 'LastName', '')}".strip(),
-                    'email': getattr(user, 'EMail', None),
-                    'group': getattr(user, 'Group', None),
-                    'leverage': getattr(user, 'Leverage', None),
-                    'balance': float(getattr(acc, 'Balance', 0.0)) if acc else 0.0,
-                    'equity': float(getattr(acc, 'Equity', 0.0)) if acc else 0.0,
-                    'profit': float(getattr(acc, 'Profit', 0.0)) if acc else 0.0,
-                }
-                accounts.append(account_data)
+                total = mgr.UserTotal()
             except Exception:
-                continue
-        return accounts
+                return accounts
+            for i in range(total):
+                try:
+                    user = mgr.UserGet(i)
+                    if not user:
+                        continue
+                    acc = mgr.UserAccountGet(getattr(user, 'Login', None))
+                    account_data = {
+                        'login': getattr(user, 'Login', None),
+                        'name': getattr(user, 'Name', None) or f"{getattr(user, 'FirstName', '')} {getattr(user, 'LastName', '')}".strip(),
+                        'email': getattr(user, 'EMail', None),
+                        'group': getattr(user, 'Group', None),
+                        'leverage': getattr(user, 'Leverage', None),
+                        'balance': float(getattr(acc, 'Balance', 0.0)) if acc else 0.0,
+                        'equity': float(getattr(acc, 'Equity', 0.0)) if acc else 0.0,
+                        'profit': float(getattr(acc, 'Profit', 0.0)) if acc else 0.0,
+                    }
+                    accounts.append(account_data)
+                except Exception:
+                    continue
+            return accounts
 
     def list_accounts_by_range(self, start, end, workers=8, batch_size=100, output_file=None):
         """Scan numeric login IDs from start..end (inclusive) and return found accounts.
 
         This is a reliable fallback when index-based enumeration returns few results.
         """
-        mgr = self.connect()
-        from concurrent.futures import ThreadPoolExecutor, as_completed
+        with self.session() as mgr:
+            from concurrent.futures import ThreadPoolExecutor, as_completed
 
-        start = int(start)
-        end = int(end)
-        if end < start:
-            start, end = end, start
+            start = int(start)
+            end = int(end)
+            if end < start:
+                start, end = end, start
 
-        def check_login(login_id):
-            try:
-                user = mgr.UserGet(int(login_id))
-                if not user:
+            def check_login(login_id):
+                try:
+                    user = mgr.UserGet(int(login_id))
+                    if not user:
+                        return None
+                    acc = mgr.UserAccountGet(int(login_id))
+                    return {
+                        'login': getattr(user, 'Login', None),
+                        'name': getattr(user, 'Name', None) or f"{getattr(user, 'FirstName', '')} {getattr(user, 'LastName', '')}".strip(),
+                        'email': getattr(user, 'EMail', None),
+                        'group': getattr(user, 'Group', None),
+                        'leverage': getattr(user, 'Leverage', None),
+                        'balance': float(getattr(acc, 'Balance', 0.0)) if acc else 0.0,
+                        'equity': float(getattr(acc, 'Equity', 0.0)) if acc else 0.0,
+                    }
+                except Exception:
                     return None
-                acc = mgr.UserAccountGet(int(login_id))
-                return {
-                    'login': getattr(user, 'Login', None),
-                    'name': getattr(user, 'Name', None) or f"{getattr(user, 'FirstName', '')} {getattr(user, 'LastName', '')}".strip(),
-                    'email': getattr(user, 'EMail', None),
-                    'group': getattr(user, 'Group', None),
-                    'leverage': getattr(user, 'Leverage', None),
-                    'balance': float(getattr(acc, 'Balance', 0.0)) if acc else 0.0,
-                    'equity': float(getattr(acc, 'Equity', 0.0)) if acc else 0.0,
-                }
-            except Exception:
-                return None
 
-        accounts = []
-        # optional streaming to file to avoid memory growth
-        write_file = None
-        if output_file:
-            write_file = open(output_file, 'w', encoding='utf-8')
+            accounts = []
+            # optional streaming to file to avoid memory growth
+            write_file = None
+            if output_file:
+                write_file = open(output_file, 'w', encoding='utf-8')
 
-        try:
-            with ThreadPoolExecutor(max_workers=int(workers)) as ex:
-                futures = {ex.submit(check_login, lid): lid for lid in range(start, end + 1)}
-                for fut in as_completed(futures):
-                    res = fut.result()
-                    if res:
-                        accounts.append(res)
-                        if write_file:
-                            write_file.write(json.dumps(res, default=str) + '\n')
-        finally:
-            if write_file:
-                write_file.close()
+            try:
+                with ThreadPoolExecutor(max_workers=int(workers)) as ex:
+                    futures = {ex.submit(check_login, lid): lid for lid in range(start, end + 1)}
+                    for fut in as_completed(futures):
+                        res = fut.result()
+                        if res:
+                            accounts.append(res)
+                            if write_file:
+                                write_file.write(json.dumps(res, default=str) + '\n')
+            finally:
+                if write_file:
+                    write_file.close()
 
-        return accounts
+            return accounts
+
+    def iter_accounts_by_groups(self, groups=None, stats=None):
+        """Yield account dicts group by group using UserGetByGroup and UserAccountGetByGroup.
+
+        Account states are requested in bulk per group (UserAccountGet per user only when
+        the bulk call is missing), so memory stays bounded by the largest group. ``groups``
+        defaults to every group on the server. When ``stats`` is a list, one entry with
+        the MT5 call count and duration is appended per group.
+        """
+        if groups is None:
+            groups = self.get_group_list()
+        for group_name in groups:
+            started = time.time()
+            calls = 0
+            accounts = []
+            try:
+                with self.session() as mgr:
+                    calls += 1
+                    users = mgr.UserGetByGroup(group_name)
+                    if users:
+                        states = None
+                        account_get_by_group = getattr(mgr, 'UserAccountGetByGroup', None)
+                        if account_get_by_group is not None:
+                            calls += 1
+                            result = account_get_by_group(group_name)
+                            if result is not False and result is not None:
+                                states = {getattr(acc, 'Login', None): acc for acc in result}
+                        for u in users:
+                            login = getattr(u, 'Login', None)
+                            if states is not None:
+                                acc = states.get(login)
+                            else:
+                                calls += 1
+                                acc = mgr.UserAccountGet(login)
+                            accounts.append(account_to_dict(u, acc))
+            except Exception as e:
+                logger.error(f"Failed to enumerate accounts in group {group_name}: {e}")
+            duration_ms = round((time.time() - started) * 1000, 1)
+            logger.debug(f"Group {group_name}: {len(accounts)} accounts, {calls} MT5 calls, {duration_ms}ms")
+            if stats is not None:
+                stats.append({'group': group_name, 'accounts': len(accounts), 'calls': calls, 'duration_ms': duration_ms})
+            yield from accounts
 
     def list_accounts_by_groups(self, output_file=None):
         """Enumerate users by group using UserGetByGroup. Returns list of account dicts.
 
         This method is useful when index-based enumeration doesn't return all users.
+        Use iter_accounts_by_groups() to stream instead of building the list.
         """
-        mgr = self.connect()
         accounts = []
         write_file = None
         if output_file:
             write_file = open(output_file, 'w', encoding='utf-8')
 
         try:
-            try:
-                total = mgr.GroupTotal()
-            except Exception:
-                total = 0
-            for i in range(total):
-                try:
-                    g = mgr.GroupNext(i)
-                    if not g:
-                        continue
-                    group_name = getattr(g, 'Group', None)
-                    if not group_name:
-                        continue
-                    # UserGetByGroup may return iterable of user objects
-                    try:
-                        users = mgr.UserGetByGroup(group_name)
-                    except Exception:
-                        users = []
-                    if not users:
-                        continue
-                    for u in users:
-                        try:
-                            login = getattr(u, 'Login', None)
-                            acc = mgr.UserAccountGet(login)
-                            account_data = {
-                                'login': login,
-                                'name': getattr(u, 'Name', None) or f"{getattr(u, 'FirstName', '')} {getattr(u, 'LastName', '')}".strip(),
-                                'email': getattr(u, 'EMail', None),
-                                'group': getattr(u, 'Group', None),
-                                'leverage': getattr(u, 'Leverage', None),
-                                'balance': float(getattr(acc, 'Balance', 0.0)) if acc else 0.0,
-                                'equity': float(getattr(acc, 'Equity', 0.0)) if acc else 0.0,
-                                'profit': float(getattr(acc, 'Profit', 0.0)) if acc else 0.0,
-                            }
-                            accounts.append(account_data)
-                            if write_file:
-                                write_file.write(json.dumps(account_data, default=str) + '\n')
-                        except Exception:
-                            continue
-                except Exception:
-                    continue
+            for account_data in self.iter_accounts_by_groups():
+                accounts.append(account_data)
+                if write_file:
+                    write_file.write(json.dumps(account_data, default=str) + '\n')
         finally:
             if write_file:
                 write_file.close()
@@ -468,35 +595,35 @@ class MT5Service:
 
     def list_deals_by_login(self, login_id):
         """Return list of closed deals for the given login id."""
-        mgr = self.connect()
-        try:
-            total = mgr.DealTotal()
-            if not total:
-                return []
-            out = []
-            for i in range(total):
-                try:
-                    d = mgr.DealNext(i)
-                    if not d:
-                        continue
-                    if getattr(d, 'Login', None) != int(login_id):
+        with self.session() as mgr:
+            try:
+                total = mgr.DealTotal()
+                if not total:
+                    return []
+                out = []
+                for i in range(total):
+                    try:
+                        d = mgr.DealNext(i)
+                        if not d:
+                            continue
+                        if getattr(d, 'Login', None) != int(login_id):
+                            continue
+                        out.append({
+                            'Deal': getattr(d, 'Deal', None),
+                            'Login': getattr(d, 'Login', None),
+                            'Symbol': getattr(d, 'Symbol', None),#
+                            'Profit': getattr(d, 'Profit', None),#
+                            'Volume': volume_to_lots(getattr(d, 'Volume', 0)),#
+                            'Price': getattr(d, 'Price', None),
+                            'Time': getattr(d, 'Time', None),
+                            'Type': getattr(d, 'Action', None),#
+                            'Entry': getattr(d, 'Entry', None),
+                        })
+                    except Exception:
                         continue
-                    out.append({
-                        'Deal': getattr(d, 'Deal', None),
-                        'Login': getattr(d, 'Login', None),
-                        'Symbol': getattr(d, 'Symbol', None),#
-                        'Profit': getattr(d, 'Profit', None),#
-                        'Volume': round(getattr(d, 'Volume', 0) / 10000, 2),#
-                        'Price': getattr(d, 'Price', None),
-                        'Time': getattr(d, 'Time', None),
-                        'Type': getattr(d, 'Action', None),#
-                        'Entry': getattr(d, 'Entry', None),
-                    })
-                except Exception:
-                    continue
-            return out
-        except Exception:
-            return []
+                return out
+            except Exception:
+                return []
 
     def search_accounts_by_name_email(self, name=None, email=None):
         """Search accounts by name or email. Returns list of matching accounts."""
@@ -527,64 +654,141 @@ class MT5Service:
             auto_process_commission: If True, automatically process commissions for new closed trades
                                     DEFAULT: False to prevent duplicate processing
         """
-        if not self.manager:
-            raise Exception("MT5 Manager not connected")
-        from datetime import datetime, timedelta
-        if to_date is None:
-            to_date = datetime.now()
-        if from_date is None:
-            # Get trades from 7 days ago to future (to catch any missed recent trades)
-            from_date = datetime.now() - timedelta(days=1)
+        with self.session() as mgr:
+            from datetime import datetime, timedelta
+            if to_date is None:
+                to_date = datetime.now()
+            if from_date is None:
+                # Get trades from 7 days ago to future (to catch any missed recent trades)
+                from_date = datetime.now() - timedelta(days=1)
         
-        # Validate that login_id is numeric before making MT5 call
-        try:
-            numeric_login_id = int(login_id)
-        except (ValueError, TypeError):
-            logger.warning(f"Skipping non-numeric account ID: {login_id}")
-            return []
+            # Validate that login_id is numeric before making MT5 call
+            try:
+                numeric_login_id = int(login_id)
+            except (ValueError, TypeError):
+                logger.warning(f"Skipping non-numeric account ID: {login_id}")
+                return []
             
-        deals = self.manager.DealRequest(numeric_login_id, from_date, to_date)
-        # Debug print removed
-        # Defensive: DealRequest can return False, None, empty list, or a list of deals
-        if deals is False or deals is None:
-            return []
-        if isinstance(deals, bool):
-            return []
-        if not isinstance(deals, (list, tuple)):
-            return []
-        if not deals:
-            return []
-        closed_deals = []
-        for idx, d in enumerate(deals):
-            action = getattr(d, 'Action', None)
-            entry = getattr(d, 'Entry', None)
-            symbol = getattr(d, 'Symbol', None)
-            volume_closed = getattr(d, 'VolumeClosed', 0)
-            deal_id = getattr(d, 'Deal', None)
-            position_id = getattr(d, 'PositionID', None)  # Use PositionID not Position
+            deals = mgr.DealRequest(numeric_login_id, from_date, to_date)
+            # Debug print removed
+            # Defensive: DealRequest can return False, None, empty list, or a list of deals
+            if deals is False or deals is None:
+                return []
+            if isinstance(deals, bool):
+                return []
+            if not isinstance(deals, (list, tuple)):
+                return []
+            if not deals:
+                return []
+            closed_deals = []
+            for idx, d in enumerate(deals):
+                action = getattr(d, 'Action', None)
+                entry = getattr(d, 'Entry', None)
+                deal_id = getattr(d, 'Deal', None)
+                position_id = getattr(d, 'PositionID', None)  # Use PositionID not Position
             
-            # DEBUG: Log all available attributes for first deal
-            if idx == 0 and auto_process_commission:
-                logger.info(f"🔍 DEBUG: First deal attributes: {[attr for attr in dir(d) if not attr.startswith('_')]}")
-                logger.info(f"🔍 DEBUG: Deal={deal_id}, PositionID={position_id}, Entry={entry}, Action={action}")
+                # DEBUG: Log all available attributes for first deal
+                if idx == 0 and auto_process_commission:
+                    logger.info(f"🔍 DEBUG: First deal attributes: {[attr for attr in dir(d) if not attr.startswith('_')]}")
+                    logger.info(f"🔍 DEBUG: Deal={deal_id}, PositionID={position_id}, Entry={entry}, Action={action}")
             
-            # Keep original filter for actual closed_deals list - ONLY closing deals (Entry==1)
-            if entry == 1 and symbol and str(symbol).strip() != '' and volume_closed and float(volume_closed) > 0 and action in (0, 1):
-                closed_deals.append(d)
-                logger.debug(f"Added closed deal: Deal={deal_id}, PositionID={position_id}, Entry={entry}")
+                # Keep original filter for actual closed_deals list - ONLY closing deals (Entry==1)
+                if _is_closing_deal(d):
+                    closed_deals.append(d)
+                    logger.debug(f"Added closed deal: Deal={deal_id}, PositionID={position_id}, Entry={entry}")
+        
+            # Auto-process commissions for newly closed trades if requested
+            if auto_process_commission and closed_deals:
+                logger.info(f"Auto-processing commissions for {len(closed_deals)} closed trades for account {login_id}")
+                try:
+                    self._auto_process_commissions_for_closed_trades(login_id, closed_deals)
+                    logger.info(f"✅ Auto-processing completed for account {login_id}")
+                except Exception as e:
+                    logger.error(f"❌ Auto-processing failed for account {login_id}: {str(e)}")
+                    # Continue execution even if auto-processing fails
+                    pass
         
-        # Auto-process commissions for newly closed trades if requested
-        if auto_process_commission and closed_deals:
-            logger.info(f"Auto-processing commissions for {len(closed_deals)} closed trades for account {login_id}")
+            return closed_deals
+
+    def server_time(self):
+        """Current trade-server time as stored for deals: server wall clock labelled UTC.
+
+        MT5 stamps deals in server time, so sync windows and watermarks must use this
+        clock rather than the host's. Returns None when the server doesn't answer.
+        """
+        with self.session() as mgr:
+            stamp = mgr.TimeServer()
+        if not stamp:
+            return None
+        return datetime.fromtimestamp(int(stamp), tz=dt_timezone.utc)
+
+    def enabled_group_names(self):
+        """Return group names enabled in MT5GroupConfig, falling back to the Groups table."""
+        from core.models import MT5GroupConfig
+        groups = list(MT5GroupConfig.objects.filter(is_enabled=True).values_list('group_name', flat=True))
+        if not groups:
+            groups = list(Groups.objects.values_list('Groups', flat=True))
+        return groups
+
+    def get_closed_trades_by_group(self, groups=None, from_date=None, to_date=None, logins=None):
+        """
+        Fetch closing deals for whole groups over a time range and split them by login.
+
+        Uses DealRequestByGroup, which takes a group mask (wildcards and comma-separated
+        lists are allowed), so a full closed-deal sync costs one MT5 call per mask instead
+        of one DealRequest per account. ``groups`` may be a mask string or a list of group
+        names; it defaults to the enabled groups. When the bulk call is not available the
+        deals are requested per login for ``logins`` (or every stored account in the groups).
+
+        Returns a dict of login -> list of closing deals. Only logins that were fetched
+        successfully are present, so callers can advance their watermark per key.
+        """
+        if to_date is None:
+            to_date = datetime.now()
+        if from_date is None:
+            from datetime import timedelta
+            from_date = to_date - timedelta(days=1)
+        if groups is None:
+            groups = self.enabled_group_names() or ['*']
+        if isinstance(groups, str):
+            groups = [groups]
+
+        with self.session() as mgr:
+            request_by_group = getattr(mgr, 'DealRequestByGroup', None)
+            if request_by_group is not None:
+                started = time.time()
+                by_login = {int(login): [] for login in logins or []}
+                calls = 0
+                try:
+                    for mask in _group_masks(groups):
+                        calls += 1
+                        deals = request_by_group(mask, from_date, to_date)
+                        if deals is False or deals is None:
+                            raise Exception(f"DealRequestByGroup failed for '{mask}': {MT5Manager.LastError()}")
+                        for d in deals:
+                            if not _is_closing_deal(d):
+                                continue
+                            by_login.setdefault(getattr(d, 'Login', None), []).append(d)
+                    logger.info(f"Fetched closing deals for {len(by_login)} logins in {calls} calls "
+                                f"({time.time() - started:.2f}s)")
+                    return by_login
+                except Exception as e:
+                    logger.warning(f"Bulk deal request unavailable, falling back to per-login requests: {e}")
+
+        # Per-login fallback; get_closed_trades checks out its own session
+        if logins is None:
+            from core.models import Accounts
+            qs = Accounts.objects.all()
+            if '*' not in groups:
+                qs = qs.filter(group__in=groups)
+            logins = list(qs.values_list('login', flat=True))
+        by_login = {}
+        for login in logins:
             try:
-                self._auto_process_commissions_for_closed_trades(login_id, closed_deals)
-                logger.info(f"✅ Auto-processing completed for account {login_id}")
+                by_login[int(login)] = self.get_closed_trades(login, from_date=from_date, to_date=to_date)
             except Exception as e:
-                logger.error(f"❌ Auto-processing failed for account {login_id}: {str(e)}")
-                # Continue execution even if auto-processing fails
-                pass
-        
-        return closed_deals
+                logger.error(f"Failed to fetch closed deals for {login}: {e}")
+        return by_login
 
     def sync_groups(self):
         """
@@ -592,29 +796,29 @@ class MT5Service:
         Returns True if successful, False otherwise.
         """
         try:
-            mgr = self.connect()
             groups = []
-            try:
-                total = mgr.GroupTotal()
-            except Exception:
-                total = 0
-            if not total:
-                return False
-
-            for i in range(total):
+            with self.session() as mgr:
                 try:
-                    g = mgr.GroupNext(i)
-                    if not g:
-                        continue
-                    name = None
-                    for attr in ('Group', 'Name', 'group', 'name', 'GroupName'):
-                        if hasattr(g, attr):
-                            name = getattr(g, attr)
-                            break
-                    if name:
-                        groups.append(name)
+                    total = mgr.GroupTotal()
                 except Exception:
-                    continue
+                    total = 0
+                if not total:
+                    return False
+
+                for i in range(total):
+                    try:
+                        g = mgr.GroupNext(i)
+                        if not g:
+                            continue
+                        name = None
+                        for attr in ('Group', 'Name', 'group', 'name', 'GroupName'):
+                            if hasattr(g, attr):
+                                name = getattr(g, attr)
+                                break
+                        if name:
+                            groups.append(name)
+                    except Exception:
+                        continue
 
             # Update MT5GroupConfig model
             from core.models import MT5GroupConfig
@@ -635,6 +839,8 @@ class MT5Service:
             Groups.objects.all().delete()  # Clear existing groups
             for group_name in enabled_groups:
                 Groups.objects.get_or_create(Groups=group_name)
+            from core import generation
+            generation.bump()  # /api/groups/db/ answers from its ETag until the generation moves
 
             logger.info(f"Synced {len(groups)} trading groups from MT5")
             return True
@@ -709,8 +915,8 @@ def reset_mt5_instance(server_id=None):
             except Exception as e:
                 logger.warning(f"Error cleaning up MT5 instance directories: {e}")
 
-            # Reset shared manager
-            MT5Service._shared_manager = None
+            # Reset shared manager and session pool
+            MT5Service.reset_shared_manager()
             _mt5_instance = None
 
             # 2️⃣ Load server settings from DB
@@ -5,6 +5,6 @@ class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
     def ready(self):
-        # Start the background fetching thread
+        # Start the sync scheduler, if this is the process that should run it
         from .tasks import start_background_thread
         start_background_thread()
\ No newline at end of file
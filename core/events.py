@@ -0,0 +1,220 @@
+"""In-process publish/subscribe of data changes, pushed to browsers as Server-Sent Events.
+
+Sync writers publish the rows they changed once their transaction commits:
+``positions`` (upserted rows and removed position ids, or price/profit moves),
+``accounts`` (rewritten account rows) and ``group_summary`` (groups whose summary
+row changed, rebuilt at most every SUMMARY_INTERVAL seconds and only while
+someone listens). Each SSE
+connection holds a bounded asyncio queue that publishers feed from their own
+threads, so the cost of a change is one queue put per listener and idle viewers
+cost nothing.
+
+Events carry increasing ids and the last HISTORY_SIZE (at most HISTORY_ROWS rows
+in total) are kept, so a client that reconnects with Last-Event-ID receives what
+it missed; when that is no longer available it gets a ``reset`` event and should
+reload over the REST endpoints. Events published while nobody listens to their
+topic keep only their id, so the history costs nothing on an unwatched book.
+Subscribers live in the web process, which also runs the scheduler and the pump,
+and the stream needs the ASGI app (``asgi:application``).
+"""
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connections, transaction
+
+from . import generation
+
+logger = logging.getLogger(__name__)
+
+TOPICS = ('positions', 'accounts', 'group_summary')
+HISTORY_SIZE = 1000
+HISTORY_ROWS = 20000  # row dicts kept across the history, e.g. changed positions
+QUEUE_SIZE = 500  # events buffered per connection before it is told to reset
+SUMMARY_INTERVAL = 2  # seconds between group summary checks while someone listens
+
+
+class Subscription:
+    def __init__(self, loop, topics, logins):
+        self.loop = loop
+        self.topics = set(topics)
+        self.logins = set(logins) if logins else None
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+
+    def _put(self, event):
+        # Runs on the subscriber's event loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)  # tells the stream to send a reset and close
+
+    def accepts(self, event):
+        return event['topic'] in self.topics
+
+    def render(self, event):
+        """Return the SSE frame for ``event`` or None if none of its rows are of interest."""
+        data = event['data']
+        if self.logins is not None and 'logins' in event:
+            if not self.logins & event['logins']:
+                return None
+            # Lists hold row dicts with a login, or bare logins
+            data = {
+                key: [row for row in rows if (row.get('login') if isinstance(row, dict) else row) in self.logins]
+                if isinstance(rows, list) else rows
+                for key, rows in data.items()
+            }
+        return f"id: {event['id']}\nevent: {event['topic']}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def _row_count(data):
+    return sum(len(rows) for rows in data.values() if isinstance(rows, list)) if data else 0
+
+
+class Broker:
+    def __init__(self, history_size=HISTORY_SIZE, history_rows=HISTORY_ROWS):
+        # Start from the clock so ids keep increasing across restarts
+        self.first_id = time.time_ns() // 1_000_000
+        self.last_id = self.first_id - 1
+        self._ids = itertools.count(self.first_id)
+        self.history_size = history_size
+        self.history_rows = history_rows
+        self._history = deque()
+        self._history_rows = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, loop, topics=TOPICS, logins=None):
+        subscription = Subscription(loop, topics, logins)
+        with self._lock:
+            self._subscribers.add(subscription)
+        if 'group_summary' in subscription.topics:
+            _summary_watcher.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def listening(self, topic):
+        with self._lock:
+            return any(topic in s.topics for s in self._subscribers)
+
+    def _record(self, event):
+        # Called with the lock held
+        self._history.append(event)
+        self._history_rows += event['rows']
+        while len(self._history) > self.history_size or (
+                self._history_rows > self.history_rows and len(self._history) > 1):
+            self._history_rows -= self._history.popleft()['rows']
+
+    def publish(self, topic, data, logins=None):
+        """Record an event and hand it to every subscriber of ``topic``."""
+        with self._lock:
+            event = {'id': next(self._ids), 'topic': topic, 'data': data, 'time': time.time(), 'rows': _row_count(data)}
+            self.last_id = event['id']
+            if logins is not None:
+                event['logins'] = set(logins)
+            subscribers = [s for s in self._subscribers if s.accepts(event)]
+            if subscribers:
+                self._record(event)
+            else:
+                # Nobody to send it to; a client reconnecting on this topic is told to reset
+                self._record({'id': event['id'], 'topic': topic, 'data': None, 'time': event['time'], 'rows': 0})
+            self.published += 1
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, event)
+            except RuntimeError:
+                # The connection's loop has shut down
+                self.unsubscribe(subscription)
+        return event['id']
+
+    def since(self, last_id, topics=TOPICS):
+        """Events after ``last_id``, or None if some of them on ``topics`` are no longer available."""
+        with self._lock:
+            history = list(self._history)
+            newest = self.last_id
+        oldest = history[0]['id'] if history else newest + 1
+        if last_id < oldest - 1 or last_id > newest:
+            return None
+        missed = [e for e in history if e['id'] > last_id]
+        if any(e['data'] is None and e['topic'] in topics for e in missed):
+            return None
+        return missed
+
+    def status(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'published': self.published,
+                'last_id': self.last_id,
+                'history': len(self._history),
+                'history_rows': self._history_rows,
+            }
+
+
+broker = Broker()
+
+
+def publish(topic, data, logins=None):
+    """Publish ``data`` on ``topic`` after the current transaction (if any) commits."""
+    transaction.on_commit(lambda: broker.publish(topic, data, logins))
+
+
+class _SummaryWatcher:
+    """Rebuilds the group summary when the data generation moves and publishes the changed groups."""
+
+    def __init__(self, interval=SUMMARY_INTERVAL):
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._generation = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                # Compare against a fresh baseline, not whatever was seen when it last ran
+                self._rows, self._generation = {}, None
+                self._thread = threading.Thread(target=self._run, name='events-group-summary', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        from .views import build_group_summary
+        try:
+            while broker.listening('group_summary'):
+                close_old_connections()
+                try:
+                    self.check(build_group_summary)
+                except Exception as e:
+                    logger.error(f"Group summary push failed: {e}")
+                time.sleep(self.interval)
+        finally:
+            connections.close_all()
+
+    def check(self, build):
+        if generation.current() == self._generation:
+            return
+        # The first build only sets the baseline; clients load the summary over REST
+        first = self._generation is None
+        rows, self._generation, _ = generation.cached('group_summary', build)
+        rows = {row['group']: row for row in rows}
+        changed = [row for group, row in rows.items() if self._rows.get(group) != row]
+        removed = [group for group in self._rows if group not in rows]
+        self._rows = rows
+        if (changed or removed) and not first:
+            broker.publish('group_summary', {'generation': self._generation, 'changed': changed, 'removed': removed})
+
+
+_summary_watcher = _SummaryWatcher()
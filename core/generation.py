@@ -0,0 +1,132 @@
+"""Data generation counter and per-generation caching of derived payloads.
+
+Every sync write bumps the generation once its transaction commits. Derived
+payloads such as the group summary are cached together with the generation they
+were built from and rebuilt by the first request that sees a newer one, so they
+cost one computation per sync cycle however many dashboards are polling. The
+polling endpoints also use the generation as their ETag, so a poll that finds
+nothing new is answered with a 304 before the view runs.
+
+The counter is the single DataGeneration row, so the web process, sync workers
+and backfills all move the same generation and every process serving requests
+sees it. Bumps are throttled to one per BUMP_INTERVAL in each process: the pump
+writes every 250 ms, and the writes of an interval are folded into one trailing
+bump.
+
+Polls read the counter from Django's cache, which holds a copy of the row for
+GENERATION_TTL seconds and falls back to the row on a miss. A bump writes its new
+value through to the cache, so with a shared cache (Redis, memcached) every
+process sees it at once and the row is read about once per GENERATION_TTL for the
+whole deployment. With the default per-process cache each process reads the row at
+most once per GENERATION_TTL and may see another process's bump that much later,
+which is no more than the bump throttling already delays it. Payloads are cached
+the same way: with a per-process cache each process builds its own copy per generation.
+"""
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DataGeneration
+
+logger = logging.getLogger(__name__)
+
+CACHED_KEY = 'rms:cached:{}'
+GENERATION_KEY = 'rms:generation'
+BUMP_INTERVAL = 1.0  # seconds between generation bumps of one process
+GENERATION_TTL = BUMP_INTERVAL  # seconds a cached copy of the counter is served without reading the row
+
+_build_lock = threading.Lock()
+_bump_lock = threading.Lock()
+_last_bump = 0.0
+_trailing = None
+
+
+def _load():
+    row = DataGeneration.objects.filter(pk=1).values('generation', 'updated_at').first()
+    if row is None:
+        # Created by migration 0010; start from the clock if it went missing since
+        DataGeneration.objects.get_or_create(pk=1, defaults={'generation': time.time_ns() // 1_000_000})
+        row = DataGeneration.objects.filter(pk=1).values('generation', 'updated_at').first()
+    cache.set(GENERATION_KEY, row, GENERATION_TTL)
+    return row
+
+
+def _row():
+    row = cache.get(GENERATION_KEY)
+    return row if row is not None else _load()
+
+
+def current():
+    """Return the current data generation."""
+    return _row()['generation']
+
+
+def updated_at():
+    """Return when the data last changed (None before the first bump)."""
+    return _row()['updated_at']
+
+
+def _write():
+    DataGeneration.objects.filter(pk=1).update(generation=F('generation') + 1, updated_at=timezone.now())
+    _load()  # write the new value through to the cache (and recreate a missing row)
+
+
+def _trailing_bump():
+    global _last_bump, _trailing
+    with _bump_lock:
+        _trailing = None
+        _last_bump = time.monotonic()
+    try:
+        _write()
+    except Exception as e:
+        logger.error(f"Generation bump failed: {e}")
+    finally:
+        connection.close()  # the timer thread's own connection
+
+
+def _bump():
+    global _last_bump, _trailing
+    with _bump_lock:
+        wait = _last_bump + BUMP_INTERVAL - time.monotonic()
+        if wait > 0:
+            # Bumped moments ago; one more at the end of the interval covers this write
+            if _trailing is None:
+                _trailing = threading.Timer(wait, _trailing_bump)
+                _trailing.daemon = True
+                _trailing.start()
+            return
+        _last_bump = time.monotonic()
+    _write()
+
+
+def bump():
+    """Advance the generation once the current transaction (if any) commits."""
+    transaction.on_commit(_bump)
+
+
+def etag(request, *args, **kwargs):
+    """ETag for ``django.views.decorators.http.condition`` on views that only show synced data."""
+    return f'W/"{current()}"'
+
+
+def cached(name, build):
+    """Return ``(payload, generation, built_at)`` for ``build()``, rebuilt when the generation moved on."""
+    key = CACHED_KEY.format(name)
+    generation = current()
+    entry = cache.get(key)
+    if entry is None or entry[0] != generation:
+        with _build_lock:
+            # Another request may have rebuilt it while this one waited
+            entry = cache.get(key)
+            if entry is None or entry[0] != generation:
+                # Stamped with the generation read before building, so a write
+                # landing mid-build makes the next request rebuild again
+                entry = (generation, timezone.now(), build())
+                cache.set(key, entry, None)
+    generation, built_at, payload = entry
+    return payload, generation, built_at
@@ -0,0 +1,128 @@
+"""Per-login live refresh of open positions.
+
+The get_open_positions view used to start a new never-ending sync thread on every
+request. The registry here keeps at most one refresh worker per login, lets it
+expire once nobody has asked for that login for a while, and hands the same
+fetch result to every concurrent requester.
+"""
+import logging
+import threading
+import time
+
+from django.db import close_old_connections, connections
+
+from .MT5Service import MT5Service
+from .models import Accounts
+from .reconcile import reconcile_open_positions
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = 60  # seconds between background refreshes of a watched login
+MAX_AGE = 5  # requests within this many seconds of the last fetch reuse its result
+IDLE_TTL = 300  # workers stop after this long without a request for their login
+WAIT_TIMEOUT = 30  # seconds a requester waits on a refresh already in flight
+
+
+def refresh_login(login_id):
+    """Fetch one login's positions from MT5 and reconcile them into OpenPositions."""
+    positions = MT5Service().get_open_positions(login_id)
+    account = Accounts.objects.get(login=login_id)
+    summary = reconcile_open_positions({account.login: positions}, accounts={account.login: account})
+    return {'positions': positions, 'stored_count': summary['stored'], 'deleted': summary['deleted']}
+
+
+class _Watch:
+    def __init__(self, login_id):
+        self.login_id = login_id
+        self.cond = threading.Condition()
+        self.refreshing = False
+        self.result = None
+        self.error = None
+        self.fetched_at = 0.0
+        self.last_requested = time.monotonic()
+        self.worker = None
+
+
+class LiveSyncRegistry:
+    """Keeps one refresh worker per watched login and shares results between requesters."""
+
+    def __init__(self, refresh=refresh_login, interval=REFRESH_INTERVAL, max_age=MAX_AGE, idle_ttl=IDLE_TTL):
+        self.refresh = refresh
+        self.interval = interval
+        self.max_age = max_age
+        self.idle_ttl = idle_ttl
+        self._watches = {}
+        self._lock = threading.Lock()
+        self.mt5_refreshes = 0
+
+    def get(self, login_id):
+        """Return fresh positions for login_id, starting its worker if needed."""
+        login_id = int(login_id)
+        with self._lock:
+            watch = self._watches.get(login_id)
+            if watch is None:
+                watch = self._watches[login_id] = _Watch(login_id)
+                watch.worker = threading.Thread(
+                    target=self._work, args=(watch,), name=f"live-sync-{login_id}", daemon=True
+                )
+                watch.worker.start()
+            watch.last_requested = time.monotonic()
+        return self._fetch(watch, self.max_age)
+
+    def _fetch(self, watch, max_age):
+        with watch.cond:
+            if watch.result is not None and time.monotonic() - watch.fetched_at < max_age:
+                return watch.result
+            if watch.refreshing:
+                # Someone else is already asking MT5; share their answer
+                watch.cond.wait_for(lambda: not watch.refreshing, timeout=WAIT_TIMEOUT)
+                if watch.error is not None:
+                    raise watch.error
+                if watch.result is None:
+                    raise TimeoutError(f"Timed out waiting for positions of login {watch.login_id}")
+                return watch.result
+            watch.refreshing = True
+
+        result, error = None, None
+        try:
+            self.mt5_refreshes += 1
+            result = self.refresh(watch.login_id)
+        except Exception as e:
+            error = e
+        with watch.cond:
+            watch.refreshing = False
+            watch.error = error
+            if error is None:
+                watch.result = result
+                watch.fetched_at = time.monotonic()
+            watch.cond.notify_all()
+        if error is not None:
+            raise error
+        return result
+
+    def _work(self, watch):
+        try:
+            while True:
+                time.sleep(self.interval)
+                with self._lock:
+                    if time.monotonic() - watch.last_requested > self.idle_ttl:
+                        self._watches.pop(watch.login_id, None)
+                        return
+                close_old_connections()
+                try:
+                    self._fetch(watch, self.interval / 2)
+                except Exception as e:
+                    logger.warning(f"Live sync for login {watch.login_id} failed: {e}")
+        finally:
+            connections.close_all()
+
+    def status(self):
+        with self._lock:
+            return {
+                'watched_logins': sorted(self._watches),
+                'workers': sum(1 for w in self._watches.values() if w.worker and w.worker.is_alive()),
+                'mt5_refreshes': self.mt5_refreshes,
+            }
+
+
+registry = LiveSyncRegistry()
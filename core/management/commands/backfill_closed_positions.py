@@ -0,0 +1,127 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+
+def _parse_date(value):
+    """Parse a date given in MT5 server time, labelled UTC like the stored deal times."""
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD[THH:MM]")
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill ClosedPositions from MT5 over a date range in (group, time window) chunks. "
+        "Finished chunks are checkpointed, so re-running the same job resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', required=True, help='Start date in MT5 server time, e.g. 2025-01-01')
+        parser.add_argument('--to', dest='date_to', help='End date (default: today 00:00 MT5 server time)')
+        parser.add_argument('--chunk-days', type=float, default=7, help='Days of history per MT5 request')
+        parser.add_argument('--groups', nargs='*', help='MT5 groups to load (default: enabled groups)')
+        parser.add_argument('--job', help='Checkpoint name (default: derived from --from and --chunk-days)')
+        parser.add_argument('--restart', action='store_true', help='Forget the checkpoints of this job first')
+        parser.add_argument('--method', choices=['copy', 'insert'], default='copy',
+                            help='Load with PostgreSQL COPY or multi-row INSERT ... ON CONFLICT')
+
+    def handle(self, *args, **options):
+        from core.models import Accounts, BackfillCheckpoint
+        from core.MT5Service import MT5Service
+        from core.reconcile import copy_closed_deals, store_closed_deals
+        from core.utils import to_mt5_time
+        from core.views import accounts_by_group, closed_sync_now
+
+        svc = MT5Service()
+        date_from = _parse_date(options['date_from'])
+        if options['date_to']:
+            date_to = _parse_date(options['date_to'])
+        else:
+            date_to = closed_sync_now(svc).replace(hour=0, minute=0, second=0, microsecond=0)
+        if date_to <= date_from:
+            raise CommandError("--to must be after --from")
+        step = timedelta(days=options['chunk_days'])
+        # Not named after --to, whose default moves daily: a run resumed the next day keeps
+        # its checkpoints and only loads what the earlier end left out
+        job = options['job'] or f"closed:{date_from:%Y-%m-%dT%H:%M}/{options['chunk_days']:g}d"
+        load = copy_closed_deals if options['method'] == 'copy' else store_closed_deals
+
+        if options['restart']:
+            deleted = BackfillCheckpoint.objects.filter(job=job).delete()[0]
+            self.stdout.write(f"Cleared {deleted} checkpoints of {job}")
+
+        groups = options['groups'] or svc.enabled_group_names()
+        accounts = Accounts.objects.filter(group__in=groups) if groups else Accounts.objects.all()
+        by_group = accounts_by_group(accounts)
+        if not by_group:
+            raise CommandError("No stored accounts in the selected groups; sync accounts first")
+
+        windows = []
+        start = date_from
+        while start < date_to:
+            windows.append((start, min(start + step, date_to)))
+            start += step
+        # A window cut short by an earlier --to is loaded again up to the new end
+        done = {
+            (group, start): end
+            for group, start, end in BackfillCheckpoint.objects.filter(job=job).values_list('group', 'window_start', 'window_end')
+        }
+        chunks = [
+            (group, start, end)
+            for group in sorted(by_group)
+            for start, end in windows
+            if done.get((group, start), start) < end
+        ]
+        total_chunks = len(by_group) * len(windows)
+        self.stdout.write(
+            f"{job}: {len(by_group)} groups x {len(windows)} windows, "
+            f"{total_chunks - len(chunks)} already done, {len(chunks)} to load"
+        )
+
+        started = time.perf_counter()
+        total_rows = 0
+        failed = 0
+        for index, (group, start, end) in enumerate(chunks, 1):
+            group_accounts = by_group[group]
+            t0 = time.perf_counter()
+            try:
+                deals_by_login = svc.get_closed_trades_by_group(
+                    [group], from_date=to_mt5_time(start), to_date=to_mt5_time(end),
+                    logins=list(group_accounts),
+                )
+                deals_by_login = {l: d for l, d in deals_by_login.items() if l in group_accounts}
+                missing = len(group_accounts) - len(deals_by_login)
+                if missing:
+                    raise Exception(f"{missing} accounts could not be fetched")
+                with transaction.atomic():
+                    summary = load(deals_by_login, accounts=group_accounts)
+                    elapsed = time.perf_counter() - t0
+                    BackfillCheckpoint.objects.update_or_create(
+                        job=job, group=group, window_start=start,
+                        defaults={'window_end': end, 'rows': summary['stored'], 'duration': round(elapsed, 3)},
+                    )
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(
+                    f"[{index}/{len(chunks)}] {group} {start:%Y-%m-%d}..{end:%Y-%m-%d}: failed: {e}"
+                ))
+                continue
+
+            total_rows += summary['stored']
+            overall = time.perf_counter() - started
+            self.stdout.write(
+                f"[{index}/{len(chunks)}] {group} {start:%Y-%m-%d}..{end:%Y-%m-%d}: "
+                f"{summary['stored']} rows in {elapsed:.1f}s ({summary['stored'] / max(elapsed, 1e-6):.0f} rows/s), "
+                f"total {total_rows} rows at {total_rows / max(overall, 1e-6):.0f} rows/s"
+            )
+
+        overall = time.perf_counter() - started
+        message = f"{job}: loaded {total_rows} rows in {overall:.1f}s ({total_rows / max(overall, 1e-6):.0f} rows/s)"
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{message}, {failed} chunks failed; re-run to resume"))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,99 @@
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = ("Benchmark MT5 sync paths against the offline MT5Manager simulator. With --db the "
+            "DB-writing syncs run against a throwaway test database, never the configured one.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--positions', type=int, default=2, help='Average open positions per account')
+        parser.add_argument('--deals', type=int, default=20, help='Average closing deals per account over 30 days')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every MT5 call')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Probability that an MT5 call fails')
+        parser.add_argument('--disable', nargs='*', default=[], help='MT5 methods to hide, e.g. DealRequestByGroup')
+        parser.add_argument('--window-hours', type=float, default=24, help='Closed-deal window to request')
+        parser.add_argument('--db', action='store_true',
+                            help='Also run the DB-writing sync functions, against a throwaway test database')
+        parser.add_argument('--keepdb', action='store_true', help='With --db, keep the test database between runs')
+
+    def handle(self, *args, **options):
+        if options['db']:
+            live_name = connection.settings_dict['NAME']
+            if connection.creation._get_test_db_name() == live_name:
+                raise CommandError(f"--db needs a throwaway database, but the test database is '{live_name}' itself")
+            # The benchmark triggers syncs itself; no scheduled job may write alongside it
+            from core.tasks import scheduler
+            scheduler.stop()
+
+        from core import mt5_simulator
+        mt5_simulator.configure(
+            accounts=options['accounts'], groups=options['groups'],
+            positions_per_account=options['positions'], deals_per_account=options['deals'],
+            latency=options['latency'], error_rate=options['error_rate'],
+            disabled_methods=options['disable'],
+        )
+        mt5_simulator.install()
+        from core.MT5Service import MT5Service
+
+        svc = MT5Service(host='simulator', port=443, login=1, password='simulator')
+        mgr = svc.connect()
+        # Reads go through the session pool, whose managers count their own calls
+        self.service_class = MT5Service
+        self.stdout.write(f"Simulated book: {options['accounts']} accounts in {options['groups']} groups")
+
+        logins = list(mt5_simulator.get_book().users)
+        to_date = datetime.now()
+        from_date = to_date - timedelta(hours=options['window_hours'])
+
+        self._run(mgr, 'list_accounts_by_groups', lambda: len(svc.list_accounts_by_groups()))
+        self._run(mgr, 'get_open_positions per login', lambda: sum(len(svc.get_open_positions(l)) for l in logins))
+        self._run(mgr, 'get_open_positions_by_group', lambda: sum(
+            len(v) for v in svc.get_open_positions_by_group('*', logins=logins).values()))
+        self._run(mgr, 'get_closed_trades per login', lambda: sum(
+            len(svc.get_closed_trades(l, from_date=from_date, to_date=to_date)) for l in logins))
+        self._run(mgr, 'get_closed_trades_by_group', lambda: sum(
+            len(v) for v in svc.get_closed_trades_by_group('*', from_date=from_date, to_date=to_date, logins=logins).values()))
+
+        if options['db']:
+            test_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+            self.stdout.write(f"Writing to throwaway database {test_name}")
+            try:
+                self._run_db(svc, mgr, logins)
+            finally:
+                connection.creation.destroy_test_db(live_name, verbosity=0, keepdb=options['keepdb'])
+
+    def _run_db(self, svc, mgr, logins):
+        from core import views
+        from core.reconcile import ingest_accounts, reconcile_open_positions, upsert_accounts
+        accounts = svc.list_accounts_by_groups()
+        self._run(mgr, 'upsert_accounts', lambda: upsert_accounts(accounts))
+        self._run(mgr, 'ingest_accounts', lambda: ingest_accounts(accounts)['stored'])
+        self._run(mgr, 'reconcile_open_positions', lambda: reconcile_open_positions(
+            {l: svc.get_open_positions(l) for l in logins})['stored'])
+        self._run(mgr, 'sync_closed_positions_for_all_accounts',
+                  lambda: views.sync_closed_positions_for_all_accounts()['totals'].get('stored', 0))
+        self._run(mgr, 'sync_open_positions_for_all_accounts',
+                  lambda: views.sync_open_positions_for_all_accounts()['totals'].get('stored', 0))
+
+    def _mt5_calls(self, mgr):
+        pool = self.service_class.pool_status()
+        return sum(mgr.calls.values()) + (pool['calls'] if pool else 0)
+
+    def _run(self, mgr, name, func):
+        calls_before = self._mt5_calls(mgr)
+        started = time.perf_counter()
+        try:
+            rows = func()
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"{name}: failed: {e}"))
+            return
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{name:<42} {elapsed:>9.3f}s  rows={rows:<9} mt5_calls={self._mt5_calls(mgr) - calls_before}"
+        )
@@ -0,0 +1,120 @@
+# Generated by Django 5.2 on 2026-10-18 09:12
+#
+# Accounts, ServerSetting, OpenPositions, ClosedPositions and MT5GroupConfig were
+# never captured in a migration, so deployed databases already have their tables.
+# Each table is only created where it is missing, so a plain `python manage.py migrate`
+# works on old and new databases alike; `migrate core --fake-initial` is not needed.
+# An existing table is taken as is: the later migrations (0003 onwards) bring it up
+# to date, which assumes it matches the models as they stood before them.
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class CreateModelIfMissing(migrations.CreateModel):
+    """CreateModel that leaves an already existing table alone."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.name)
+        if model._meta.db_table in schema_editor.connection.introspection.table_names():
+            return
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        CreateModelIfMissing(
+            name='Accounts',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('login', models.IntegerField(unique=True)),
+                ('name', models.CharField(blank=True, max_length=255, null=True)),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('group', models.CharField(blank=True, max_length=255, null=True)),
+                ('leverage', models.IntegerField(blank=True, null=True)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('equity', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('profit', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('margin', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('margin_free', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('margin_level', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('last_access', models.DateTimeField(blank=True, null=True)),
+                ('registration', models.DateTimeField(blank=True, null=True)),
+                ('last_closed_sync', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'Accounts',
+            },
+        ),
+        CreateModelIfMissing(
+            name='ServerSetting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('server_ip', models.CharField(max_length=100, verbose_name='Server IP Address with Port')),
+                ('real_account_login', models.CharField(max_length=100, verbose_name='Real Account Login ID')),
+                ('real_account_password', models.CharField(max_length=100, verbose_name='Real Account Password')),
+                ('server_name_client', models.CharField(max_length=100, verbose_name='Server Name for Live Accounts')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Server Setting',
+                'verbose_name_plural': 'Server Settings',
+            },
+        ),
+        CreateModelIfMissing(
+            name='MT5GroupConfig',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_name', models.CharField(max_length=100)),
+                ('is_enabled', models.BooleanField(default=True)),
+                ('last_sync', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        CreateModelIfMissing(
+            name='OpenPositions',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position_id', models.BigIntegerField(unique=True)),
+                ('symbol', models.CharField(max_length=50)),
+                ('volume', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('price', models.DecimalField(decimal_places=5, max_digits=15)),
+                ('profit', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('position_type', models.CharField(choices=[('Buy', 'Buy'), ('Sell', 'Sell')], max_length=10)),
+                ('date_created', models.DateTimeField()),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('login', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='open_positions', to='core.accounts')),
+            ],
+            options={
+                'db_table': 'OpenPositions',
+                'unique_together': {('login', 'position_id')},
+            },
+        ),
+        CreateModelIfMissing(
+            name='ClosedPositions',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.BigIntegerField(blank=True, null=True)),
+                ('deal_id', models.BigIntegerField()),
+                ('symbol', models.CharField(max_length=50)),
+                ('volume', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('price', models.CharField(max_length=20)),
+                ('profit', models.CharField(default='0', max_length=20)),
+                ('position_type', models.CharField(choices=[('Buy', 'Buy'), ('Sell', 'Sell')], max_length=10)),
+                ('date_closed', models.DateTimeField()),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('login', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closed_positions', to='core.accounts')),
+            ],
+            options={
+                'db_table': 'ClosedPositions',
+                'unique_together': {('login', 'position')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_untracked_models'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accounts',
+            name='account_fingerprint',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='accounts',
+            name='positions_fingerprint',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+    ]
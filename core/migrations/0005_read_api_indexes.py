@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_backfillcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accounts',
+            index=models.Index(fields=['group', 'login'], name='accounts_group_login_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='openpositions',
+            index=models.Index(fields=['symbol', 'position_id'], name='openpos_symbol_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='openpositions',
+            index=models.Index(fields=['date_created', 'id'], name='openpos_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='closedpositions',
+            index=models.Index(fields=['date_closed', 'id'], name='closedpos_closed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='closedpositions',
+            index=models.Index(fields=['login', 'date_closed'], name='closedpos_login_closed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='closedpositions',
+            index=models.Index(fields=['symbol', 'date_closed'], name='closedpos_symbol_closed_idx'),
+        ),
+    ]
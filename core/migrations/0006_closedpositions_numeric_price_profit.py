@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+# Rows written before this migration hold str(float) values. Anything the numeric
+# cast would reject (empty strings, 'None', ...) is reset to 0 first.
+NUMERIC = r'^\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$'
+CLEAN_TEXT_VALUES = f"""
+    UPDATE "ClosedPositions" SET price = '0' WHERE price IS NULL OR price !~ '{NUMERIC}';
+    UPDATE "ClosedPositions" SET profit = '0' WHERE profit IS NULL OR profit !~ '{NUMERIC}';
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_read_api_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CLEAN_TEXT_VALUES, reverse_sql=migrations.RunSQL.noop),
+        # PostgreSQL converts the existing values with USING "price"::numeric(15, 5)
+        migrations.AlterField(
+            model_name='closedpositions',
+            name='price',
+            field=models.DecimalField(decimal_places=5, max_digits=15),
+        ),
+        migrations.AlterField(
+            model_name='closedpositions',
+            name='profit',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 11:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+POPULATE = """
+    INSERT INTO "LoginSymbolTotals"
+        (login_id, symbol, open_count, open_lot, open_usd, closed_count, closed_lot, closed_usd, updated_at)
+    SELECT COALESCE(o.login_id, c.login_id), COALESCE(o.symbol, c.symbol),
+           COALESCE(o.n, 0), COALESCE(o.lot, 0), COALESCE(o.usd, 0),
+           COALESCE(c.n, 0), COALESCE(c.lot, 0), COALESCE(c.usd, 0), now()
+    FROM (SELECT login_id, symbol, COUNT(*) AS n, SUM(volume) AS lot, SUM(profit) AS usd
+          FROM "OpenPositions" GROUP BY login_id, symbol) o
+    FULL OUTER JOIN (SELECT login_id, symbol, COUNT(*) AS n, SUM(volume) AS lot, SUM(profit) AS usd
+                     FROM "ClosedPositions" GROUP BY login_id, symbol) c
+        ON o.login_id = c.login_id AND o.symbol = c.symbol;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_closedpositions_numeric_price_profit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoginSymbolTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=50)),
+                ('open_count', models.IntegerField(default=0)),
+                ('open_lot', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('open_usd', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('closed_count', models.IntegerField(default=0)),
+                ('closed_lot', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('closed_usd', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('updated_at', models.DateTimeField()),
+                ('login', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='symbol_totals', to='core.accounts')),
+            ],
+            options={
+                'db_table': 'LoginSymbolTotals',
+                'unique_together': {('login', 'symbol')},
+            },
+        ),
+        migrations.RunSQL(POPULATE, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 14:05
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_loginsymboltotals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PositionChange',
+            fields=[
+                ('version', models.BigAutoField(primary_key=True, serialize=False)),
+                ('login', models.IntegerField()),
+                ('position_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete')], max_length=10)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'PositionChanges',
+                'indexes': [models.Index(fields=['created_at'], name='poschange_created_idx')],
+            },
+        ),
+    ]
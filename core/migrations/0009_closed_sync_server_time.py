@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 16:20
+
+from django.db import migrations
+
+# Watermarks used to come from the host clock; restart them from the newest stored
+# deal, which is in MT5 server time. Accounts without deals get the initial window.
+RESET_WATERMARKS = """
+    UPDATE "Accounts" AS a
+    SET last_closed_sync = (SELECT MAX(c.date_closed) FROM "ClosedPositions" c WHERE c.login_id = a.id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_positionchange'),
+    ]
+
+    operations = [
+        migrations.RunSQL(RESET_WATERMARKS, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 17:05
+
+import time
+
+from django.db import migrations, models
+
+
+def create_row(apps, schema_editor):
+    # Start from the clock so no generation handed out by the old cache counter comes back
+    DataGeneration = apps.get_model('core', 'DataGeneration')
+    DataGeneration.objects.get_or_create(pk=1, defaults={'generation': time.time_ns() // 1_000_000})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_closed_sync_server_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation', models.BigIntegerField()),
+                ('updated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'DataGeneration',
+            },
+        ),
+        migrations.RunPython(create_row, migrations.RunPython.noop),
+    ]
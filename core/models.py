@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models, connection
 
 class Groups(models.Model):
@@ -22,12 +23,18 @@ class Accounts(models.Model):
     margin_level = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     last_access = models.DateTimeField(blank=True, null=True)
     registration = models.DateTimeField(blank=True, null=True)
-    last_closed_sync = models.DateTimeField(null=True, blank=True)  # last stored closed position
+    last_closed_sync = models.DateTimeField(null=True, blank=True)  # MT5 server time closed deals are stored up to
+    # Hashes of the last synced MT5 state, see core/reconcile.py; NULL forces a full diff
+    account_fingerprint = models.CharField(max_length=32, null=True, blank=True)
+    positions_fingerprint = models.CharField(max_length=32, null=True, blank=True)
 
  
     class Meta:
         db_table = 'Accounts'
         app_label = 'core'
+        indexes = [
+            models.Index(fields=['group', 'login'], name='accounts_group_login_idx'),
+        ]
  
 class ServerSetting(models.Model):
     server_ip = models.CharField(max_length=100, verbose_name='Server IP Address with Port')
@@ -59,6 +66,10 @@ class OpenPositions(models.Model):
         db_table = 'OpenPositions'
         app_label = 'core'
         unique_together = ('login', 'position_id')
+        indexes = [
+            models.Index(fields=['symbol', 'position_id'], name='openpos_symbol_idx'),
+            models.Index(fields=['date_created', 'id'], name='openpos_created_idx'),
+        ]
 
     def __str__(self):
         return f"Position {self.position_id} for {self.login.login}"
@@ -102,8 +113,8 @@ class ClosedPositions(models.Model):
     deal_id = models.BigIntegerField()   # optional, no uniqueness constraint
     symbol = models.CharField(max_length=50)
     volume = models.DecimalField(max_digits=20, decimal_places=2)
-    price = models.CharField(max_length=20)
-    profit = models.CharField(max_length=20, default='0')
+    price = models.DecimalField(max_digits=15, decimal_places=5)
+    profit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     position_type = models.CharField(max_length=10, choices=[('Buy', 'Buy'), ('Sell', 'Sell')])
     date_closed = models.DateTimeField()
     last_updated = models.DateTimeField(auto_now=True)
@@ -112,9 +123,68 @@ class ClosedPositions(models.Model):
         db_table = 'ClosedPositions'
         app_label = 'core'
         unique_together = ('login', 'position')  # <-- unique per account
+        indexes = [
+            models.Index(fields=['date_closed', 'id'], name='closedpos_closed_idx'),
+            models.Index(fields=['login', 'date_closed'], name='closedpos_login_closed_idx'),
+            models.Index(fields=['symbol', 'date_closed'], name='closedpos_symbol_closed_idx'),
+        ]
 
 from django.db import models
 
+class LoginSymbolTotals(models.Model):
+    """Open and closed lot / P&L totals per login and symbol, kept up to date by the sync writers."""
+    login = models.ForeignKey(Accounts, on_delete=models.CASCADE, related_name='symbol_totals')
+    symbol = models.CharField(max_length=50)
+    open_count = models.IntegerField(default=0)
+    open_lot = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    open_usd = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    closed_count = models.IntegerField(default=0)
+    closed_lot = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    closed_usd = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'LoginSymbolTotals'
+        app_label = 'core'
+        unique_together = ('login', 'symbol')
+
+    def __str__(self):
+        return f"{self.symbol} totals for {self.login_id}"
+
+
+
+class PositionChange(models.Model):
+    """Upsert/delete log of OpenPositions; ``version`` orders the changes of all accounts."""
+    version = models.BigAutoField(primary_key=True)
+    login = models.IntegerField()
+    position_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=[('upsert', 'Upsert'), ('delete', 'Delete')])
+    data = models.JSONField(null=True, encoder=DjangoJSONEncoder)  # position fields of an upsert
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'PositionChanges'
+        app_label = 'core'
+        indexes = [
+            models.Index(fields=['created_at'], name='poschange_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.action} of position {self.position_id} at version {self.version}"
+
+class DataGeneration(models.Model):
+    """The single row holding the data generation that every process reads and bumps (see core.generation)."""
+    generation = models.BigIntegerField()
+    updated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'DataGeneration'
+        app_label = 'core'
+
+    def __str__(self):
+        return f"Data generation {self.generation}"
+
+
 class MT5GroupConfig(models.Model):
     group_name = models.CharField(max_length=100)
     is_enabled = models.BooleanField(default=True)
@@ -122,3 +192,22 @@ class MT5GroupConfig(models.Model):
 
     def __str__(self):
         return self.group_name
+
+
+class BackfillCheckpoint(models.Model):
+    """A (group, time window) chunk of a closed-position backfill that finished loading."""
+    job = models.CharField(max_length=100)
+    group = models.CharField(max_length=255)
+    window_start = models.DateTimeField()
+    window_end = models.DateTimeField()
+    rows = models.IntegerField(default=0)
+    duration = models.FloatField(default=0)  # seconds
+    completed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'BackfillCheckpoint'
+        app_label = 'core'
+        unique_together = ('job', 'group', 'window_start')
+
+    def __str__(self):
+        return f"{self.job}: {self.group} {self.window_start:%Y-%m-%d}"
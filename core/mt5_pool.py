@@ -0,0 +1,222 @@
+"""Pool of MT5 manager sessions.
+
+A single manager connection serializes every request made through it, so one slow
+DealRequest holds up every API read and background sync behind it. The pool keeps
+up to ``size`` connected sessions; callers check one out for the duration of a
+unit of work and check it back in afterwards. Sessions that fail a health check
+are dropped and replaced by a fresh connection on the next checkout.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 4
+CHECKOUT_TIMEOUT = 60  # seconds to wait for a free session before giving up
+HEALTH_CHECK_INTERVAL = 30  # probe sessions idle for longer than this on checkout
+
+
+class _CountingManager:
+    """Forwards attribute access to a manager and counts the calls made per method."""
+
+    def __init__(self, manager, session):
+        self._manager = manager
+        self._session = session
+
+    def __getattr__(self, name):
+        attr = getattr(self._manager, name)
+        if not callable(attr):
+            return attr
+        session = self._session
+
+        def call(*args, **kwargs):
+            session.calls[name] += 1
+            return attr(*args, **kwargs)
+        return call
+
+
+class ManagerSession:
+    """One connected manager plus its usage counters."""
+
+    def __init__(self, index, manager):
+        self.index = index
+        self.manager = manager
+        self.proxy = _CountingManager(manager, self)
+        self.calls = Counter()
+        self.checkouts = 0
+        self.errors = 0
+        self.busy_s = 0.0
+        self.created = time.time()
+        self.last_checked = time.monotonic()
+        self.checked_out_at = None
+
+    def status(self):
+        return {
+            'index': self.index,
+            'in_use': self.checked_out_at is not None,
+            'checkouts': self.checkouts,
+            'calls': sum(self.calls.values()),
+            'errors': self.errors,
+            'busy_s': round(self.busy_s, 3),
+            'created': self.created,
+            'by_method': dict(self.calls),
+        }
+
+
+class ManagerPool:
+    """Up to ``size`` manager sessions opened lazily with ``factory()``."""
+
+    def __init__(self, factory, size=DEFAULT_POOL_SIZE, health_check_interval=HEALTH_CHECK_INTERVAL):
+        self.factory = factory
+        self.size = max(1, int(size))
+        self.health_check_interval = health_check_interval
+        self._idle = queue.LifoQueue()  # reuse the most recently used session first
+        self._sessions = {}
+        self._slots = 0  # open sessions plus sessions being connected
+        self._next_index = 0
+        self._lock = threading.Lock()
+        self.closed = False
+        self.waits = 0
+        self.replaced = 0
+
+    @contextmanager
+    def session(self, timeout=CHECKOUT_TIMEOUT):
+        """Check out a session for the duration of the block: ``with pool.session() as mgr:``."""
+        session = self.checkout(timeout)
+        broken = False
+        try:
+            yield session.proxy
+        except Exception:
+            session.errors += 1
+            broken = not self._healthy(session, force=True)
+            raise
+        finally:
+            self.checkin(session, broken)
+
+    def checkout(self, timeout=CHECKOUT_TIMEOUT):
+        if self.closed:
+            raise RuntimeError("MT5 session pool is closed")
+        deadline = time.monotonic() + timeout
+        waited = False
+        while True:
+            session = self._take_idle() or self._grow()
+            if session is not None:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"No MT5 session free after {timeout}s ({self.size} in use)")
+            if not waited:
+                waited = True
+                self.waits += 1
+            try:
+                # Wake up periodically: a broken session frees its slot without returning to the queue
+                session = self._idle.get(timeout=min(remaining, 1.0))
+                break
+            except queue.Empty:
+                continue
+
+        if not self._healthy(session):
+            session = self._replace(session)
+        session.checkouts += 1
+        session.checked_out_at = time.monotonic()
+        return session
+
+    def checkin(self, session, broken=False):
+        if session.checked_out_at is not None:
+            session.busy_s += time.monotonic() - session.checked_out_at
+            session.checked_out_at = None
+        if broken or self.closed:
+            self._discard(session)
+        else:
+            self._idle.put(session)
+
+    def close(self):
+        """Drop every idle session; sessions still checked out are dropped on checkin."""
+        self.closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def _take_idle(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _grow(self):
+        with self._lock:
+            if self._slots >= self.size:
+                return None
+            self._slots += 1
+            index = self._next_index
+            self._next_index += 1
+        return self._open(index)
+
+    def _open(self, index):
+        # Connecting can take a while, so it happens outside the lock with the slot reserved
+        try:
+            session = ManagerSession(index, self.factory())
+        except Exception:
+            with self._lock:
+                self._slots -= 1
+            raise
+        with self._lock:
+            self._sessions[index] = session
+        logger.info(f"Opened MT5 session {index} ({self._slots}/{self.size})")
+        return session
+
+    def _replace(self, session):
+        logger.warning(f"MT5 session {session.index} failed its health check, reconnecting")
+        self.replaced += 1
+        self._discard(session)
+        with self._lock:
+            self._slots += 1
+            index = self._next_index
+            self._next_index += 1
+        return self._open(index)
+
+    def _discard(self, session):
+        with self._lock:
+            if self._sessions.pop(session.index, None) is None:
+                return
+            self._slots -= 1
+        try:
+            disconnect = getattr(session.manager, 'Disconnect', None)
+            if disconnect is not None:
+                disconnect()
+            session.manager.connected = False
+        except Exception:
+            pass
+
+    def _healthy(self, session, force=False):
+        if not getattr(session.manager, 'connected', False):
+            return False
+        if not force and time.monotonic() - session.last_checked < self.health_check_interval:
+            return True
+        session.last_checked = time.monotonic()
+        probe = getattr(session.manager, 'TimeServer', None)
+        if probe is None:
+            return True
+        try:
+            return bool(probe())
+        except Exception:
+            return False
+
+    def status(self):
+        with self._lock:
+            sessions = [s.status() for s in self._sessions.values()]
+        return {
+            'size': self.size,
+            'open': len(sessions),
+            'idle': self._idle.qsize(),
+            'waits': self.waits,
+            'replaced': self.replaced,
+            'calls': sum(s['calls'] for s in sessions),
+            'sessions': sessions,
+        }
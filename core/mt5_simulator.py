@@ -0,0 +1,459 @@
+"""Pure-Python stand-in for the MT5Manager library.
+
+Covers the part of the MT5Manager surface that MT5Service and the pump sink use
+(ManagerAPI, Connect, UserGet, UserAccountGet, UserGetByGroup, GroupTotal,
+GroupNext, PositionGet, DealRequest, DealRequestByGroup, DealTotal, DealNext and
+the *Subscribe callbacks) on top of a synthetic book of configurable size, so
+sync paths can be exercised and benchmarked without a trade server.
+
+Use it either by setting the ``MT5_SIMULATOR`` environment variable before
+MT5Service is imported, or by calling ``install()``::
+
+    from core import mt5_simulator
+    mt5_simulator.configure(accounts=50000, latency=0.002, error_rate=0.01)
+    mt5_simulator.install()
+"""
+import fnmatch
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+SYMBOLS = ['XAUUSD', 'EURUSD', 'GBPUSD', 'USDJPY', 'BTCUSD', 'US30', 'NAS100', 'XAGUSD', 'AUDUSD', 'USDCAD']
+BASE_PRICES = {
+    'XAUUSD': 2350.0, 'EURUSD': 1.085, 'GBPUSD': 1.27, 'USDJPY': 151.0, 'BTCUSD': 65000.0,
+    'US30': 39000.0, 'NAS100': 18000.0, 'XAGUSD': 28.0, 'AUDUSD': 0.66, 'USDCAD': 1.36,
+}
+FIRST_LOGIN = 100000
+HISTORY_DAYS = 30
+
+MT_RET_OK = 0
+MT_RET_ERR_NETWORK = 7
+MT_RET_ERR_NOTFOUND = 13
+
+_last_error = (MT_RET_OK, 'MT_RET_OK', 'Done')
+
+
+def LastError():
+    return _last_error
+
+
+def _set_error(code, name, message):
+    global _last_error
+    _last_error = (code, name, message)
+
+
+def InitializeManagerAPIPath(module_path=None, work_path=None):
+    return True
+
+
+class MTUser:
+    __slots__ = ('Login', 'Group', 'Name', 'FirstName', 'LastName', 'EMail', 'Leverage',
+                 'Rights', 'Registration', 'LastAccess', 'Balance')
+
+    def __init__(self, **kwargs):
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+
+class MTAccount:
+    __slots__ = ('Login', 'Balance', 'Equity', 'Profit', 'Margin', 'MarginFree', 'MarginLevel')
+
+    def __init__(self, **kwargs):
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+
+class MTGroup:
+    __slots__ = ('Group',)
+
+    def __init__(self, group):
+        self.Group = group
+
+
+class MTPosition:
+    __slots__ = ('Login', 'Position', 'Symbol', 'Action', 'Volume', 'PriceOpen', 'PriceCurrent',
+                 'Profit', 'TimeCreate')
+
+    def __init__(self, **kwargs):
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+
+class MTDeal:
+    __slots__ = ('Deal', 'Login', 'PositionID', 'Symbol', 'Action', 'Entry', 'Volume', 'VolumeClosed',
+                 'Price', 'Profit', 'Time')
+
+    def __init__(self, **kwargs):
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+
+def _match_group(group, mask):
+    """MT5-style mask match: comma-separated patterns, '*' wildcard, '!' excludes."""
+    matched = False
+    for pattern in str(mask).split(','):
+        pattern = pattern.strip()
+        if not pattern:
+            continue
+        if pattern.startswith('!'):
+            if fnmatch.fnmatchcase(group, pattern[1:]):
+                return False
+        elif fnmatch.fnmatchcase(group, pattern):
+            matched = True
+    return matched
+
+
+class SimulatedBook:
+    """Synthetic trade server state shared by every ManagerAPI connection."""
+
+    def __init__(self, accounts=1000, groups=10, positions_per_account=2, deals_per_account=20,
+                 seed=42, latency=0.0, error_rate=0.0, disabled_methods=()):
+        self.seed = seed
+        self.latency = latency
+        self.error_rate = error_rate
+        self.disabled_methods = set(disabled_methods)
+        self.deals_per_account = deals_per_account
+        self.lock = threading.RLock()
+        self.now = int(time.time())
+        rng = random.Random(seed)
+
+        self.groups = [f"real\\group{i:03d}" for i in range(groups)]
+        self.users = {}
+        self.accounts = {}
+        self.positions = {}  # login -> {position id: MTPosition}
+        self.closed_deals = {}  # login -> deals closed while the simulator runs
+        self.next_position = 10_000_000
+        self.next_deal = 50_000_000
+
+        for n in range(accounts):
+            login = FIRST_LOGIN + n
+            group = self.groups[n % len(self.groups)]
+            balance = round(rng.uniform(100, 50000), 2)
+            self.users[login] = MTUser(
+                Login=login, Group=group, Name=f"Client {login}", FirstName='Client', LastName=str(login),
+                EMail=f"client{login}@example.com", Leverage=rng.choice([50, 100, 200, 500]), Rights=0,
+                Registration=self.now - rng.randint(86400, 86400 * 720), LastAccess=self.now - rng.randint(0, 86400 * 7),
+                Balance=balance,
+            )
+            book = {}
+            for _ in range(rng.randint(0, positions_per_account * 2)):
+                position = self._new_position(rng, login)
+                book[position.Position] = position
+            self.positions[login] = book
+            self.accounts[login] = MTAccount(Login=login, Balance=balance, Equity=balance, Profit=0.0,
+                                             Margin=0.0, MarginFree=balance, MarginLevel=0.0)
+            self._refresh_account(login)
+
+    def _new_position(self, rng, login):
+        symbol = rng.choice(SYMBOLS)
+        price = BASE_PRICES[symbol] * rng.uniform(0.98, 1.02)
+        self.next_position += 1
+        return MTPosition(
+            Login=login, Position=self.next_position, Symbol=symbol, Action=rng.randint(0, 1),
+            Volume=rng.choice([100, 500, 1000, 5000, 10000, 50000]), PriceOpen=round(price, 5),
+            PriceCurrent=round(price, 5), Profit=round(rng.uniform(-500, 500), 2),
+            TimeCreate=self.now - rng.randint(60, 86400 * 10),
+        )
+
+    def _refresh_account(self, login):
+        acc = self.accounts[login]
+        profit = round(sum(p.Profit for p in self.positions[login].values()), 2)
+        margin = round(sum(p.Volume for p in self.positions[login].values()) / 100, 2)
+        acc.Profit = profit
+        acc.Equity = round(acc.Balance + profit, 2)
+        acc.Margin = margin
+        acc.MarginFree = round(acc.Equity - margin, 2)
+        acc.MarginLevel = round(acc.Equity / margin * 100, 2) if margin else 0.0
+
+    def history(self, login, start=None, end=None):
+        """Deterministic closing-deal history for a login plus deals closed at runtime.
+
+        Values are derived arithmetically from (seed, login, index) rather than with a
+        per-login RNG so that group-wide requests over 100k accounts stay cheap.
+        """
+        deals = []
+        span = 86400 * HISTORY_DAYS
+        count = (login * 7919 + self.seed) % (self.deals_per_account * 2 + 1)
+        for i in range(count):
+            h = (login * 2654435761 + i * 40503 + self.seed * 97) & 0xFFFFFFFF
+            deal_time = self.now - 60 - h % span
+            if (start is not None and deal_time < start) or (end is not None and deal_time > end):
+                continue
+            symbol = SYMBOLS[(h >> 7) % len(SYMBOLS)]
+            volume = (100, 500, 1000, 5000, 10000)[(h >> 11) % 5]
+            deals.append(MTDeal(
+                Deal=login * 1000 + i, Login=login, PositionID=login * 1000 + i, Symbol=symbol,
+                Action=(h >> 3) & 1, Entry=1, Volume=volume, VolumeClosed=volume,
+                Price=round(BASE_PRICES[symbol] * (0.95 + ((h >> 13) % 1000) / 10000), 5),
+                Profit=round(((h >> 17) % 200000) / 100 - 1000, 2),
+                Time=deal_time,
+            ))
+        for deal in self.closed_deals.get(login, []):
+            if (start is None or deal.Time >= start) and (end is None or deal.Time <= end):
+                deals.append(deal)
+        return deals
+
+
+_book = None
+_book_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """Replace the simulated book; see SimulatedBook for the accepted options."""
+    global _book
+    with _book_lock:
+        _book = SimulatedBook(**kwargs)
+    return _book
+
+
+def get_book():
+    global _book
+    with _book_lock:
+        if _book is None:
+            _book = SimulatedBook()
+        return _book
+
+
+def _ts(value):
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+
+class ManagerAPI:
+    """Simulated manager connection; every public call is counted and can be delayed or failed."""
+
+    class EnPumpModes:
+        PUMP_MODE_USERS = 1
+        PUMP_MODE_FULL = 0xFFFFFFFF
+
+    def __init__(self, book=None):
+        self.book = book or get_book()
+        self.calls = Counter()
+        self.connected = False
+        self._sinks = {'position': [], 'deal': [], 'user': []}
+
+    def __getattribute__(self, name):
+        if name[:1].isupper() and name in object.__getattribute__(self, 'book').disabled_methods:
+            raise AttributeError(name)
+        return object.__getattribute__(self, name)
+
+    def _call(self, name):
+        """Account for a call and apply injected latency/errors. Returns False on failure."""
+        self.calls[name] += 1
+        book = self.book
+        if book.latency:
+            time.sleep(book.latency)
+        if book.error_rate and random.random() < book.error_rate:
+            _set_error(MT_RET_ERR_NETWORK, 'MT_RET_ERR_NETWORK', 'Network error')
+            return False
+        _set_error(MT_RET_OK, 'MT_RET_OK', 'Done')
+        return True
+
+    def Connect(self, address, login, password, pump_mode=None, timeout=None):
+        if not self._call('Connect'):
+            return False
+        self.connected = True
+        return True
+
+    def Disconnect(self):
+        self.connected = False
+        return True
+
+    def TimeServer(self):
+        if not self._call('TimeServer') or not self.connected:
+            return 0
+        return int(time.time())
+
+    # ----- users and accounts -----
+
+    def UserTotal(self):
+        self._call('UserTotal')
+        return len(self.book.users)
+
+    def UserGet(self, login):
+        if not self._call('UserGet'):
+            return False
+        user = self.book.users.get(int(login))
+        if user is None:
+            _set_error(MT_RET_ERR_NOTFOUND, 'MT_RET_ERR_NOTFOUND', 'Not found')
+            return False
+        return user
+
+    def UserAccountGet(self, login):
+        if not self._call('UserAccountGet'):
+            return False
+        return self.book.accounts.get(int(login)) or False
+
+    def UserGetByGroup(self, group):
+        if not self._call('UserGetByGroup'):
+            return False
+        return [u for u in self.book.users.values() if _match_group(u.Group, group)]
+
+    def UserAccountGetByGroup(self, group):
+        if not self._call('UserAccountGetByGroup'):
+            return False
+        return [self.book.accounts[login] for login, u in self.book.users.items()
+                if _match_group(u.Group, group) and login in self.book.accounts]
+
+    # ----- groups -----
+
+    def GroupTotal(self):
+        self._call('GroupTotal')
+        return len(self.book.groups)
+
+    def GroupNext(self, index):
+        if not self._call('GroupNext'):
+            return False
+        if 0 <= index < len(self.book.groups):
+            return MTGroup(self.book.groups[index])
+        return False
+
+    # ----- positions -----
+
+    def PositionGet(self, login=None, ticket=None):
+        if not self._call('PositionGet'):
+            return False
+        with self.book.lock:
+            if ticket is not None:
+                for book in self.book.positions.values():
+                    if int(ticket) in book:
+                        return [book[int(ticket)]]
+                return []
+            return list(self.book.positions.get(int(login), {}).values())
+
+    def PositionGetByGroup(self, group):
+        if not self._call('PositionGetByGroup'):
+            return False
+        out = []
+        with self.book.lock:
+            for login, user in self.book.users.items():
+                if _match_group(user.Group, group):
+                    out.extend(self.book.positions.get(login, {}).values())
+        return out
+
+    # ----- deals -----
+
+    def DealRequest(self, login, from_date, to_date):
+        if not self._call('DealRequest'):
+            return False
+        start, end = _ts(from_date), _ts(to_date)
+        with self.book.lock:
+            return self.book.history(int(login), start, end)
+
+    def DealRequestByGroup(self, group, from_date, to_date):
+        if not self._call('DealRequestByGroup'):
+            return False
+        start, end = _ts(from_date), _ts(to_date)
+        out = []
+        with self.book.lock:
+            for login, user in self.book.users.items():
+                if _match_group(user.Group, group):
+                    out.extend(self.book.history(login, start, end))
+        return out
+
+    def DealTotal(self):
+        self._call('DealTotal')
+        return sum(len(v) for v in self.book.closed_deals.values())
+
+    def DealNext(self, index):
+        if not self._call('DealNext'):
+            return False
+        deals = [d for v in self.book.closed_deals.values() for d in v]
+        return deals[index] if 0 <= index < len(deals) else False
+
+    # ----- pump subscriptions -----
+
+    def PositionSubscribe(self, sink):
+        self._sinks['position'].append(sink)
+        return True
+
+    def PositionUnsubscribe(self, sink):
+        if sink in self._sinks['position']:
+            self._sinks['position'].remove(sink)
+        return True
+
+    def DealSubscribe(self, sink):
+        self._sinks['deal'].append(sink)
+        return True
+
+    def DealUnsubscribe(self, sink):
+        if sink in self._sinks['deal']:
+            self._sinks['deal'].remove(sink)
+        return True
+
+    def UserSubscribe(self, sink):
+        self._sinks['user'].append(sink)
+        return True
+
+    def UserUnsubscribe(self, sink):
+        if sink in self._sinks['user']:
+            self._sinks['user'].remove(sink)
+        return True
+
+    def _notify(self, kind, method, obj):
+        for sink in list(self._sinks[kind]):
+            callback = getattr(sink, method, None)
+            if callback is not None:
+                callback(obj)
+
+    def tick(self, price_moves=None, opens=0, closes=0, seed=None):
+        """Advance the simulated market and fire pump callbacks.
+
+        Moves the profit of ``price_moves`` random positions (all by default), opens
+        ``opens`` new positions and closes ``closes`` existing ones, producing the
+        matching position and deal events. Returns the number of events fired.
+        """
+        book = self.book
+        rng = random.Random(seed)
+        fired = 0
+        touched = set()
+        with book.lock:
+            logins = list(book.positions)
+            open_positions = [p for b in book.positions.values() for p in b.values()]
+            moved = open_positions if price_moves is None else rng.sample(open_positions, min(price_moves, len(open_positions)))
+            for position in moved:
+                position.Profit = round(position.Profit + rng.uniform(-25, 25), 2)
+                touched.add(position.Login)
+                self._notify('position', 'OnPositionUpdate', position)
+                fired += 1
+            for _ in range(opens):
+                login = rng.choice(logins)
+                position = book._new_position(rng, login)
+                book.positions[login][position.Position] = position
+                touched.add(login)
+                self._notify('position', 'OnPositionAdd', position)
+                fired += 1
+            for position in rng.sample(open_positions, min(closes, len(open_positions))):
+                book.positions[position.Login].pop(position.Position, None)
+                book.next_deal += 1
+                deal = MTDeal(
+                    Deal=book.next_deal, Login=position.Login, PositionID=position.Position, Symbol=position.Symbol,
+                    Action=1 - position.Action, Entry=1, Volume=position.Volume, VolumeClosed=position.Volume,
+                    Price=position.PriceCurrent, Profit=position.Profit, Time=int(time.time()),
+                )
+                book.closed_deals.setdefault(position.Login, []).append(deal)
+                book.users[position.Login].Balance = round(book.users[position.Login].Balance + position.Profit, 2)
+                book.accounts[position.Login].Balance = book.users[position.Login].Balance
+                touched.add(position.Login)
+                self._notify('position', 'OnPositionDelete', position)
+                self._notify('deal', 'OnDealAdd', deal)
+                self._notify('user', 'OnUserUpdate', book.users[position.Login])
+                fired += 3
+            for login in touched:
+                book._refresh_account(login)
+        return fired
+
+
+def install():
+    """Register this module as ``MT5Manager`` and swap it into an already imported MT5Service."""
+    module = sys.modules[__name__]
+    sys.modules['MT5Manager'] = module
+    service = sys.modules.get('core.MT5Service')
+    if service is not None:
+        service.MT5Manager = module
+        service.MT5Service.reset_shared_manager()
+    return module
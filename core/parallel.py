@@ -0,0 +1,133 @@
+"""Bounded worker pool for fanning account syncs out over threads.
+
+Each work item is split into a fetch step (MT5 calls, limited by a semaphore so the
+trade server never sees more than ``mt5_concurrency`` requests at once) and a store
+step (DB writes). Workers reuse one DB connection each and close it when the run
+ends. Progress and the final summary of every run are kept by label so they can
+be read while the run is still going.
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_MT5_CONCURRENCY = 4
+PROGRESS_EVERY = 500  # log progress every N items
+
+_runs = {}
+_runs_lock = threading.Lock()
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 2)
+
+
+def is_running(label):
+    with _runs_lock:
+        run = _runs.get(label)
+        return bool(run and run['finished'] is None)
+
+
+def run_summaries():
+    """Return the latest summary (finished or in progress) of every labelled run."""
+    with _runs_lock:
+        return {label: dict(run) for label, run in _runs.items()}
+
+
+def run_pool(label, items, fetch, store, workers=None, mt5_concurrency=None, key=str):
+    """Run ``store(item, fetch(item))`` for every item on a bounded pool of threads.
+
+    ``fetch`` runs while holding an MT5 slot; ``store`` runs without one. ``store``
+    may return a dict of counts, which are summed into ``summary['totals']``. An
+    exception in either step marks the item as failed without stopping the run.
+    """
+    workers = workers or getattr(settings, 'SYNC_WORKERS', DEFAULT_WORKERS)
+    mt5_concurrency = mt5_concurrency or getattr(settings, 'SYNC_MT5_CONCURRENCY', DEFAULT_MT5_CONCURRENCY)
+    items = list(items)
+    started = time.perf_counter()
+    summary = {
+        'label': label,
+        'started': time.time(),
+        'finished': None,
+        'workers': workers,
+        'mt5_concurrency': mt5_concurrency,
+        'total': len(items),
+        'done': 0,
+        'failed': [],
+        'totals': {},
+        'elapsed_s': None,
+        'latency_ms': None,
+    }
+    with _runs_lock:
+        _runs[label] = summary
+
+    work = queue.Queue()
+    for item in items:
+        work.put(item)
+    mt5_slots = threading.BoundedSemaphore(mt5_concurrency)
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        close_old_connections()
+        try:
+            while True:
+                try:
+                    item = work.get_nowait()
+                except queue.Empty:
+                    return
+                t0 = time.perf_counter()
+                error, result = None, None
+                try:
+                    with mt5_slots:
+                        fetched = fetch(item)
+                    result = store(item, fetched)
+                except Exception as e:
+                    error = e
+                elapsed = (time.perf_counter() - t0) * 1000
+                with lock:
+                    latencies.append(elapsed)
+                    summary['done'] += 1
+                    if error is not None:
+                        summary['failed'].append({'item': key(item), 'error': str(error)})
+                    elif isinstance(result, dict):
+                        for k, v in result.items():
+                            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                                summary['totals'][k] = summary['totals'].get(k, 0) + v
+                    if summary['done'] % PROGRESS_EVERY == 0:
+                        logger.info(f"{label}: {summary['done']}/{summary['total']} done")
+        finally:
+            connections.close_all()
+
+    threads = [
+        threading.Thread(target=worker, name=f"{label}-{i}", daemon=True)
+        for i in range(min(workers, len(items)) or 0)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    summary['latency_ms'] = {
+        'p50': _percentile(latencies, 50),
+        'p90': _percentile(latencies, 90),
+        'p99': _percentile(latencies, 99),
+        'max': round(latencies[-1], 2) if latencies else None,
+    }
+    summary['elapsed_s'] = round(time.perf_counter() - started, 3)
+    summary['finished'] = time.time()
+    logger.info(
+        f"{label}: {summary['done']} items in {summary['elapsed_s']}s, "
+        f"{len(summary['failed'])} failed, p50={summary['latency_ms']['p50']}ms"
+    )
+    return summary
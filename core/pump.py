@@ -0,0 +1,191 @@
+"""Event-driven ingestion of MT5 pump callbacks.
+
+MT5Service connects with PUMP_MODE_FULL, so the manager already receives every
+position, deal and user change from the trade server. ``PumpSink`` subscribes
+to those callbacks, queues the changes and a background thread writes them to
+OpenPositions, ClosedPositions and Accounts in micro-batches.
+
+The sink only relies on the ``PositionSubscribe``/``DealSubscribe``/``UserSubscribe``
+methods of the manager object it is given, so any stand-in MT5Manager module
+exposing them can drive it offline.
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.db import close_old_connections
+
+from .MT5Service import MT5Service, position_to_dict, _is_closing_deal
+from .reconcile import apply_position_changes, store_closed_deals, upsert_accounts
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 0.25  # seconds between micro-batches
+MAX_BATCH = 5000  # events drained per micro-batch
+
+
+def user_to_dict(user):
+    """Convert an MT5 user object into Accounts field values."""
+    return {
+        'login': getattr(user, 'Login', None),
+        'name': getattr(user, 'Name', None) or f"{getattr(user, 'FirstName', '')} {getattr(user, 'LastName', '')}".strip(),
+        'email': getattr(user, 'EMail', None),
+        'group': getattr(user, 'Group', None),
+        'leverage': getattr(user, 'Leverage', None),
+    }
+
+
+class PumpSink:
+    """Collects MT5 pump callbacks and writes them to the DB in micro-batches."""
+
+    def __init__(self, manager, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH):
+        self.manager = manager
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.events = queue.Queue()
+        self.stats = {'events': 0, 'batches': 0, 'errors': 0, 'last_flush_ms': 0.0, 'last_error': None}
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ----- MT5 callbacks (called on MT5 library threads, must stay cheap) -----
+
+    def OnPositionAdd(self, position):
+        self.events.put(('position', getattr(position, 'Login', None), position_to_dict(position)))
+
+    OnPositionUpdate = OnPositionAdd
+
+    def OnPositionDelete(self, position):
+        self.events.put(('position_delete', getattr(position, 'Login', None), getattr(position, 'Position', None)))
+
+    def OnPositionClean(self, login):
+        self.events.put(('position_clean', login, None))
+
+    def OnDealAdd(self, deal):
+        if _is_closing_deal(deal):
+            self.events.put(('deal', getattr(deal, 'Login', None), deal))
+
+    OnDealUpdate = OnDealAdd
+
+    def OnUserAdd(self, user):
+        self.events.put(('user', getattr(user, 'Login', None), user_to_dict(user)))
+
+    OnUserUpdate = OnUserAdd
+
+    # ----- lifecycle -----
+
+    def subscribe(self):
+        """Register this sink for position, deal and user callbacks."""
+        for name in ('PositionSubscribe', 'DealSubscribe', 'UserSubscribe'):
+            subscribe = getattr(self.manager, name, None)
+            if subscribe is None:
+                logger.warning(f"MT5 manager has no {name}; those changes will not be pushed")
+                continue
+            if not subscribe(self):
+                logger.error(f"{name} failed")
+
+    def unsubscribe(self):
+        for name in ('PositionUnsubscribe', 'DealUnsubscribe', 'UserUnsubscribe'):
+            unsubscribe = getattr(self.manager, name, None)
+            if unsubscribe is not None:
+                try:
+                    unsubscribe(self)
+                except Exception:
+                    pass
+
+    def start(self):
+        self.subscribe()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='mt5-pump-sink', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self.unsubscribe()
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                self.stats['errors'] += 1
+                self.stats['last_error'] = str(e)
+                logger.error(f"Pump sink flush failed: {e}")
+
+    # ----- batching -----
+
+    def _drain(self):
+        drained = []
+        while len(drained) < self.max_batch:
+            try:
+                drained.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        return drained
+
+    def flush(self):
+        """Write everything queued so far; returns the number of events applied."""
+        events = self._drain()
+        if not events:
+            return 0
+        started = time.perf_counter()
+        close_old_connections()
+
+        # Coalesce: the last event per key wins
+        position_upserts, position_deletes, cleaned = {}, set(), set()
+        deals, users = {}, {}
+        for kind, login, payload in events:
+            if kind == 'position':
+                pos_id = payload.get('id')
+                position_upserts[pos_id] = (login, payload)
+                position_deletes.discard(pos_id)
+            elif kind == 'position_delete':
+                position_upserts.pop(payload, None)
+                position_deletes.add(payload)
+            elif kind == 'position_clean':
+                position_upserts = {k: v for k, v in position_upserts.items() if v[0] != login}
+                cleaned.add(login)
+            elif kind == 'deal':
+                deals.setdefault(login, []).append(payload)
+            elif kind == 'user':
+                users[login] = payload
+
+        # Accounts first so positions and deals for new users find their row
+        if users:
+            upsert_accounts(users.values())
+        if position_upserts or position_deletes or cleaned:
+            apply_position_changes(position_upserts, position_deletes, cleaned)
+        if deals:
+            store_closed_deals(deals)
+
+        self.stats['events'] += len(events)
+        self.stats['batches'] += 1
+        self.stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return len(events)
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def start_pump_ingestion(manager=None):
+    """Start the process-wide pump sink once, connecting through MT5Service if needed."""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = PumpSink(manager or MT5Service().connect()).start()
+            logger.info("MT5 pump ingestion started")
+        return _sink
+
+
+def stop_pump_ingestion():
+    global _sink
+    with _sink_lock:
+        if _sink is not None:
+            _sink.stop()
+            _sink = None
@@ -0,0 +1,132 @@
+"""Server-side filtering and keyset pagination for the DB read endpoints.
+
+Filters are declared per endpoint as ``{query parameter: ORM lookup}``. Lookups
+ending in ``__in`` take comma-separated values and ``__gte``/``__lt`` lookups on
+date fields take ISO dates or datetimes. Pages are ordered by one sort field plus
+``id`` as a tie-breaker; the cursor carries the last row's values, so every page
+costs one index range scan regardless of how deep into the table it is.
+"""
+import base64
+import json
+from datetime import datetime, time
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+PAGE_PARAMS = ('limit', 'cursor')
+
+
+class QueryError(ValueError):
+    """Invalid filter, sort or cursor parameter; reported to the client as a 400."""
+
+
+def _parse_datetime(value):
+    try:
+        # Both return None for a malformed value but raise for one out of range (2024-13-45)
+        parsed = parse_datetime(value)
+        day = parse_date(value) if parsed is None else None
+    except ValueError:
+        raise QueryError(f"Invalid date '{value}'")
+    if parsed is None:
+        if day is None:
+            raise QueryError(f"Invalid date '{value}'")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_queryset(queryset, params, filters):
+    """Apply the ``filters`` whose query parameters are present in ``params``."""
+    conditions = {}
+    for param, lookup in filters.items():
+        value = params.get(param)
+        if not value:
+            continue
+        if lookup.endswith('__in'):
+            conditions[lookup] = [v.strip() for v in value.split(',') if v.strip()]
+        elif lookup.endswith(('__gte', '__lt')):
+            conditions[lookup] = _parse_datetime(value)
+        else:
+            conditions[lookup] = value
+    try:
+        return queryset.filter(**conditions)
+    except (ValueError, TypeError, ValidationError) as e:
+        raise QueryError(f"Invalid filter: {e}")
+
+
+def wants_page(params):
+    """True when the client asked for keyset pagination."""
+    return any(params.get(p) for p in PAGE_PARAMS)
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder without its cut of datetimes to milliseconds.
+
+    The next page starts strictly after the cursor, so a truncated value would
+    skip or repeat rows that differ only below the millisecond.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _encode_cursor(sort, value, pk):
+    raw = json.dumps([sort, value, pk], cls=_CursorEncoder)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor, sort):
+    try:
+        cursor_sort, value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise QueryError("Invalid cursor")
+    if cursor_sort != sort:
+        raise QueryError("Cursor was issued for a different sort order")
+    return value, pk
+
+
+def keyset_page(queryset, params, fields, sort_fields, default_sort):
+    """Return ``(rows, next_cursor)`` for one page of ``queryset.values(*fields)``.
+
+    ``sort`` picks one of ``sort_fields`` (prefix ``-`` for descending), ``limit``
+    the page size and ``cursor`` the position returned with the previous page.
+    ``next_cursor`` is None on the last page.
+    """
+    sort = params.get('sort') or default_sort
+    field = sort.lstrip('-')
+    if field not in sort_fields:
+        raise QueryError(f"Cannot sort by '{field}', use one of: {', '.join(sort_fields)}")
+    descending = sort.startswith('-')
+    try:
+        limit = int(params.get('limit') or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        raise QueryError("limit must be an integer")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    if params.get('cursor'):
+        value, pk = _decode_cursor(params['cursor'], sort)
+        op = 'lt' if descending else 'gt'
+        queryset = queryset.filter(Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk}))
+    order = (f'-{field}', '-id') if descending else (field, 'id')
+
+    columns = list(dict.fromkeys([*fields, field, 'id']))
+    rows = list(queryset.order_by(*order).values(*columns)[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor(sort, last[field], last['id'])
+    extra = set(columns) - set(fields)
+    if extra:
+        for row in rows:
+            for key in extra:
+                del row[key]
+    return rows, next_cursor
@@ -0,0 +1,810 @@
+"""Set-based reconciliation of MT5 data against the local database.
+
+The sync views used to call ``update_or_create`` once per position, which costs
+a SELECT plus an INSERT/UPDATE for every row. The helpers here load the current
+DB state for a chunk of accounts in one query, diff it against what MT5 returned
+in memory and then write inserts, updates and stale-row deletes with a handful
+of set-based statements per batch.
+
+Each account also stores a fingerprint of the account and open-position state
+it was last synced with. When MT5 reports the same state again the account is
+skipped before any row is loaded or written. Writers that bypass the diff
+(pump callbacks) clear the fingerprint so the next sync diffs in full.
+"""
+import hashlib
+import io
+import logging
+import time
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import events, generation
+from .models import Accounts, OpenPositions, ClosedPositions, LoginSymbolTotals, PositionChange
+from .utils import normalize_date, volume_to_lots
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT ... ON CONFLICT / DELETE statement
+BATCH_SIZE = 2000
+# Accounts whose existing positions are loaded and diffed together
+LOGIN_CHUNK_SIZE = 500
+
+POSITION_FIELDS = ('symbol', 'volume', 'price', 'profit', 'position_type', 'date_created')
+# A position whose other fields all match only needs the price/profit fast path
+PRICE_FIELDS = ('price', 'profit')
+STRUCTURAL_FIELDS = tuple(f for f in POSITION_FIELDS if f not in PRICE_FIELDS)
+ACCOUNT_FIELDS = ('name', 'email', 'group', 'leverage')
+ACCOUNT_STATE_FIELDS = ('balance', 'equity', 'profit', 'margin', 'margin_free', 'margin_level')
+ACCOUNT_SYNC_FIELDS = (*ACCOUNT_FIELDS, *ACCOUNT_STATE_FIELDS, 'last_access', 'registration')
+DEAL_FIELDS = ('deal_id', 'symbol', 'volume', 'price', 'profit', 'position_type', 'date_closed')
+
+# Changes older than this are pruned from PositionChanges; clients further behind get a snapshot
+CHANGE_LOG_RETENTION = timedelta(minutes=30)
+# pg_advisory_xact_lock key that serializes change-log writes
+CHANGE_LOG_LOCK = 0x504F5343  # 'POSC'
+
+_QUANT = {
+    'volume': Decimal('0.01'),
+    'price': Decimal('0.00001'),
+    'profit': Decimal('0.01'),
+    'money': Decimal('0.01'),
+}
+
+
+def _to_decimal(value, field):
+    try:
+        return Decimal(str(value)).quantize(_QUANT[field])
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def clean_position(pos):
+    """Convert a position dict from MT5Service into model field values.
+
+    Returns ``(position_id, values)`` or ``None`` when required fields are missing.
+    """
+    pos_id = pos.get('id')
+    if not pos_id:
+        return None
+    symbol = pos.get('symbol')
+    position_type = pos.get('type')
+    volume = _to_decimal(pos.get('volume'), 'volume') if pos.get('volume') is not None else None
+    price = _to_decimal(pos.get('price'), 'price') if pos.get('price') is not None else None
+    if any(v is None for v in [symbol, volume, price, position_type]):
+        return None
+    return int(pos_id), {
+        'symbol': symbol,
+        'volume': volume,
+        'price': price,
+        'profit': _to_decimal(pos.get('profit') or 0, 'profit') or Decimal('0.00'),
+        'position_type': position_type,
+        'date_created': normalize_date(pos.get('date')),
+    }
+
+
+def _refresh_totals(cursor, source, prefix, pks, now):
+    """Recompute the ``prefix`` (open/closed) columns of LoginSymbolTotals for pks from source."""
+    totals = LoginSymbolTotals._meta.db_table
+    other = 'closed' if prefix == 'open' else 'open'
+    cursor.execute(
+        f'''INSERT INTO "{totals}" AS t (login_id, symbol, {prefix}_count, {prefix}_lot, {prefix}_usd,
+                                         {other}_count, {other}_lot, {other}_usd, updated_at)
+            SELECT login_id, symbol, COUNT(*), SUM(volume), SUM(profit), 0, 0, 0, %s
+            FROM "{source}" WHERE login_id = ANY(%s) GROUP BY login_id, symbol
+            ON CONFLICT (login_id, symbol) DO UPDATE SET
+                {prefix}_count = EXCLUDED.{prefix}_count, {prefix}_lot = EXCLUDED.{prefix}_lot,
+                {prefix}_usd = EXCLUDED.{prefix}_usd, updated_at = EXCLUDED.updated_at
+            WHERE (t.{prefix}_count, t.{prefix}_lot, t.{prefix}_usd)
+                IS DISTINCT FROM (EXCLUDED.{prefix}_count, EXCLUDED.{prefix}_lot, EXCLUDED.{prefix}_usd)''',
+        [now, pks],
+    )
+    cursor.execute(
+        f'''UPDATE "{totals}" AS t SET {prefix}_count = 0, {prefix}_lot = 0, {prefix}_usd = 0, updated_at = %s
+            WHERE t.login_id = ANY(%s) AND t.{prefix}_count > 0 AND NOT EXISTS (
+                SELECT 1 FROM "{source}" s WHERE s.login_id = t.login_id AND s.symbol = t.symbol)''',
+        [now, pks],
+    )
+
+
+def refresh_symbol_totals(account_pks, open_positions=True, closed_positions=False):
+    """Bring LoginSymbolTotals up to date for the given accounts after their positions changed.
+
+    Only the named accounts are re-aggregated, so the cost follows the size of the
+    change rather than the size of the tables. Rows left with no open or closed
+    positions are removed. Every position writer ends here, so this is also where
+    the data generation is bumped.
+    """
+    pks = sorted(set(account_pks))
+    if not pks:
+        return
+    now = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        if open_positions:
+            _refresh_totals(cursor, OpenPositions._meta.db_table, 'open', pks, now)
+        if closed_positions:
+            _refresh_totals(cursor, ClosedPositions._meta.db_table, 'closed', pks, now)
+        cursor.execute(
+            f'DELETE FROM "{LoginSymbolTotals._meta.db_table}" '
+            f'WHERE login_id = ANY(%s) AND open_count = 0 AND closed_count = 0',
+            [pks],
+        )
+        generation.bump()
+
+
+def record_position_changes(upserts, deletes, batch_size=BATCH_SIZE):
+    """Append position upserts and deletes to the PositionChanges log and push them to live clients.
+
+    ``upserts`` are dicts with ``position_id``, ``login`` and the POSITION_FIELDS;
+    ``deletes`` are dicts with ``position_id`` and ``login``. Log writes are
+    serialized with an advisory lock held until commit, so versions become visible
+    in increasing order and a reader never skips one that commits late.
+    Returns the last version written (None if there was nothing to record).
+    """
+    if not upserts and not deletes:
+        return None
+    # Deletes first, matching apply_position_changes, which removes before it upserts
+    rows = [
+        PositionChange(login=row['login'], position_id=row['position_id'], action='delete')
+        for row in deletes
+    ] + [
+        PositionChange(login=row['login'], position_id=row['position_id'], action='upsert',
+                       data={f: row[f] for f in POSITION_FIELDS})
+        for row in upserts
+    ]
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CHANGE_LOG_LOCK])
+        created = PositionChange.objects.bulk_create(rows, batch_size=batch_size)
+        version = created[-1].version
+        events.publish('positions', {'version': version, 'upserts': upserts, 'deletes': deletes},
+                       logins={row['login'] for row in [*upserts, *deletes]})
+    return version
+
+
+def publish_position_prices(rows):
+    """Push price/profit moves to live clients without logging them.
+
+    ``rows`` are dicts with ``position_id``, ``login``, ``price`` and ``profit``.
+    Every open position reprices on nearly every sync, so logging these would add a
+    change-log row per position per cycle; delta clients read prices over REST.
+    """
+    if rows and events.broker.listening('positions'):
+        events.publish('positions', {'prices': rows}, logins={row['login'] for row in rows})
+
+
+def delete_accounts(accounts):
+    """Delete the ``accounts`` queryset, logging the open positions the cascade removes.
+
+    The cascade bypasses the writers above, so without the delete changes clients
+    following /api/positions/changes/ would keep the removed positions forever.
+    Returns the number of accounts deleted.
+    """
+    with transaction.atomic():
+        removed = [
+            {'position_id': pos_id, 'login': login}
+            for login, pos_id in OpenPositions.objects.filter(login__in=accounts).values_list('login__login', 'position_id')
+        ]
+        record_position_changes([], removed)
+        deleted = accounts.delete()[1].get(Accounts._meta.label, 0)
+        generation.bump()
+    return deleted
+
+
+def prune_position_changes(retention=CHANGE_LOG_RETENTION):
+    """Delete change-log rows older than ``retention``, keeping the latest so its version stays known.
+
+    created_at is set before the version is allocated under the log lock, so the two
+    can disagree; the cutoff is turned into a version and everything up to it goes,
+    leaving no gap that the endpoint's oldest-version check could miss.
+    """
+    latest = PositionChange.objects.order_by('-version').values_list('version', flat=True).first()
+    if latest is None:
+        return 0
+    cutoff = timezone.now() - retention
+    boundary = (
+        PositionChange.objects.filter(created_at__lt=cutoff, version__lt=latest)
+        .order_by('-version').values_list('version', flat=True).first()
+    )
+    if boundary is None:
+        return 0
+    return PositionChange.objects.filter(version__lte=boundary).delete()[0]
+
+
+def fingerprint(items):
+    """Stable 32-character hash of a list of cleaned values."""
+    return hashlib.blake2b(repr(items).encode(), digest_size=16).hexdigest()
+
+
+def _positions_fingerprint(cleaned):
+    return fingerprint(sorted(
+        (pos_id, *(str(values[f]) for f in POSITION_FIELDS)) for pos_id, values in cleaned
+    ))
+
+
+def _account_ids(logins, accounts=None):
+    """Map MT5 login -> Accounts primary key for the given logins."""
+    if accounts is not None:
+        return {
+            login: (acc.pk if isinstance(acc, Accounts) else acc)
+            for login, acc in accounts.items()
+        }
+    ids = {}
+    for chunk in _chunks(list(logins), BATCH_SIZE):
+        ids.update(Accounts.objects.filter(login__in=chunk).values_list('login', 'id'))
+    return ids
+
+
+def refresh_position_prices(rows, batch_size=BATCH_SIZE):
+    """Update price and profit of existing OpenPositions rows, one UPDATE per batch.
+
+    ``rows`` is a list of ``(row id, price, profit)``. Returns the number of rows updated.
+    """
+    table = OpenPositions._meta.db_table
+    now = timezone.now()
+    updated = 0
+    with connection.cursor() as cursor:
+        for batch in _chunks(rows, batch_size):
+            values = ', '.join(['(%s, %s::numeric, %s::numeric)'] * len(batch))
+            cursor.execute(
+                f'UPDATE "{table}" AS p SET price = v.price, profit = v.profit, last_updated = %s '
+                f'FROM (VALUES {values}) AS v(id, price, profit) WHERE p.id = v.id',
+                [now, *(value for row in batch for value in row)],
+            )
+            updated += cursor.rowcount
+    return updated
+
+
+def reconcile_open_positions(positions_by_login, accounts=None, batch_size=BATCH_SIZE):
+    """Bring OpenPositions in line with what MT5 reported for a set of accounts.
+
+    ``positions_by_login`` maps an MT5 login to the list of position dicts returned
+    by ``MT5Service.get_open_positions``. Only the logins present in the mapping are
+    touched: a login mapped to an empty list has all of its open positions removed.
+    ``accounts`` optionally maps login -> Accounts instance (or pk) to skip the
+    account lookup.
+
+    Positions where only price/profit moved (the common case between syncs) go
+    through ``refresh_position_prices``; new positions and structural changes
+    (symbol, volume, type, open time, owner) are upserted and closed ones deleted.
+
+    Returns a summary dict with row counts and timings in milliseconds.
+    """
+    started = time.perf_counter()
+    summary = {
+        'accounts': 0,
+        'missing_accounts': 0,
+        'fetched': 0,
+        'invalid': 0,
+        'inserted': 0,
+        'updated': 0,
+        'refreshed': 0,
+        'unchanged': 0,
+        'skipped': 0,
+        'stored': 0,
+        'deleted': 0,
+        'timings': {'load_ms': 0.0, 'diff_ms': 0.0, 'write_ms': 0.0, 'total_ms': 0.0},
+    }
+    timings = summary['timings']
+
+    t0 = time.perf_counter()
+    account_ids = _account_ids(positions_by_login.keys(), accounts)
+    timings['load_ms'] += (time.perf_counter() - t0) * 1000
+
+    logins = []
+    for login in positions_by_login:
+        if login in account_ids:
+            logins.append(login)
+        else:
+            summary['missing_accounts'] += 1
+    summary['accounts'] = len(logins)
+
+    for login_chunk in _chunks(logins, LOGIN_CHUNK_SIZE):
+        t0 = time.perf_counter()
+        stored_fingerprints = dict(
+            Accounts.objects.filter(id__in=[account_ids[login] for login in login_chunk])
+            .values_list('id', 'positions_fingerprint')
+        )
+        timings['load_ms'] += (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        cleaned_by_login = {}
+        new_fingerprints = {}
+        for login in login_chunk:
+            cleaned = []
+            for pos in positions_by_login.get(login) or []:
+                summary['fetched'] += 1
+                item = clean_position(pos)
+                if item is None:
+                    summary['invalid'] += 1
+                    continue
+                cleaned.append(item)
+            account_pk = account_ids[login]
+            digest = _positions_fingerprint(cleaned)
+            if stored_fingerprints.get(account_pk) == digest:
+                summary['skipped'] += 1
+                summary['unchanged'] += len(cleaned)
+                continue
+            cleaned_by_login[login] = cleaned
+            new_fingerprints[account_pk] = digest
+        login_chunk = list(cleaned_by_login)
+        pks = [account_ids[login] for login in login_chunk]
+        timings['diff_ms'] += (time.perf_counter() - t0) * 1000
+        if not login_chunk:
+            continue
+
+        t0 = time.perf_counter()
+        existing = {
+            row['position_id']: row
+            for row in OpenPositions.objects.filter(login_id__in=pks).values(
+                'id', 'login_id', 'position_id', *POSITION_FIELDS
+            )
+        }
+        timings['load_ms'] += (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        to_write = []
+        to_refresh = []
+        changed = []  # logged and pushed to live clients once written
+        repriced = []  # only pushed
+        seen = set()
+        for login in login_chunk:
+            account_pk = account_ids[login]
+            for pos_id, values in cleaned_by_login[login]:
+                if pos_id in seen:
+                    continue
+                seen.add(pos_id)
+                current = existing.get(pos_id)
+                if current is None:
+                    summary['inserted'] += 1
+                elif current['login_id'] == account_pk and all(
+                    current[f] == values[f] for f in STRUCTURAL_FIELDS
+                ):
+                    if all(current[f] == values[f] for f in PRICE_FIELDS):
+                        summary['unchanged'] += 1
+                    else:
+                        to_refresh.append((current['id'], values['price'], values['profit']))
+                        repriced.append({'position_id': pos_id, 'login': login,
+                                         'price': values['price'], 'profit': values['profit']})
+                    continue
+                else:
+                    summary['updated'] += 1
+                to_write.append(OpenPositions(login_id=account_pk, position_id=pos_id, **values))
+                changed.append({'position_id': pos_id, 'login': login, **values})
+        login_by_pk = {account_ids[login]: login for login in login_chunk}
+        stale = [(row['id'], pos_id, login_by_pk[row['login_id']]) for pos_id, row in existing.items() if pos_id not in seen]
+        stale_ids = [row_id for row_id, _, _ in stale]
+        timings['diff_ms'] += (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        # One transaction per chunk: the rows, their totals, the change log and the
+        # fingerprints land together, so a failure leaves nothing that the next
+        # diff would mistake for unchanged or that delta clients would never see
+        with transaction.atomic():
+            if to_refresh:
+                summary['refreshed'] += refresh_position_prices(to_refresh, batch_size)
+            for batch in _chunks(to_write, batch_size):
+                OpenPositions.objects.bulk_create(
+                    batch,
+                    update_conflicts=True,
+                    unique_fields=['position_id'],
+                    update_fields=['login', *POSITION_FIELDS, 'last_updated'],
+                )
+            for batch in _chunks(stale_ids, batch_size):
+                summary['deleted'] += OpenPositions.objects.filter(id__in=batch).delete()[0]
+            refresh_symbol_totals(pks)
+            record_position_changes(changed, [{'position_id': pos_id, 'login': login} for _, pos_id, login in stale])
+            publish_position_prices(repriced)
+            Accounts.objects.bulk_update(
+                [Accounts(id=pk, positions_fingerprint=digest) for pk, digest in new_fingerprints.items()],
+                ['positions_fingerprint'],
+                batch_size=batch_size,
+            )
+        timings['write_ms'] += (time.perf_counter() - t0) * 1000
+
+    summary['stored'] = summary['inserted'] + summary['updated'] + summary['refreshed'] + summary['unchanged']
+    timings['total_ms'] = (time.perf_counter() - started) * 1000
+    for key in timings:
+        timings[key] = round(timings[key], 2)
+
+    logger.info(
+        "Reconciled open positions for %s accounts (%s skipped): %s inserted, %s updated, "
+        "%s refreshed, %s unchanged, %s deleted in %sms",
+        summary['accounts'], summary['skipped'], summary['inserted'], summary['updated'],
+        summary['refreshed'], summary['unchanged'], summary['deleted'], timings['total_ms'],
+    )
+    return summary
+
+
+def clean_deal(deal):
+    """Convert a closing MT5 deal object into ClosedPositions field values.
+
+    Returns ``(position_id, values)`` or ``None`` for non-closing or incomplete deals.
+    """
+    position_id = getattr(deal, 'PositionID', None)  # <-- Unique per account
+    if not position_id:
+        return None
+    if getattr(deal, 'Entry', None) != 1:
+        return None
+    symbol = getattr(deal, 'Symbol', None)
+    volume = volume_to_lots(getattr(deal, 'Volume', 0))
+    price = getattr(deal, 'Price', None)
+    profit = getattr(deal, 'Profit', 0)
+    action = getattr(deal, 'Action', None)
+    position_type = 'Buy' if action == 0 else 'Sell' if action == 1 else None
+    if any(v is None for v in [symbol, volume, price, position_type]):
+        return None
+    return int(position_id), {
+        'deal_id': getattr(deal, 'Deal', None),
+        'symbol': symbol,
+        'volume': _to_decimal(volume, 'volume'),
+        'price': _to_decimal(price, 'price'),
+        'profit': _to_decimal(profit or 0, 'profit') or Decimal('0.00'),
+        'position_type': position_type,
+        'date_closed': normalize_date(getattr(deal, 'Time', None)),
+    }
+
+
+def _collect_closed_deals(deals_by_login, accounts, summary):
+    """Clean deals into {(account pk, position id): values}, counting into summary."""
+    account_ids = _account_ids(deals_by_login.keys(), accounts)
+    rows = {}
+    for login, deals in deals_by_login.items():
+        account_pk = account_ids.get(login)
+        if account_pk is None:
+            summary['missing_accounts'] += 1
+            continue
+        summary['accounts'] += 1
+        for deal in deals or []:
+            summary['fetched'] += 1
+            cleaned = clean_deal(deal)
+            if cleaned is None:
+                summary['invalid'] += 1
+                continue
+            position_id, values = cleaned
+            # Partial closes share a position; the last closing deal wins
+            rows[(account_pk, position_id)] = values
+    return rows
+
+
+def store_closed_deals(deals_by_login, accounts=None, batch_size=BATCH_SIZE):
+    """Upsert closing deals into ClosedPositions, one row per (login, position).
+
+    ``deals_by_login`` maps an MT5 login to the deal objects returned by
+    ``MT5Service.get_closed_trades``. Rows are written with INSERT ... ON CONFLICT
+    in batches; errors propagate so callers can keep their sync watermark in place.
+    A stored row is only replaced by a deal that closed at the same time or later.
+
+    Returns a summary dict with row counts and timings in milliseconds.
+    """
+    started = time.perf_counter()
+    summary = {'accounts': 0, 'missing_accounts': 0, 'fetched': 0, 'invalid': 0, 'stored': 0,
+               'timings': {'write_ms': 0.0, 'total_ms': 0.0}}
+
+    collected = _collect_closed_deals(deals_by_login, accounts, summary)
+    rows = [
+        (account_pk, position_id, *(values[f] for f in DEAL_FIELDS))
+        for (account_pk, position_id), values in collected.items()
+    ]
+
+    t0 = time.perf_counter()
+    now = timezone.now()
+    placeholders = '(' + ', '.join(['%s'] * (len(CLOSED_COLUMNS) + 1)) + ')'
+    for batch in _chunks(rows, batch_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                _closed_upsert_sql(f'VALUES {", ".join([placeholders] * len(batch))}'),
+                [value for row in batch for value in (*row, now)],
+            )
+            summary['stored'] += cursor.rowcount
+    refresh_symbol_totals({account_pk for account_pk, _ in collected}, open_positions=False, closed_positions=True)
+    summary['timings']['write_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+    summary['timings']['total_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return summary
+
+
+CLOSED_COLUMNS = ['"login_id"', '"position"', *(f'"{f}"' for f in DEAL_FIELDS)]
+
+
+def _closed_upsert_sql(source):
+    """INSERT ... ON CONFLICT for ClosedPositions from ``source`` (VALUES or SELECT of CLOSED_COLUMNS + last_updated).
+
+    Conflicting rows are only overwritten by a deal that closed at the same time or
+    later, so replaying an older window (a resumed backfill chunk) never rolls a
+    position back to an earlier closing deal.
+    """
+    table = ClosedPositions._meta.db_table
+    updates = ', '.join(f'{c} = EXCLUDED.{c}' for c in CLOSED_COLUMNS[2:])
+    return (
+        f'INSERT INTO "{table}" AS t ({", ".join(CLOSED_COLUMNS)}, "last_updated") {source} '
+        f'ON CONFLICT ("login_id", "position") DO UPDATE SET {updates}, "last_updated" = EXCLUDED."last_updated" '
+        f'WHERE EXCLUDED."date_closed" >= t."date_closed"'
+    )
+
+
+def _copy_value(value):
+    """Render a value in PostgreSQL COPY text format."""
+    if value is None:
+        return '\\N'
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _copy_rows(cursor, table, columns, rows):
+    """Stream rows into table with COPY ... FROM STDIN (psycopg 3 or psycopg2)."""
+    raw = cursor.cursor
+    sql = f'COPY {table} ({", ".join(columns)}) FROM STDIN'
+    if hasattr(raw, 'copy'):
+        with raw.copy(sql) as copy:
+            for row in rows:
+                copy.write_row(row)
+    else:
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_value(v) for v in row) + '\n')
+        buffer.seek(0)
+        raw.copy_expert(sql, buffer)
+
+
+def copy_closed_deals(deals_by_login, accounts=None):
+    """Bulk-load closing deals into ClosedPositions through PostgreSQL COPY.
+
+    Same input, row semantics and summary as ``store_closed_deals``, but the rows are
+    streamed into a temporary table with COPY and merged with a single
+    INSERT ... SELECT ... ON CONFLICT, which is much faster for large backfills.
+    Falls back to ``store_closed_deals`` on other database backends.
+    """
+    if connection.vendor != 'postgresql':
+        return store_closed_deals(deals_by_login, accounts)
+
+    started = time.perf_counter()
+    summary = {'accounts': 0, 'missing_accounts': 0, 'fetched': 0, 'invalid': 0, 'stored': 0,
+               'timings': {'write_ms': 0.0, 'total_ms': 0.0}}
+    rows = _collect_closed_deals(deals_by_login, accounts, summary)
+
+    t0 = time.perf_counter()
+    if rows:
+        table = ClosedPositions._meta.db_table
+        columns = CLOSED_COLUMNS
+        now = timezone.now()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS closed_positions_load')
+            cursor.execute(
+                f'CREATE TEMP TABLE closed_positions_load ON COMMIT DROP AS '
+                f'SELECT {", ".join(columns)} FROM "{table}" WITH NO DATA'
+            )
+            _copy_rows(cursor, 'closed_positions_load', columns, (
+                (account_pk, position_id, *(values[f] for f in DEAL_FIELDS))
+                for (account_pk, position_id), values in rows.items()
+            ))
+            cursor.execute(_closed_upsert_sql(f'SELECT {", ".join(columns)}, %s FROM closed_positions_load'), [now])
+            summary['stored'] = cursor.rowcount
+            cursor.execute('DROP TABLE closed_positions_load')
+        refresh_symbol_totals({account_pk for account_pk, _ in rows}, open_positions=False, closed_positions=True)
+    summary['timings']['write_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+    summary['timings']['total_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return summary
+
+
+def apply_position_changes(upserts, deletes=(), cleaned_logins=(), batch_size=BATCH_SIZE):
+    """Apply individual position changes, e.g. from MT5 pump callbacks.
+
+    ``upserts`` maps position id -> ``(login, position dict)``; ``deletes`` is an
+    iterable of position ids and ``cleaned_logins`` lists logins whose positions
+    were all removed. Unlike ``reconcile_open_positions`` nothing else is touched.
+    """
+    summary = {'upserted': 0, 'deleted': 0, 'invalid': 0, 'missing_accounts': 0}
+    account_ids = _account_ids({login for login, _ in upserts.values()} | set(cleaned_logins))
+
+    rows = []
+    for pos_id, (login, pos) in upserts.items():
+        account_pk = account_ids.get(login)
+        if account_pk is None:
+            summary['missing_accounts'] += 1
+            continue
+        cleaned = clean_position(pos)
+        if cleaned is None:
+            summary['invalid'] += 1
+            continue
+        rows.append(OpenPositions(login_id=account_pk, position_id=cleaned[0], **cleaned[1]))
+
+    with transaction.atomic():
+        # These writes bypass the diff, so the touched accounts must be diffed in full next sync
+        touched = {row.login_id for row in rows}
+        # Removals first: upserts were coalesced after any clean/delete of the same position
+        pks = [account_ids[login] for login in cleaned_logins if login in account_ids]
+        touched.update(pks)
+        removed = []
+        if pks:
+            removed.extend(
+                {'position_id': pos_id, 'login': login}
+                for login, pos_id in OpenPositions.objects.filter(login_id__in=pks).values_list('login__login', 'position_id')
+            )
+            summary['deleted'] += OpenPositions.objects.filter(login_id__in=pks).delete()[0]
+        for batch in _chunks(list(deletes), batch_size):
+            rows_removed = OpenPositions.objects.filter(position_id__in=batch).values_list('login_id', 'login__login', 'position_id')
+            for account_pk, login, pos_id in rows_removed:
+                touched.add(account_pk)
+                removed.append({'position_id': pos_id, 'login': login})
+            summary['deleted'] += OpenPositions.objects.filter(position_id__in=batch).delete()[0]
+        for batch in _chunks(list(touched), batch_size):
+            Accounts.objects.filter(id__in=batch).update(positions_fingerprint=None)
+        existing = {}
+        for batch in _chunks([row.position_id for row in rows], batch_size):
+            existing.update(
+                (current['position_id'], current)
+                for current in OpenPositions.objects.filter(position_id__in=batch).values(
+                    'position_id', 'login_id', *STRUCTURAL_FIELDS)
+            )
+        for batch in _chunks(rows, batch_size):
+            OpenPositions.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=['position_id'],
+                update_fields=['login', *POSITION_FIELDS, 'last_updated'],
+            )
+            summary['upserted'] += len(batch)
+        refresh_symbol_totals(touched)
+        login_by_pk = {pk: login for login, pk in account_ids.items()}
+        upserted, repriced = [], []
+        for row in rows:
+            current = existing.get(row.position_id)
+            if current is not None and current['login_id'] == row.login_id and all(
+                current[f] == getattr(row, f) for f in STRUCTURAL_FIELDS
+            ):
+                repriced.append({'position_id': row.position_id, 'login': login_by_pk[row.login_id],
+                                 'price': row.price, 'profit': row.profit})
+            else:
+                upserted.append({'position_id': row.position_id, 'login': login_by_pk[row.login_id],
+                                 **{f: getattr(row, f) for f in POSITION_FIELDS}})
+        record_position_changes(upserted, removed, batch_size)
+        publish_position_prices(repriced)
+    return summary
+
+
+def upsert_accounts(accounts, fields=ACCOUNT_FIELDS, batch_size=BATCH_SIZE):
+    """Insert or update Accounts rows keyed by login.
+
+    ``accounts`` is an iterable of dicts with a ``login`` key; only ``fields`` are
+    written on conflict, so callers holding partial data leave other columns alone.
+    The account fingerprint is cleared so the next full sync rewrites the row.
+    """
+    rows = {}
+    for acc in accounts:
+        login = acc.get('login')
+        if login is None:
+            continue
+        rows[int(login)] = Accounts(login=int(login), **{f: acc.get(f) for f in fields if f in acc})
+
+    stored = 0
+    for batch in _chunks(list(rows.values()), batch_size):
+        with transaction.atomic():
+            Accounts.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=['login'],
+                update_fields=[*fields, 'account_fingerprint'],
+            )
+            generation.bump()
+            events.publish('accounts', {
+                'accounts': [{'login': row.login, **{f: getattr(row, f) for f in fields}} for row in batch],
+            }, logins=[row.login for row in batch])
+        stored += len(batch)
+    return stored
+
+
+def clean_account(acc):
+    """Convert an account dict from MT5Service into Accounts field values.
+
+    Returns ``(login, values)`` or ``None`` when the login is missing.
+    """
+    login = acc.get('login')
+    if login is None:
+        return None
+    values = {f: acc.get(f) for f in ACCOUNT_FIELDS}
+    for f in ACCOUNT_STATE_FIELDS:
+        values[f] = _to_decimal(acc.get(f) or 0, 'money') or Decimal('0.00')
+    for f in ('last_access', 'registration'):
+        values[f] = normalize_date(acc[f]) if acc.get(f) else None
+    return int(login), values
+
+
+def ingest_accounts(accounts, chunk_size=BATCH_SIZE):
+    """Upsert account dicts into Accounts in chunks, skipping rows that did not change.
+
+    ``accounts`` may be any iterable, including a generator streaming from MT5; only
+    one chunk is held at a time. Each chunk costs one SELECT of the stored account
+    fingerprints and one INSERT ... ON CONFLICT for the new or changed accounts;
+    accounts whose fingerprint matches are counted under ``skipped``. A chunk that
+    fails to write is logged and counted under ``failed`` so the rest still goes through.
+
+    Returns a summary dict with row counts and timings in milliseconds.
+    """
+    started = time.perf_counter()
+    summary = {
+        'fetched': 0,
+        'invalid': 0,
+        'inserted': 0,
+        'updated': 0,
+        'skipped': 0,
+        'stored': 0,
+        'failed': 0,
+        'chunks': 0,
+        'timings': {'load_ms': 0.0, 'write_ms': 0.0, 'total_ms': 0.0},
+    }
+    timings = summary['timings']
+
+    def flush(rows):
+        summary['chunks'] += 1
+        t0 = time.perf_counter()
+        existing = dict(Accounts.objects.filter(login__in=list(rows)).values_list('login', 'account_fingerprint'))
+        timings['load_ms'] += (time.perf_counter() - t0) * 1000
+
+        to_write, inserted, updated = [], 0, 0
+        for login, values in rows.items():
+            digest = fingerprint([str(values[f]) for f in ACCOUNT_SYNC_FIELDS])
+            if login not in existing:
+                inserted += 1
+            elif existing[login] == digest:
+                summary['skipped'] += 1
+                continue
+            else:
+                updated += 1
+            to_write.append(Accounts(login=login, account_fingerprint=digest, **values))
+
+        t0 = time.perf_counter()
+        try:
+            if to_write:
+                with transaction.atomic():
+                    Accounts.objects.bulk_create(
+                        to_write,
+                        update_conflicts=True,
+                        unique_fields=['login'],
+                        update_fields=[*ACCOUNT_SYNC_FIELDS, 'account_fingerprint'],
+                    )
+                    generation.bump()
+                    events.publish('accounts', {
+                        'accounts': [{'login': row.login, **{f: getattr(row, f) for f in ACCOUNT_SYNC_FIELDS}} for row in to_write],
+                    }, logins=[row.login for row in to_write])
+            summary['inserted'] += inserted
+            summary['updated'] += updated
+        except Exception as e:
+            logger.error(f"Failed to store {len(to_write)} accounts: {e}")
+            summary['failed'] += len(to_write)
+        timings['write_ms'] += (time.perf_counter() - t0) * 1000
+
+    rows = {}
+    for acc in accounts:
+        summary['fetched'] += 1
+        cleaned = clean_account(acc)
+        if cleaned is None:
+            summary['invalid'] += 1
+            continue
+        login, values = cleaned
+        rows[login] = values
+        if len(rows) >= chunk_size:
+            flush(rows)
+            rows = {}
+    if rows:
+        flush(rows)
+
+    summary['stored'] = summary['inserted'] + summary['updated'] + summary['skipped']
+    timings['total_ms'] = (time.perf_counter() - started) * 1000
+    for key in timings:
+        timings[key] = round(timings[key], 2)
+
+    logger.info(
+        "Ingested %s accounts: %s inserted, %s updated, %s skipped, %s failed in %sms",
+        summary['fetched'], summary['inserted'], summary['updated'],
+        summary['skipped'], summary['failed'], timings['total_ms'],
+    )
+    return summary
@@ -1,48 +1,207 @@
 # myapp/tasks.py
+import logging
+import os
+import random
+import sys
 import threading
 import time
-import requests
 from django.conf import settings
+from django.db import connections
 
-# Set your API base URL
-API_BASE = getattr(settings, 'API_BASE_URL', 'http://127.0.0.1:8000')  # Change if needed
-FETCH_INTERVAL = 10  # seconds
+logger = logging.getLogger(__name__)
 
-def fetch_data_periodically():
-    """Fetch groups, accounts, open positions, and closed positions periodically."""
-    while True:
-        try:
-            # Fetch Groups
-            groups_resp = requests.get(f"{API_BASE}/api/groups/")
-            groups = groups_resp.json() if groups_resp.ok else {"error": groups_resp.text}
-            
-            # Fetch Accounts
-            accounts_resp = requests.get(f"{API_BASE}/api/accounts/")
-            accounts = accounts_resp.json() if accounts_resp.ok else {"error": accounts_resp.text}
-
-            # Fetch All Open Positions
-            open_positions_resp = requests.get(f"{API_BASE}/api/positions/sync_all/")
-            open_positions = open_positions_resp.json() if open_positions_resp.ok else {"error": open_positions_resp.text}
-
-            # Fetch All Closed Positions
-            closed_positions_resp = requests.get(f"{API_BASE}/api/closepositions/sync_all/")
-            closed_positions = closed_positions_resp.json() if closed_positions_resp.ok else {"error": closed_positions_resp.text}
-
-            # Print or store the results (for demonstration)
-            print("="*50)
-            print("Groups:", groups)
-            print("Accounts:", accounts)
-            print("Open Positions:", open_positions)
-            print("Closed Positions:", closed_positions)
-            print("="*50)
+# Sync function in core.views (or a dotted path), interval / jitter / timeout in seconds.
+# Override per job with settings.SYNC_SCHEDULE = {'open_positions': {'interval': 5}, ...}
+DEFAULT_SCHEDULE = {
+    'groups': {'func': 'sync_groups_to_db', 'interval': 300, 'jitter': 15, 'timeout': 60},
+    'accounts': {'func': 'sync_accounts', 'interval': 60, 'jitter': 5, 'timeout': 300},
+    'open_positions': {'func': 'sync_open_positions_for_all_accounts', 'interval': 5, 'jitter': 1, 'timeout': 120},
+    'closed_positions': {'func': 'sync_closed_positions_for_all_accounts', 'interval': 30, 'jitter': 3, 'timeout': 300},
+    'position_changes_prune': {'func': 'core.reconcile.prune_position_changes', 'interval': 60, 'jitter': 5, 'timeout': 60},
+}
+TICK = 0.5  # seconds between scheduler checks
+
+
+class Job:
+    """A periodic sync function with its own interval, jitter, timeout and run statistics."""
+
+    def __init__(self, name, func, interval, jitter=0, timeout=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.next_run = time.monotonic()
+        self.running = False
+        self.timed_out = False
+        self.started_at = None
+        self.stats = {
+            'runs': 0,
+            'failures': 0,
+            'skipped': 0,
+            'timeouts': 0,
+            'last_started': None,
+            'last_finished': None,
+            'last_duration': None,
+            'last_rows': None,
+            'last_error': None,
+        }
 
+    def schedule_next(self):
+        self.next_run = time.monotonic() + self.interval + random.uniform(-self.jitter, self.jitter)
+
+    def run(self):
+        started = time.monotonic()
+        self.stats['last_started'] = time.time()
+        try:
+            result = self.func()
+            self.stats['last_rows'] = len(result) if isinstance(result, (list, tuple)) else result
+            self.stats['last_error'] = None
         except Exception as e:
-            print("Error fetching data:", e)
+            self.stats['failures'] += 1
+            self.stats['last_error'] = str(e)
+            logger.exception(f"Sync job {self.name} failed")
+        finally:
+            self.stats['runs'] += 1
+            self.stats['last_duration'] = round(time.monotonic() - started, 3)
+            self.stats['last_finished'] = time.time()
+            self.running = False
+            # Job threads are short-lived; don't leave their DB connections open
+            connections.close_all()
+
+
+class SyncScheduler:
+    """Runs sync jobs in-process; a job still running when it is due again is skipped."""
+
+    def __init__(self):
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, job):
+        self.jobs[job.name] = job
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='sync-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            for job in list(self.jobs.values()):
+                with self._lock:
+                    if job.running:
+                        if job.timeout and not job.timed_out and now - job.started_at > job.timeout:
+                            # Python threads can't be killed; flag it and keep skipping until it returns
+                            job.stats['timeouts'] += 1
+                            job.stats['last_error'] = f"still running after {job.timeout}s"
+                            job.timed_out = True
+                        if now >= job.next_run:
+                            job.stats['skipped'] += 1
+                            job.schedule_next()
+                        continue
+                    if now < job.next_run:
+                        continue
+                    job.running = True
+                    job.started_at = now
+                    job.timed_out = False
+                    job.schedule_next()
+                threading.Thread(target=job.run, name=f"sync-{job.name}", daemon=True).start()
+            self._stop.wait(TICK)
+
+    def status(self):
+        return {
+            name: {
+                'interval': job.interval,
+                'jitter': job.jitter,
+                'timeout': job.timeout,
+                'running': job.running,
+                'next_run_in': round(max(job.next_run - time.monotonic(), 0), 1),
+                **job.stats,
+            }
+            for name, job in self.jobs.items()
+        }
+
+
+scheduler = SyncScheduler()
+
+
+def _sync_function(name):
+    """Resolve a sync function (core.views name or dotted path) on first run, keeping app startup light."""
+    def run():
+        if '.' in name:
+            from django.utils.module_loading import import_string
+            return import_string(name)()
+        from . import views
+        return getattr(views, name)()
+    return run
+
+
+def build_scheduler():
+    """Register the sync jobs from DEFAULT_SCHEDULE merged with settings.SYNC_SCHEDULE."""
+    overrides = getattr(settings, 'SYNC_SCHEDULE', {})
+    for name, config in DEFAULT_SCHEDULE.items():
+        config = {**config, **overrides.get(name, {})}
+        if not config.get('enabled', True):
+            continue
+        scheduler.add(Job(
+            name,
+            _sync_function(config['func']),
+            interval=config['interval'],
+            jitter=config.get('jitter', 0),
+            timeout=config.get('timeout'),
+        ))
+    return scheduler
+
+
+def start_pump_thread():
+    """Subscribe to MT5 pump callbacks in the background (connecting can take a while)."""
+    def run():
+        try:
+            from .pump import start_pump_ingestion
+            start_pump_ingestion()
+        except Exception:
+            logger.exception("Error starting MT5 pump ingestion")
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def is_serving_process(argv=None):
+    """False for management commands (migrate, shell, test, backfills, benchmarks).
+
+    runserver counts as serving, but only in the autoreloader's child process.
+    """
+    argv = sys.argv if argv is None else argv
+    program = os.path.basename(argv[0]) if argv else ''
+    if program in ('manage.py', 'django-admin', 'django-admin.py', '__main__.py'):
+        if len(argv) < 2 or argv[1] != 'runserver':
+            return False
+        if '--noreload' not in argv and os.environ.get('RUN_MAIN') != 'true':
+            return False
+    return True
+
 
-        time.sleep(FETCH_INTERVAL)
+def should_run_scheduler(argv=None):
+    """True in the serving process unless settings.RMS_RUN_SCHEDULER turns it off."""
+    return is_serving_process(argv) and getattr(settings, 'RMS_RUN_SCHEDULER', True)
 
 
 def start_background_thread():
-    """Start the background thread as a daemon."""
-    thread = threading.Thread(target=fetch_data_periodically, daemon=True)
-    thread.start()
+    """Start the sync scheduler (and pump ingestion, if enabled) as daemons in the serving process."""
+    if not is_serving_process():
+        return
+    if not getattr(settings, 'RMS_RUN_SCHEDULER', True):
+        logger.warning(
+            "RMS_RUN_SCHEDULER is off: this process will not sync groups, accounts, open or closed "
+            "positions; make sure another process runs the scheduler"
+        )
+        return
+    logger.info("Starting the sync scheduler")
+    build_scheduler().start()
+    if getattr(settings, 'MT5_PUMP_INGESTION', False):
+        start_pump_thread()
@@ -1,3 +1,1033 @@
-from django.test import TestCase
+"""Behavioural tests for the sync, read and push paths.
 
-# Create your tests here.
+They need PostgreSQL (the writers use ON CONFLICT, COPY and advisory locks) and
+the offline MT5 simulator in place of MT5Manager:
+
+    MT5_SIMULATOR=1 python manage.py test core.tests
+"""
+import io
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import generation, live_sync, mt5_simulator, parallel, tasks, views
+from .events import Broker, Subscription
+from .mt5_pool import ManagerPool
+from .models import Accounts, BackfillCheckpoint, ClosedPositions, LoginSymbolTotals, OpenPositions, PositionChange
+from .mt5_simulator import MTDeal, MTPosition, MTUser
+from .pump import PumpSink
+from .reconcile import (
+    apply_position_changes, copy_closed_deals, delete_accounts, ingest_accounts, prune_position_changes,
+    reconcile_open_positions, store_closed_deals,
+)
+
+
+def make_account(login, group='real\\A', **fields):
+    return Accounts.objects.create(login=login, group=group, name=f"Trader {login}", **fields)
+
+
+def make_position(pos_id, symbol='EURUSD', volume=1.0, price=1.1, profit=0.0, type='Buy'):
+    """A position dict as returned by MT5Service.get_open_positions."""
+    return {'id': pos_id, 'symbol': symbol, 'volume': volume, 'price': price, 'profit': profit,
+            'type': type, 'date': 1_700_000_000}
+
+
+def simulated_book(test, **options):
+    """Swap in a fresh simulated MT5 book and session pool for the duration of ``test``."""
+    from .MT5Service import MT5Service
+    test.addCleanup(setattr, mt5_simulator, '_book', mt5_simulator._book)
+    test.addCleanup(MT5Service.reset_shared_manager)
+    MT5Service.reset_shared_manager()
+    return mt5_simulator.configure(**options)
+
+
+def simulated_service(test, **options):
+    """An MT5Service on a fresh simulated book: ``(svc, book, calls)``, ``calls()`` counting MT5 calls per method."""
+    from collections import Counter
+    from .MT5Service import MT5Service
+    book = simulated_book(test, **options)
+
+    def calls():
+        counts = Counter()
+        for session in (MT5Service.pool_status() or {'sessions': []})['sessions']:
+            counts.update(session['by_method'])
+        return counts
+    return MT5Service(host='simulator', port=443, login=1, password='simulator'), book, calls
+
+
+def make_deal(login, position, time, deal=None, symbol='EURUSD', volume=10000, price=1.1, profit=5.0):
+    return MTDeal(Deal=deal or position, Login=login, PositionID=position, Symbol=symbol, Action=0, Entry=1,
+                  Volume=volume, VolumeClosed=volume, Price=price, Profit=profit, Time=time)
+
+
+class MatrixTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        lots = {
+            1001: {'XAUUSD': '3.00', 'EURUSD': '1.00'},
+            1002: {'XAUUSD': '-2.00'},
+            1003: {'XAUUSD': '7.50', 'EURUSD': '-4.00'},
+            1004: {'EURUSD': '2.00'},
+        }
+        for login, symbols in lots.items():
+            account = make_account(login)
+            for symbol, lot in symbols.items():
+                LoginSymbolTotals.objects.create(
+                    login=account, symbol=symbol, open_count=1, open_lot=Decimal(lot),
+                    open_usd=Decimal('10.00'), updated_at=now,
+                )
+
+    def get(self, **params):
+        response = self.client.get('/api/matrix/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_sparse_cells_and_totals(self):
+        data = self.get()
+        self.assertEqual(data['symbols'], ['EURUSD', 'XAUUSD'])
+        self.assertEqual(data['totals'], [-1.0, 8.5])
+        self.assertEqual(data['logins'], [1001, 1002, 1003, 1004])
+        self.assertEqual(data['total_logins'], 4)
+        cells = {(data['logins'][r], data['symbols'][c]): v for r, c, v in data['cells']}
+        self.assertEqual(cells[(1003, 'EURUSD')], -4.0)
+        self.assertNotIn((1002, 'EURUSD'), cells)
+        self.assertEqual(len(cells), 6)
+
+    def test_sort_by_symbol_ascending(self):
+        data = self.get(sort='XAUUSD')
+        # Logins without an XAUUSD position sort last
+        self.assertEqual(data['logins'], [1002, 1001, 1003, 1004])
+
+    def test_sort_by_symbol_descending(self):
+        data = self.get(sort='-XAUUSD')
+        self.assertEqual(data['logins'], [1003, 1001, 1002, 1004])
+
+    def test_paging_over_logins(self):
+        first = self.get(sort='-XAUUSD', page_size=2)
+        second = self.get(sort='-XAUUSD', page_size=2, page=2)
+        self.assertEqual(first['logins'] + second['logins'], [1003, 1001, 1002, 1004])
+        self.assertEqual(second['total_logins'], 4)
+
+    def test_unknown_sort_column_is_a_client_error(self):
+        response = self.client.get('/api/matrix/', {'sort': 'NOPE'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ClosedDealWriterTests(TestCase):
+    NEWER = 1_700_000_600
+    OLDER = 1_700_000_000
+
+    def setUp(self):
+        make_account(2001)
+
+    def assertKeepsNewest(self, write):
+        write({2001: [make_deal(2001, 55, self.NEWER, deal=2, profit=20.0)]})
+        summary = write({2001: [make_deal(2001, 55, self.OLDER, deal=1, profit=-3.0)]})
+        self.assertEqual(summary['stored'], 0)
+        row = ClosedPositions.objects.get(login__login=2001, position=55)
+        self.assertEqual((row.deal_id, row.profit), (2, Decimal('20.00')))
+
+        write({2001: [make_deal(2001, 55, self.NEWER + 60, deal=3, profit=7.0)]})
+        self.assertEqual(ClosedPositions.objects.get(login__login=2001, position=55).deal_id, 3)
+
+    def test_insert_path_keeps_the_newest_closing_deal(self):
+        self.assertKeepsNewest(store_closed_deals)
+
+    def test_copy_path_keeps_the_newest_closing_deal(self):
+        self.assertKeepsNewest(copy_closed_deals)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = make_account(3001)
+        closed = timezone.now().replace(microsecond=0)
+        # Two rows share each closing time so chunks split inside a date_closed tie
+        cls.rows = [
+            ClosedPositions.objects.create(
+                login=account, position=n, deal_id=n, symbol='EURUSD', volume=Decimal('1.00'),
+                price=Decimal('1.10000'), profit=Decimal(n), position_type='Buy',
+                date_closed=closed + timedelta(seconds=n // 2),
+            )
+            for n in range(1, 8)
+        ]
+
+    def test_ndjson_export_spans_chunks_in_order(self):
+        with mock.patch('core.views.EXPORT_CHUNK_SIZE', 3):
+            response = self.client.get('/api/positions/closed/export/')
+            body = b''.join(response.streaming_content).decode()
+        deals = [json.loads(line)['deal_id'] for line in body.splitlines()]
+        self.assertEqual(deals, list(range(1, 8)))
+
+    async def test_csv_export_streams_asynchronously_under_asgi(self):
+        with mock.patch('core.views.EXPORT_CHUNK_SIZE', 3):
+            response = await self.async_client.get('/api/positions/closed/export/', {'format': 'csv'})
+            self.assertTrue(response.is_async)
+            body = ''.join([chunk.decode() async for chunk in response.streaming_content])
+        lines = body.splitlines()
+        self.assertTrue(lines[0].startswith('login__login,deal_id'))
+        self.assertEqual([int(line.split(',')[1]) for line in lines[1:]], list(range(1, 8)))
+
+
+class GenerationTests(TestCase):
+    def setUp(self):
+        generation._last_bump = 0.0
+        generation._trailing = None
+        cache.delete(generation.GENERATION_KEY)
+
+    def test_bump_advances_the_shared_row_on_commit(self):
+        before = generation.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            generation.bump()
+            self.assertEqual(generation.current(), before)
+        self.assertEqual(generation.current(), before + 1)
+        self.assertIsNotNone(generation.updated_at())
+
+    def test_bumps_within_the_interval_fold_into_one_trailing_bump(self):
+        before = generation.current()
+        with mock.patch('core.generation.threading.Timer') as timer:
+            for _ in range(3):
+                generation._bump()
+        self.assertEqual(generation.current(), before + 1)
+        timer.assert_called_once()
+        self.assertEqual(timer.call_args.args[1], generation._trailing_bump)
+
+    def test_polls_are_served_from_the_cache(self):
+        before = generation.current()
+        with self.assertNumQueries(0):
+            self.assertEqual(generation.current(), before)
+        cache.delete(generation.GENERATION_KEY)
+        with self.assertNumQueries(1):
+            self.assertEqual(generation.current(), before)
+
+
+class KeysetCursorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        account = make_account(4001)
+        closed = timezone.now().replace(microsecond=500000)
+        # Rows apart by microseconds only, inserted so ids run against the sort
+        for n, micros in enumerate([900, 300, 600, 100, 400], start=1):
+            ClosedPositions.objects.create(
+                login=account, position=n, deal_id=n, symbol='EURUSD', volume=Decimal('1.00'),
+                price=Decimal('1.10000'), profit=Decimal('0.00'), position_type='Buy',
+                date_closed=closed + timedelta(microseconds=micros),
+            )
+
+    def walk(self, sort):
+        deals, cursor = [], None
+        for _ in range(10):
+            params = {'sort': sort, 'limit': 2, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get('/api/positions/closed/', params)
+            self.assertEqual(response.status_code, 200, response.content)
+            data = response.json()
+            deals += [row['deal_id'] for row in data['closed_positions']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                return deals
+        self.fail(f"Paging did not finish: {deals}")
+
+    def test_pages_split_inside_a_millisecond(self):
+        self.assertEqual(self.walk('date_closed'), [4, 2, 5, 3, 1])
+        self.assertEqual(self.walk('-date_closed'), [1, 3, 5, 2, 4])
+
+    def test_cursor_for_another_sort_is_rejected(self):
+        first = self.client.get('/api/positions/closed/', {'sort': 'date_closed', 'limit': 2}).json()
+        response = self.client.get('/api/positions/closed/', {'sort': 'symbol', 'cursor': first['next_cursor']})
+        self.assertEqual(response.status_code, 400)
+
+    def test_out_of_range_dates_are_rejected(self):
+        for value in ('2024-13-45', '2024-02-30T10:00'):
+            response = self.client.get('/api/accounts/db/', {'date_from': value})
+            self.assertEqual(response.status_code, 400, value)
+            self.assertEqual(response.json(), {'error': f"Invalid date '{value}'"})
+
+
+class ReconcileOpenPositionsTests(TestCase):
+    def setUp(self):
+        self.account = make_account(5001)
+        make_account(5002)
+
+    def test_diff_updates_inserts_and_deletes(self):
+        first = reconcile_open_positions({5001: [
+            make_position(1), make_position(2), make_position(3, symbol='XAUUSD', volume=2.0, price=2000),
+        ]})
+        self.assertEqual(first['inserted'], 3)
+
+        second = reconcile_open_positions({5001: [
+            make_position(2, volume=3.0),  # structural change
+            make_position(4),
+        ]})
+        self.assertEqual((second['inserted'], second['updated'], second['deleted']), (1, 1, 2))
+        rows = {p.position_id: p for p in OpenPositions.objects.filter(login=self.account)}
+        self.assertEqual(set(rows), {2, 4})
+        self.assertEqual(rows[2].volume, Decimal('3.00'))
+        totals = dict(LoginSymbolTotals.objects.filter(login=self.account).values_list('symbol', 'open_lot'))
+        self.assertEqual(totals, {'EURUSD': Decimal('4.00')})
+
+    def test_change_log_orders_deletes_before_upserts(self):
+        reconcile_open_positions({5001: [make_position(1), make_position(2)]})
+        reconcile_open_positions({5001: [make_position(2, volume=2.0)]})
+        changes = list(PositionChange.objects.order_by('version').values_list('position_id', 'action'))
+        self.assertEqual(changes, [(1, 'upsert'), (2, 'upsert'), (1, 'delete'), (2, 'upsert')])
+
+    def test_empty_list_removes_the_accounts_positions(self):
+        reconcile_open_positions({5001: [make_position(1)], 5002: [make_position(2)]})
+        summary = reconcile_open_positions({5001: []})
+        self.assertEqual(summary['deleted'], 1)
+        self.assertEqual(list(OpenPositions.objects.values_list('position_id', flat=True)), [2])
+
+    def test_unknown_logins_are_counted_not_written(self):
+        summary = reconcile_open_positions({9999: [make_position(1)]})
+        self.assertEqual(summary['missing_accounts'], 1)
+        self.assertFalse(OpenPositions.objects.exists())
+
+
+class PriceRefreshTests(TestCase):
+    def setUp(self):
+        self.account = make_account(5051)
+        reconcile_open_positions({5051: [make_position(1), make_position(2)]})
+
+    def test_price_only_moves_skip_the_upsert(self):
+        with mock.patch('core.reconcile.OpenPositions.objects.bulk_create') as bulk_create:
+            summary = reconcile_open_positions({5051: [make_position(1, price=1.2, profit=10), make_position(2)]})
+        bulk_create.assert_not_called()
+        self.assertEqual((summary['refreshed'], summary['unchanged'], summary['updated']), (1, 1, 0))
+        row = OpenPositions.objects.get(position_id=1)
+        self.assertEqual((row.price, row.profit), (Decimal('1.20000'), Decimal('10.00')))
+
+    def test_price_moves_are_pushed_but_not_logged(self):
+        logged = PositionChange.objects.count()
+        with mock.patch('core.reconcile.events.broker.listening', return_value=True), \
+                mock.patch('core.reconcile.events.publish') as publish:
+            reconcile_open_positions({5051: [make_position(1, price=1.2, profit=10), make_position(2)]})
+        self.assertEqual(PositionChange.objects.count(), logged)
+        publish.assert_called_once_with(
+            'positions', {'prices': [{'position_id': 1, 'login': 5051, 'price': Decimal('1.20000'),
+                                      'profit': Decimal('10.00')}]},
+            logins={5051},
+        )
+
+    def test_pump_price_updates_are_not_logged(self):
+        logged = PositionChange.objects.order_by('-version').values_list('version', flat=True).first()
+        apply_position_changes({1: (5051, make_position(1, price=1.25)), 3: (5051, make_position(3))})
+        self.assertEqual(list(PositionChange.objects.filter(version__gt=logged).values_list('position_id', flat=True)),
+                         [3])
+        self.assertEqual(OpenPositions.objects.get(position_id=1).price, Decimal('1.25000'))
+
+    def test_moving_a_position_to_another_account_is_an_update(self):
+        make_account(5052)
+        reconcile_open_positions({5051: [make_position(2)], 5052: [make_position(1)]})
+        self.assertEqual(OpenPositions.objects.get(position_id=1).login.login, 5052)
+
+
+class FingerprintTests(TestCase):
+    def setUp(self):
+        make_account(5101)
+
+    def test_unchanged_positions_are_skipped(self):
+        positions = {5101: [make_position(1), make_position(2)]}
+        reconcile_open_positions(positions)
+        logged = PositionChange.objects.count()
+        summary = reconcile_open_positions(positions)
+        self.assertEqual((summary['skipped'], summary['unchanged']), (1, 2))
+        self.assertEqual(PositionChange.objects.count(), logged)
+
+    def test_pump_writes_force_a_full_diff(self):
+        reconcile_open_positions({5101: [make_position(1)]})
+        apply_position_changes({2: (5101, make_position(2))})
+        self.assertIsNone(Accounts.objects.get(login=5101).positions_fingerprint)
+        summary = reconcile_open_positions({5101: [make_position(1)]})
+        self.assertEqual((summary['skipped'], summary['deleted']), (0, 1))
+
+    def test_unchanged_accounts_are_skipped(self):
+        def account(login, balance):
+            return {'login': login, 'name': f"Trader {login}", 'group': 'real\\A', 'leverage': 100,
+                    'balance': balance, 'equity': balance}
+
+        self.assertEqual(ingest_accounts([account(5101, 100), account(5102, 100)])['inserted'], 1)
+        summary = ingest_accounts([account(5101, 100), account(5102, 250)])
+        self.assertEqual((summary['inserted'], summary['updated'], summary['skipped']), (0, 1, 1))
+        self.assertEqual(Accounts.objects.get(login=5102).balance, Decimal('250.00'))
+
+    def test_fingerprints_stay_out_of_the_accounts_api(self):
+        for params in ({}, {'limit': 10}):
+            account = self.client.get('/api/accounts/db/', params).json()['accounts'][0]
+            self.assertEqual(set(account), set(views.ACCOUNT_VALUES), params)
+
+    def test_untracked_tables_are_left_alone_by_their_migration(self):
+        from django.db import connection
+        from django.db.migrations.loader import MigrationLoader
+        loader = MigrationLoader(connection)
+        state = loader.project_state(('core', '0001_initial'))
+        for operation in loader.get_migration('core', '0002_untracked_models').operations:
+            new_state = state.clone()
+            operation.state_forwards('core', new_state)
+            with connection.schema_editor() as editor:
+                operation.database_forwards('core', editor, state, new_state)  # the tables already exist
+            state = new_state
+
+
+class PumpSinkTests(TestCase):
+    def setUp(self):
+        make_account(7001)
+        self.sink = PumpSink(manager=None)
+        # flush() runs on its own thread in production; here it would close the test's connection
+        patcher = mock.patch('core.pump.close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def position(self, pos_id, login=7001, volume=10000):
+        return MTPosition(Login=login, Position=pos_id, Symbol='EURUSD', Action=0, Volume=volume,
+                          PriceOpen=1.1, PriceCurrent=1.1, Profit=0.0, TimeCreate=1_700_000_000)
+
+    def stored(self):
+        return dict(OpenPositions.objects.values_list('position_id', 'volume'))
+
+    def test_flush_keeps_the_last_event_per_position(self):
+        self.sink.OnPositionAdd(self.position(1))
+        self.sink.OnPositionUpdate(self.position(1, volume=30000))
+        self.sink.OnPositionAdd(self.position(2))
+        self.sink.OnPositionDelete(self.position(2))
+        self.sink.OnPositionAdd(self.position(3))
+        with mock.patch('core.pump.apply_position_changes', wraps=apply_position_changes) as apply:
+            self.assertEqual(self.sink.flush(), 5)
+        apply.assert_called_once()
+        upserts, deletes, cleaned = apply.call_args.args
+        self.assertEqual((set(upserts), deletes, cleaned), ({1, 3}, {2}, set()))
+        self.assertEqual(self.stored(), {1: Decimal('3.00'), 3: Decimal('1.00')})
+        self.assertEqual(self.sink.flush(), 0)
+
+    def test_clean_drops_earlier_events_of_the_login(self):
+        reconcile_open_positions({7001: [make_position(4)]})
+        self.sink.OnPositionAdd(self.position(5))
+        self.sink.OnPositionClean(7001)
+        self.sink.OnPositionAdd(self.position(6))
+        self.sink.flush()
+        self.assertEqual(set(self.stored()), {6})
+
+    def test_new_user_is_stored_before_its_positions(self):
+        self.sink.OnUserAdd(MTUser(Login=7002, Name='New Trader', Group='real\\B', Leverage=100))
+        self.sink.OnPositionAdd(self.position(7, login=7002))
+        self.sink.flush()
+        self.assertEqual(Accounts.objects.get(login=7002).group, 'real\\B')
+        self.assertEqual(OpenPositions.objects.get(position_id=7).login.login, 7002)
+
+
+class ExposureTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        created = timezone.now()
+        positions = [
+            (9001, 'real\\A', 'EURUSD', 'Buy', '1.00', '10.00'),
+            (9001, 'real\\A', 'EURUSD', 'Sell', '0.50', '-4.00'),
+            (9001, 'real\\A', 'XAUUSD', 'Buy', '2.00', '5.00'),
+            (9002, 'real\\B', 'EURUSD', 'Buy', '3.00', '1.00'),
+        ]
+        accounts = {}
+        for n, (login, group, symbol, side, volume, profit) in enumerate(positions, start=1):
+            if login not in accounts:
+                accounts[login] = make_account(login, group=group)
+            OpenPositions.objects.create(
+                login=accounts[login], position_id=n, symbol=symbol, volume=Decimal(volume),
+                price=Decimal('1.00000'), profit=Decimal(profit), position_type=side, date_created=created,
+            )
+
+    def test_lots_and_profit_per_symbol(self):
+        data = self.client.get('/api/exposure/').json()['data']
+        self.assertEqual(data, [
+            {'symbol': 'EURUSD', 'buy_lots': 4.0, 'sell_lots': 0.5, 'net_lots': 3.5, 'positions': 3, 'profit': 7.0},
+            {'symbol': 'XAUUSD', 'buy_lots': 2.0, 'sell_lots': 0.0, 'net_lots': 2.0, 'positions': 1, 'profit': 5.0},
+        ])
+
+    def test_breakdown_by_group(self):
+        data = self.client.get('/api/exposure/', {'by': 'group', 'symbol': 'EURUSD'}).json()['data']
+        self.assertEqual([(row['group'], row['net_lots'], row['positions']) for row in data],
+                         [('real\\A', 0.5, 2), ('real\\B', 3.0, 1)])
+
+    def test_unknown_breakdown_is_a_client_error(self):
+        self.assertEqual(self.client.get('/api/exposure/', {'by': 'desk'}).status_code, 400)
+
+
+class ETagTests(TestCase):
+    def setUp(self):
+        generation._last_bump = 0.0
+        generation._trailing = None
+        cache.delete(generation.GENERATION_KEY)
+        account = make_account(9101)
+        OpenPositions.objects.create(
+            login=account, position_id=1, symbol='EURUSD', volume=Decimal('1.00'), price=Decimal('1.00000'),
+            position_type='Buy', date_created=timezone.now(),
+        )
+
+    def test_etag_answers_not_modified_until_the_data_changes(self):
+        etag = self.client.get('/api/exposure/')['ETag']
+        self.assertEqual(etag, f'W/"{generation.current()}"')
+        self.assertEqual(self.client.get('/api/exposure/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            generation.bump()
+        response = self.client.get('/api/exposure/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_group_sync_moves_the_groups_etag(self):
+        from .MT5Service import MT5Service
+        book = simulated_book(self, accounts=4, groups=2)
+        etag = self.client.get('/api/groups/db/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(MT5Service().sync_groups())
+        response = self.client.get('/api/groups/db/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.json()['groups']), book.groups)
+
+
+class PositionChangesTests(TestCase):
+    def setUp(self):
+        make_account(5201)
+        make_account(5202)
+        reconcile_open_positions({5201: [make_position(1), make_position(2)]})
+        reconcile_open_positions({5202: [make_position(10)]})
+        self.versions = list(PositionChange.objects.order_by('version').values_list('version', flat=True))
+
+    def get(self, **params):
+        response = self.client.get('/api/positions/changes/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_without_since_returns_a_snapshot_at_the_latest_version(self):
+        data = self.get()
+        self.assertEqual((data['mode'], data['version']), ('snapshot', self.versions[-1]))
+        self.assertEqual(sorted(p['position_id'] for p in data['positions']), [1, 2, 10])
+
+    def test_changes_after_since_in_version_order(self):
+        data = self.get(since=self.versions[0])
+        self.assertEqual(data['mode'], 'changes')
+        self.assertEqual([c['position_id'] for c in data['changes']], [2, 10])
+        self.assertEqual((data['version'], data['has_more']), (self.versions[-1], False))
+
+        data = self.get(since=self.versions[0], login=5202)
+        self.assertEqual([c['position_id'] for c in data['changes']], [10])
+        self.assertEqual(data['version'], self.versions[-1])
+
+    def test_up_to_date_client_gets_no_changes(self):
+        data = self.get(since=self.versions[-1])
+        self.assertEqual((data['mode'], data['changes'], data['version']), ('changes', [], self.versions[-1]))
+
+    def test_client_behind_the_pruned_log_gets_a_snapshot(self):
+        PositionChange.objects.filter(version__lte=self.versions[1]).update(
+            created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(prune_position_changes(), 2)
+        self.assertEqual(self.get(since=self.versions[0])['mode'], 'snapshot')
+        self.assertEqual(self.get(since=self.versions[1])['mode'], 'changes')
+
+    def test_prune_leaves_no_gap_when_timestamps_and_versions_disagree(self):
+        # The second change got an older created_at than the first
+        PositionChange.objects.filter(version=self.versions[1]).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(prune_position_changes(), 2)
+        self.assertEqual(list(PositionChange.objects.values_list('version', flat=True)), self.versions[2:])
+        self.assertEqual(self.get(since=self.versions[0])['mode'], 'snapshot')
+
+    def test_prune_keeps_the_latest_version(self):
+        PositionChange.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        prune_position_changes()
+        self.assertEqual(list(PositionChange.objects.values_list('version', flat=True)), self.versions[-1:])
+
+
+class DeleteAccountsTests(TestCase):
+    def setUp(self):
+        make_account(5301)
+        make_account(5302)
+        reconcile_open_positions({5301: [make_position(1), make_position(2)], 5302: [make_position(3)]})
+        self.since = PositionChange.objects.order_by('-version').values_list('version', flat=True).first()
+
+    def changes(self):
+        return self.client.get('/api/positions/changes/', {'since': self.since}).json()
+
+    def test_cascaded_positions_are_logged_as_deletes(self):
+        self.assertEqual(delete_accounts(Accounts.objects.filter(login=5301)), 1)
+        data = self.changes()
+        self.assertEqual(data['mode'], 'changes')
+        self.assertEqual(sorted((c['login'], c['position_id'], c['action']) for c in data['changes']),
+                         [(5301, 1, 'delete'), (5301, 2, 'delete')])
+        self.assertEqual(list(OpenPositions.objects.values_list('position_id', flat=True)), [3])
+
+    def test_server_settings_change_clears_delta_clients(self):
+        with mock.patch.dict('sys.modules', {'adminPanel': None}):
+            response = self.client.put('/api/server/settings/', {
+                'server_ip': '10.0.0.1:443', 'login_id': '1', 'server_password': 'x', 'server_name': 'Demo',
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(Accounts.objects.exists())
+        self.assertEqual(sorted(c['position_id'] for c in self.changes()['changes']), [1, 2, 3])
+
+
+class BrokerHistoryTests(SimpleTestCase):
+    def listening_broker(self, topics=('positions', 'accounts'), **kwargs):
+        broker = Broker(**kwargs)
+        broker.subscribe(mock.Mock(), topics)
+        return broker
+
+    def test_since_replays_missed_events(self):
+        broker = self.listening_broker()
+        first = broker.publish('positions', {'n': 1})
+        second = broker.publish('accounts', {'n': 2})
+        third = broker.publish('positions', {'n': 3})
+        self.assertEqual([e['id'] for e in broker.since(first)], [second, third])
+        self.assertEqual(broker.since(third), [])
+        self.assertEqual([e['id'] for e in broker.since(broker.first_id - 1)], [first, second, third])
+
+    def test_since_is_none_when_events_were_dropped_or_unknown(self):
+        broker = self.listening_broker(history_size=2)
+        ids = [broker.publish('positions', {'n': n}) for n in range(4)]
+        self.assertIsNone(broker.since(ids[0]))
+        self.assertEqual([e['id'] for e in broker.since(ids[1])], ids[2:])
+        # An id from the future, e.g. from before a restart with a slower clock
+        self.assertIsNone(broker.since(ids[-1] + 1))
+
+    def test_unwatched_topics_keep_only_ids(self):
+        broker = self.listening_broker(topics=['accounts'])
+        first = broker.publish('accounts', {'accounts': [{'login': 1}]})
+        broker.publish('positions', {'upserts': [{'login': 1, 'position_id': n} for n in range(500)]})
+        third = broker.publish('accounts', {'accounts': [{'login': 2}]})
+        self.assertEqual(broker.status()['history_rows'], 2)
+        # Accounts clients replay, positions clients must reload
+        self.assertEqual([e['id'] for e in broker.since(first, ['accounts']) if e['data']], [third])
+        self.assertIsNone(broker.since(first, ['positions']))
+
+    def test_history_is_capped_by_rows(self):
+        broker = self.listening_broker(history_rows=10)
+        ids = [broker.publish('positions', {'upserts': [{'login': 1}] * 4}) for _ in range(4)]
+        self.assertEqual(broker.status()['history'], 2)
+        self.assertEqual(broker.status()['history_rows'], 8)
+        self.assertIsNone(broker.since(ids[0]))
+        self.assertEqual([e['id'] for e in broker.since(ids[1])], ids[2:])
+
+    def test_render_keeps_only_the_subscribed_logins(self):
+        subscription = Subscription(None, ['positions'], [5001])
+        event = {'id': 7, 'topic': 'positions', 'logins': {5001, 5002}, 'data': {
+            'version': 3,
+            'upserts': [{'login': 5001, 'position_id': 1}, {'login': 5002, 'position_id': 2}],
+            'deletes': [{'login': 5002, 'position_id': 3}],
+        }}
+        frame = subscription.render(event)
+        self.assertTrue(frame.startswith('id: 7\nevent: positions\n'))
+        data = json.loads(frame.split('data: ', 1)[1])
+        self.assertEqual(data, {'version': 3, 'upserts': [{'login': 5001, 'position_id': 1}], 'deletes': []})
+        self.assertIsNone(subscription.render({**event, 'logins': {5002}}))
+
+
+class ClosedSyncWatermarkTests(TestCase):
+    def test_watermark_follows_mt5_server_time(self):
+        account = make_account(8001)
+        # Hours away from the host clock, as on a trade server in another timezone
+        server_now = datetime(2026, 3, 2, 15, 0, tzinfo=dt_timezone.utc)
+        svc = mock.Mock()
+        svc.server_time.return_value = server_now
+        svc.get_closed_trades.return_value = [make_deal(8001, 91, int(server_now.timestamp()) - 120)]
+
+        result = views.sync_closed_positions_for_account(svc, account)
+        self.assertEqual(result['stored'], 1)
+        self.assertEqual(Accounts.objects.get(pk=account.pk).last_closed_sync, server_now)
+        self.assertEqual(svc.get_closed_trades.call_args.kwargs, {
+            'from_date': int((server_now - timedelta(days=views.CLOSED_SYNC_INITIAL_DAYS)).timestamp()),
+            'to_date': int(server_now.timestamp()),
+        })
+
+        # The next run starts from the watermark, less the overlap
+        views.sync_closed_positions_for_account(svc, account)
+        self.assertEqual(svc.get_closed_trades.call_args.kwargs['from_date'],
+                         int((server_now - views.CLOSED_SYNC_OVERLAP).timestamp()))
+
+    def test_no_server_time_leaves_the_watermark_alone(self):
+        account = make_account(8002)
+        svc = mock.Mock()
+        svc.server_time.return_value = None
+        with self.assertRaises(Exception):
+            views.sync_closed_positions_for_account(svc, account)
+        svc.get_closed_trades.assert_not_called()
+        self.assertIsNone(Accounts.objects.get(pk=account.pk).last_closed_sync)
+
+
+class SchedulerGatingTests(SimpleTestCase):
+    def test_only_the_serving_process_runs_it(self):
+        self.assertTrue(tasks.should_run_scheduler(['/usr/bin/gunicorn', 'asgi:application']))
+        self.assertTrue(tasks.should_run_scheduler(['manage.py', 'runserver', '--noreload']))
+        for argv in (['manage.py', 'migrate'], ['manage.py', 'test'], ['django-admin', 'shell'], ['manage.py']):
+            self.assertFalse(tasks.should_run_scheduler(argv), argv)
+
+    def test_runserver_runs_it_in_the_reloader_child_only(self):
+        with mock.patch.dict('os.environ', {'RUN_MAIN': ''}):
+            self.assertFalse(tasks.should_run_scheduler(['manage.py', 'runserver']))
+        with mock.patch.dict('os.environ', {'RUN_MAIN': 'true'}):
+            self.assertTrue(tasks.should_run_scheduler(['manage.py', 'runserver']))
+
+    @override_settings(RMS_RUN_SCHEDULER=False)
+    def test_setting_opts_out_with_a_warning(self):
+        self.assertFalse(tasks.should_run_scheduler(['/usr/bin/gunicorn', 'asgi:application']))
+        with mock.patch.object(tasks.sys, 'argv', ['/usr/bin/gunicorn']), \
+                mock.patch.object(tasks, 'build_scheduler') as build, self.assertLogs('core.tasks', 'WARNING'):
+            tasks.start_background_thread()
+        build.assert_not_called()
+
+    @override_settings(RMS_RUN_SCHEDULER=True, MT5_PUMP_INGESTION=False)
+    def test_serving_process_starts_it(self):
+        with mock.patch.object(tasks.sys, 'argv', ['/usr/bin/gunicorn']), \
+                mock.patch.object(tasks, 'build_scheduler') as build:
+            tasks.start_background_thread()
+        build.return_value.start.assert_called_once()
+
+
+class SyncJobTests(SimpleTestCase):
+    def test_failures_are_counted_and_logged(self):
+        def fail():
+            raise RuntimeError("MT5 down")
+
+        job = tasks.Job('broken', fail, interval=5)
+        job.running = True
+        with self.assertLogs('core.tasks', 'ERROR') as logs:
+            job.run()
+        self.assertIn('Sync job broken failed', logs.output[0])
+        self.assertIn('RuntimeError: MT5 down', logs.output[0])  # with the traceback
+        self.assertEqual((job.stats['runs'], job.stats['failures'], job.stats['last_error']), (1, 1, 'MT5 down'))
+        self.assertFalse(job.running)
+
+    def test_rows_of_a_successful_run_are_recorded(self):
+        job = tasks.Job('ok', lambda: [1, 2, 3], interval=5)
+        job.run()
+        self.assertEqual((job.stats['last_rows'], job.stats['last_error']), (3, None))
+
+
+class BackfillTests(TestCase):
+    def setUp(self):
+        self.book = simulated_book(self, accounts=6, groups=2, positions_per_account=0, deals_per_account=10)
+        for login, user in self.book.users.items():
+            make_account(login, group=user.Group)
+        today = datetime.fromtimestamp(self.book.now, dt_timezone.utc).date()
+        self.date_from = (today - timedelta(days=20)).isoformat()
+        self.day = lambda days_ago: (today - timedelta(days=days_ago)).isoformat()
+
+    def backfill(self, *args):
+        from .MT5Service import MT5Service
+        with mock.patch.object(MT5Service, 'get_closed_trades_by_group',
+                               autospec=True, side_effect=MT5Service.get_closed_trades_by_group) as fetch:
+            call_command('backfill_closed_positions', '--from', self.date_from, '--chunk-days', '5',
+                         '--groups', *self.book.groups, *args, stdout=mock.Mock())
+        return sorted((call.args[1][0], call.kwargs['from_date']) for call in fetch.call_args_list)
+
+    def test_rerun_resumes_and_extends_the_last_window(self):
+        self.assertEqual(len(self.backfill('--to', self.day(6))), 6)  # 2 groups x 3 windows
+        stored = ClosedPositions.objects.count()
+        self.assertGreater(stored, 0)
+        self.assertEqual(self.backfill('--to', self.day(6)), [])
+
+        # A later end keeps the job name: only the window the earlier end cut short is fetched again
+        fetched = self.backfill('--to', self.day(5))
+        last_start = int(datetime.fromisoformat(self.day(10)).replace(tzinfo=dt_timezone.utc).timestamp())
+        self.assertEqual(fetched, [(group, last_start) for group in self.book.groups])
+        self.assertEqual(BackfillCheckpoint.objects.values('job').distinct().count(), 1)
+        self.assertEqual(BackfillCheckpoint.objects.count(), 6)
+        self.assertEqual(set(BackfillCheckpoint.objects.filter(window_start__date=self.day(10))
+                             .values_list('window_end__date', flat=True)),
+                         {datetime.fromisoformat(self.day(5)).date()})
+        self.assertGreaterEqual(ClosedPositions.objects.count(), stored)
+
+
+class SimulatorTests(SimpleTestCase):
+    def setUp(self):
+        self.book = simulated_book(self, accounts=12, groups=3, deals_per_account=10)
+        self.mgr = mt5_simulator.ManagerAPI()
+        self.assertTrue(self.mgr.Connect('simulator', 1, 'x'))
+
+    def test_group_requests_match_the_per_login_ones(self):
+        group = self.book.groups[1]
+        logins = sorted(login for login, user in self.book.users.items() if user.Group == group)
+        self.assertEqual(sorted({u.Login for u in self.mgr.UserGetByGroup(group)}), logins)
+        self.assertEqual(len(self.mgr.UserGetByGroup('real\\*,!' + group)), len(self.book.users) - len(logins))
+
+        end = self.mgr.TimeServer()
+        start = end - 86400 * mt5_simulator.HISTORY_DAYS
+        by_login = sorted(d.Deal for login in logins for d in self.mgr.DealRequest(login, start, end))
+        self.assertTrue(by_login)
+        self.assertEqual(sorted(d.Deal for d in self.mgr.DealRequestByGroup(group, start, end)), by_login)
+        self.assertEqual(self.mgr.calls['DealRequestByGroup'], 1)
+
+    def test_disabled_methods_and_errors(self):
+        self.book.disabled_methods.add('DealRequestByGroup')
+        self.assertFalse(hasattr(self.mgr, 'DealRequestByGroup'))
+        self.book.error_rate = 1.0
+        self.assertFalse(self.mgr.UserGet(mt5_simulator.FIRST_LOGIN))
+        self.assertEqual(mt5_simulator.LastError()[0], mt5_simulator.MT_RET_ERR_NETWORK)
+
+    def test_benchmark_runs_every_read_path(self):
+        out = io.StringIO()
+        call_command('mt5_benchmark', '--accounts', '30', '--groups', '3', '--window-hours', '720', stdout=out)
+        output = out.getvalue()
+        self.assertNotIn('failed', output)
+        for name in ('list_accounts_by_groups', 'get_open_positions_by_group', 'get_closed_trades_by_group'):
+            self.assertRegex(output, rf'{name} +[\d.]+s  rows=\d+ +mt5_calls=\d+')
+        self.assertRegex(output, r'list_accounts_by_groups .* rows=30 ')
+
+
+class LiveSyncRegistryTests(SimpleTestCase):
+    def test_concurrent_requests_share_one_refresh(self):
+        release = threading.Event()
+
+        def refresh(login_id):
+            release.wait(5)
+            return {'login': login_id}
+
+        registry = live_sync.LiveSyncRegistry(refresh=refresh, interval=3600)
+        results = []
+        requests = [threading.Thread(target=lambda: results.append(registry.get('42'))) for _ in range(5)]
+        for thread in requests:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in requests:
+            thread.join(5)
+        self.assertEqual(results, [{'login': 42}] * 5)
+        self.assertEqual(registry.status(), {'watched_logins': [42], 'workers': 1, 'mt5_refreshes': 1})
+
+        # A request within max_age reuses the result
+        self.assertEqual(registry.get(42), {'login': 42})
+        self.assertEqual(registry.mt5_refreshes, 1)
+
+    def test_failed_refresh_is_raised_and_retried(self):
+        refresh = mock.Mock(side_effect=[RuntimeError('MT5 down'), {'ok': True}])
+        registry = live_sync.LiveSyncRegistry(refresh=refresh, interval=3600)
+        with self.assertRaisesMessage(RuntimeError, 'MT5 down'):
+            registry.get(7)
+        self.assertEqual(registry.get(7), {'ok': True})
+        self.assertEqual(refresh.call_count, 2)
+
+    def test_idle_workers_expire(self):
+        registry = live_sync.LiveSyncRegistry(refresh=lambda login_id: {}, interval=0.01, idle_ttl=0)
+        registry.get(9)
+        for _ in range(200):
+            if not registry.status()['watched_logins']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(registry.status()['watched_logins'], [])
+
+
+class RunPoolTests(SimpleTestCase):
+    def test_fetches_stay_within_the_mt5_slots(self):
+        lock = threading.Lock()
+        active, peak = [0], [0]
+
+        def fetch(item):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.01)
+            with lock:
+                active[0] -= 1
+            if item == 3:
+                raise RuntimeError('MT5 down')
+            return item
+
+        summary = parallel.run_pool('test-pool', range(20), fetch, lambda item, n: {'stored': n, 'ok': True},
+                                    workers=6, mt5_concurrency=2)
+        self.assertLessEqual(peak[0], 2)
+        self.assertEqual((summary['total'], summary['done']), (20, 20))
+        self.assertEqual(summary['failed'], [{'item': '3', 'error': 'MT5 down'}])
+        self.assertEqual(summary['totals'], {'stored': sum(range(20)) - 3})  # booleans are not summed
+        self.assertIsNotNone(summary['latency_ms']['p50'])
+        self.assertFalse(parallel.is_running('test-pool'))
+        self.assertEqual(parallel.run_summaries()['test-pool']['done'], 20)
+
+    def test_empty_run(self):
+        summary = parallel.run_pool('test-empty', [], mock.Mock(), mock.Mock())
+        self.assertEqual((summary['total'], summary['done'], summary['latency_ms']['max']), (0, 0, None))
+
+
+class ManagerPoolTests(SimpleTestCase):
+    def setUp(self):
+        simulated_book(self, accounts=4, groups=1)
+        self.factory = mock.Mock(side_effect=self.connect)
+
+    def connect(self):
+        mgr = mt5_simulator.ManagerAPI()
+        mgr.Connect('simulator', 1, 'x')
+        return mgr
+
+    def test_sessions_are_reused_and_counted(self):
+        pool = ManagerPool(self.factory, size=2)
+        for _ in range(3):
+            with pool.session() as mgr:
+                mgr.UserTotal()
+        status = pool.status()
+        self.assertEqual(self.factory.call_count, 1)
+        self.assertEqual((status['open'], status['idle'], status['calls']), (1, 1, 3))
+        self.assertEqual(status['sessions'][0]['by_method'], {'UserTotal': 3})
+
+    def test_checkout_waits_for_a_free_session(self):
+        pool = ManagerPool(self.factory, size=2)
+        held = [pool.checkout(), pool.checkout()]
+        with self.assertRaises(TimeoutError):
+            pool.checkout(timeout=0.05)
+        threading.Timer(0.05, pool.checkin, args=(held[0],)).start()
+        self.assertIs(pool.checkout(timeout=5), held[0])
+        self.assertEqual((self.factory.call_count, pool.waits), (2, 2))
+
+    def test_broken_sessions_are_replaced(self):
+        pool = ManagerPool(self.factory, size=1)
+        with self.assertRaises(RuntimeError):
+            with pool.session() as mgr:
+                mgr.Disconnect()
+                raise RuntimeError('connection lost')
+        with pool.session() as mgr:
+            self.assertTrue(mgr.connected)
+        self.assertEqual(self.factory.call_count, 2)
+        self.assertEqual([s['index'] for s in pool.status()['sessions']], [1])
+
+        pool.close()
+        with self.assertRaises(RuntimeError):
+            pool.checkout()
+
+
+class GroupPositionFetchTests(SimpleTestCase):
+    def setUp(self):
+        self.svc, self.book, self.calls = simulated_service(self, accounts=30, groups=3, positions_per_account=2)
+        self.group = self.book.groups[0]
+        self.logins = [login for login, user in self.book.users.items() if user.Group == self.group]
+        self.expected = {login: sorted(self.book.positions[login]) for login in self.logins}
+
+    def fetched(self, by_login):
+        return {login: sorted(p['id'] for p in positions) for login, positions in by_login.items()}
+
+    def test_one_request_per_mask(self):
+        by_login = self.svc.get_open_positions_by_group([self.group], logins=self.logins)
+        # Logins without positions are present with an empty list so their rows get cleared
+        self.assertEqual(self.fetched(by_login), self.expected)
+        self.assertEqual(self.calls()['PositionGetByGroup'], 1)
+        self.assertNotIn('PositionGet', self.calls())
+
+    def test_falls_back_to_per_login_requests(self):
+        self.book.disabled_methods.add('PositionGetByGroup')
+        by_login = self.svc.get_open_positions_by_group([self.group], logins=self.logins)
+        self.assertEqual(self.fetched(by_login), self.expected)
+        self.assertEqual(self.calls()['PositionGet'], len(self.logins))
+        with self.assertRaises(Exception):
+            self.svc.get_open_positions_by_group([self.group])
+
+    def test_long_group_lists_are_split_into_bounded_masks(self):
+        from .MT5Service import _group_masks
+        groups = [f"real\\group{i:04d}" for i in range(300)]
+        masks = _group_masks(groups)
+        self.assertGreater(len(masks), 1)
+        self.assertTrue(all(len(mask) <= 1024 for mask in masks))
+        self.assertEqual(','.join(masks).split(','), groups)
+
+
+class GroupAccountEnumerationTests(SimpleTestCase):
+    def setUp(self):
+        self.svc, self.book, self.calls = simulated_service(self, accounts=30, groups=3)
+
+    def test_account_states_are_fetched_per_group(self):
+        stats = []
+        accounts = list(self.svc.iter_accounts_by_groups(self.book.groups, stats=stats))
+        self.assertEqual(sorted(a['login'] for a in accounts), sorted(self.book.users))
+        login = accounts[0]['login']
+        self.assertEqual(accounts[0]['equity'], self.book.accounts[login].Equity)
+        self.assertEqual([(s['accounts'], s['calls']) for s in stats], [(10, 2)] * 3)
+        self.assertEqual(self.calls()['UserAccountGetByGroup'], 3)
+        self.assertNotIn('UserAccountGet', self.calls())
+
+    def test_falls_back_to_per_user_states(self):
+        self.book.disabled_methods.add('UserAccountGetByGroup')
+        stats = []
+        accounts = list(self.svc.iter_accounts_by_groups(self.book.groups[:1], stats=stats))
+        self.assertEqual(len(accounts), 10)
+        self.assertEqual(stats[0]['calls'], 11)
+        self.assertEqual(self.calls()['UserAccountGet'], 10)
+
+    def test_a_failing_group_does_not_stop_the_others(self):
+        with mock.patch.object(mt5_simulator.ManagerAPI, 'UserGetByGroup', autospec=True,
+                               side_effect=lambda mgr, group: 1 / 0 if group == self.book.groups[1]
+                               else [u for u in self.book.users.values() if u.Group == group]):
+            accounts = self.svc.list_accounts_by_groups()
+        self.assertEqual(len(accounts), 20)
+        self.assertNotIn(self.book.groups[1], {a['group'] for a in accounts})
+
+
+class AccountIngestTests(TestCase):
+    def setUp(self):
+        self.svc, self.book, _ = simulated_service(self, accounts=30, groups=3)
+
+    def stream(self):
+        yield {'login': None, 'name': 'no login'}
+        yield from self.svc.iter_accounts_by_groups(self.book.groups)
+
+    def test_streamed_accounts_are_written_in_chunks(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        summary = ingest_accounts(self.stream(), chunk_size=7)
+        self.assertEqual((summary['fetched'], summary['invalid'], summary['inserted'], summary['chunks']), (31, 1, 30, 5))
+        self.assertEqual(Accounts.objects.count(), 30)
+        login = next(iter(self.book.accounts))
+        self.assertEqual(Accounts.objects.get(login=login).balance, Decimal(str(self.book.accounts[login].Balance)))
+
+        with CaptureQueriesContext(connection) as queries:
+            summary = ingest_accounts(self.stream(), chunk_size=7)
+        self.assertEqual((summary['skipped'], summary['stored']), (30, 30))
+        self.assertEqual(len(queries), 5)  # one fingerprint SELECT per chunk, nothing written
+
+    def test_a_failing_chunk_does_not_stop_the_others(self):
+        bulk_create = Accounts.objects.bulk_create
+        calls = []
+
+        def flaky(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError('deadlock')
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(Accounts.objects, 'bulk_create', side_effect=flaky), \
+                self.assertLogs('core.reconcile', 'ERROR'):
+            summary = ingest_accounts(self.stream(), chunk_size=10)
+        self.assertEqual((summary['inserted'], summary['failed']), (20, 10))
+        self.assertEqual(Accounts.objects.count(), 20)
+
+
+class GroupSummaryCacheTests(TestCase):
+    def setUp(self):
+        from .models import Groups
+        generation._last_bump = 0.0
+        generation._trailing = None
+        cache.delete(generation.GENERATION_KEY)
+        cache.delete(generation.CACHED_KEY.format('group_summary'))
+        Groups.objects.create(Groups='real\\A')
+        make_account(6101)
+        make_account(6102)
+        with self.captureOnCommitCallbacks(execute=True):
+            reconcile_open_positions({6101: [make_position(1, volume=1.0, profit=10)], 6102: []})
+
+    def summary(self):
+        return self.client.get('/api/group-summary/').json()
+
+    def test_summary_is_built_once_per_generation(self):
+        with mock.patch.object(views, 'build_group_summary', wraps=views.build_group_summary) as build:
+            first = self.summary()
+            self.assertEqual(self.summary(), first)
+            self.assertEqual(build.call_count, 1)
+            self.assertEqual([(g['group'], g['accounts'], g['open_positions']) for g in first['data']],
+                             [('real\\A', 1, 1)])
+
+            generation._last_bump = 0.0  # past the bump throttle
+            with self.captureOnCommitCallbacks(execute=True):
+                reconcile_open_positions({6102: [make_position(2, volume=2.0, profit=-4)]})
+            second = self.summary()
+        self.assertEqual(build.call_count, 2)
+        self.assertEqual(second['generation'], first['generation'] + 1)
+        self.assertEqual([(g['accounts'], g['open_positions'], g['total_usd_pnl']) for g in second['data']],
+                         [(2, 2, 6.0)])
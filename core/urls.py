@@ -11,10 +11,14 @@ urlpatterns = [
     path('positions/<int:login_id>/', views.get_open_positions, name='get_open_positions'),# get the open position details from the Mt5
     path('positions/sync_all/', views.sync_all_open_positions, name='sync_all_open_positions'),
     path('positions/open/', views.get_open_positions_from_db, name='get_open_positions'),
+    path('positions/changes/', views.get_position_changes, name='get_position_changes'),# Open-position changes since a version, or a snapshot
     path('lots/all/', views.get_all_lots, name='get_all_lots'),# getall the login user's lot
+    path('exposure/', views.get_exposure, name='get_exposure'),# Buy/sell/net lots and P&L per symbol, optionally by group or login
+    path('matrix/', views.get_matrix, name='get_matrix'),# Paged login x symbol lot/P&L matrix in sparse form
     path('lots/<int:login_id>/', views.get_all_lots_by_login, name='get_all_lots_by_login'),
     path('profile/<int:login_id>/', views.get_user_profile, name='get_user_profile'),
     path('positions/closed/', views.get_closed_positions_from_db, name='get_closed_positions_from_db'),
+    path('positions/closed/export/', views.export_closed_positions, name='export_closed_positions'),# Streams closed positions as NDJSON or CSV
     path('closepositions/sync_all/', views.sync_all_close_positions, name='sync_all_user_data'), #get close position
     path('add-server/', views.add_server_setting, name='add_server_setting'),
     path('get-servers/', views.get_server_settings, name='get_server_settings'),
@@ -24,6 +28,8 @@ urlpatterns = [
     
     # Server settings endpoints
     path('sync/mt5/', views.sync_mt5_data, name='sync_mt5_data'),# Automate sync of all MT5 data to DB
+    path('sync/status/', views.get_sync_status, name='sync_status'),# Last run, duration, rows and errors per sync job
+    path('events/', views.stream_events, name='stream_events'),# Server-Sent Events stream of position, account and group summary changes (ASGI)
 
     path('server/settings/', views.ServerSettingsAPIView.as_view(), name='server_settings'),
     path('server/details/', views.ServerDetailsView.as_view(), name='server_details'),
@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+
+# MT5 reports volumes in 1/10000 lot; converted to lots once, when data is ingested
+VOLUME_SCALE = 10000
+
+
+def volume_to_lots(volume):
+    """Convert an MT5 volume to lots, rounded to 0.01."""
+    return round((volume or 0) / VOLUME_SCALE, 2)
+
+
+
+def to_mt5_time(value):
+    """Convert a datetime stored from MT5 (server wall clock labelled UTC) back to an MT5 timestamp."""
+    return int(value.timestamp())
+
+def normalize_date(date_value):
+    """Ensure date_value is a valid datetime object."""
+    if date_value is None:
+        return datetime.now(timezone.utc)  # Use datetime.timezone.utc here
+    elif isinstance(date_value, str):
+        try:
+            # If the date ends with 'Z', replace it with '+00:00' (for UTC time)
+            if date_value.endswith('Z'):
+                date_value = date_value[:-1] + '+00:00'  # Convert 'Z' to UTC offset
+            # Attempt to parse the string as a datetime
+            return datetime.fromisoformat(date_value)
+        except Exception as e:
+            print(f"Error parsing date {date_value}: {e}. Returning current time.")
+            return datetime.now(timezone.utc)  # Use datetime.timezone.utc here
+    elif isinstance(date_value, datetime):
+        # If it's already a datetime object, return it
+        return date_value
+    elif isinstance(date_value, int):
+        # If it's an integer (Unix timestamp), convert it to a datetime object
+        try:
+            return datetime.fromtimestamp(date_value, tz=timezone.utc)  # Convert to UTC time
+        except Exception as e:
+            print(f"Error converting timestamp {date_value}: {e}. Returning current time.")
+            return datetime.now(timezone.utc)  # Use datetime.timezone.utc here
+    else:
+        # If it's any other type, return the current time
+        print(f"Unexpected date type: {type(date_value)}. Returning current time.")
+        return datetime.now(timezone.utc)  # Use datetime.timezone.ut
@@ -2,9 +2,10 @@ import time
 from django.http import JsonResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
+from django.views.decorators.cache import cache_control
 import json
-from django.db.models import Sum, Count, DecimalField
+from django.db.models import Sum, Count, DecimalField, F, Q
 from django.db.models.functions import Cast
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -14,7 +15,9 @@ from .MT5Service import MT5Service
 from django.db.models.functions import Cast
 from django.db.models import Sum, DecimalField,Count
 import os
-from django.http import FileResponse
+from django.http import FileResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from .MT5Service import MT5Service
 from datetime import datetime, timedelta
@@ -26,6 +29,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 import threading
+import asyncio
 
 from .models import Accounts, OpenPositions
 from datetime import datetime
@@ -35,41 +39,61 @@ from django.db.models import Sum
 from .models import Accounts, OpenPositions, ClosedPositions
 from .models import ServerSetting
 from django.shortcuts import get_object_or_404
-from .models import Groups
+from django.db import transaction
+from .models import Groups, LoginSymbolTotals, PositionChange
 
 
 
 from datetime import datetime, timezone
-def normalize_date(date_value):
-    """Ensure date_value is a valid datetime object."""
-    if date_value is None:
-        return datetime.now(timezone.utc)  # Use datetime.timezone.utc here
-    elif isinstance(date_value, str):
-        try:
-            # If the date ends with 'Z', replace it with '+00:00' (for UTC time)
-            if date_value.endswith('Z'):
-                date_value = date_value[:-1] + '+00:00'  # Convert 'Z' to UTC offset
-            # Attempt to parse the string as a datetime
-            return datetime.fromisoformat(date_value)
-        except Exception as e:
-            print(f"Error parsing date {date_value}: {e}. Returning current time.")
-            return datetime.now(timezone.utc)  # Use datetime.timezone.utc here
-    elif isinstance(date_value, datetime):
-        # If it's already a datetime object, return it
-        return date_value
-    elif isinstance(date_value, int):
-        # If it's an integer (Unix timestamp), convert it to a datetime object
-        try:
-            return datetime.fromtimestamp(date_value, tz=timezone.utc)  # Convert to UTC time
-        except Exception as e:
-            print(f"Error converting timestamp {date_value}: {e}. Returning current time.")
-            return datetime.now(timezone.utc)  # Use datetime.timezone.utc here
-    else:
-        # If it's any other type, return the current time
-        print(f"Unexpected date type: {type(date_value)}. Returning current time.")
-        return datetime.now(timezone.utc)  # Use datetime.timezone.ut
-    
-    
+from .utils import normalize_date, to_mt5_time
+from .reconcile import (
+    delete_accounts, ingest_accounts, reconcile_open_positions, refresh_symbol_totals, store_closed_deals,
+)
+from . import events, generation, live_sync
+from .parallel import is_running, run_pool, run_summaries
+from .query import QueryError, filter_queryset, keyset_page, wants_page
+
+
+# Query parameters accepted by the DB read endpoints -> ORM lookups, see core/query.py
+OPEN_POSITION_FILTERS = {
+    'login': 'login__login__in',
+    'group': 'login__group__in',
+    'symbol': 'symbol__in',
+    'position_type': 'position_type__in',
+    'date_from': 'date_created__gte',
+    'date_to': 'date_created__lt',
+}
+OPEN_POSITION_VALUES = (
+    'login__login', 'position_id', 'symbol', 'volume', 'price', 'profit', 'position_type', 'date_created', 'last_updated'
+)
+OPEN_POSITION_SORTS = ('position_id', 'date_created', 'symbol', 'volume', 'profit')
+
+CLOSED_POSITION_FILTERS = {
+    'login': 'login__login__in',
+    'group': 'login__group__in',
+    'symbol': 'symbol__in',
+    'position_type': 'position_type__in',
+    'date_from': 'date_closed__gte',
+    'date_to': 'date_closed__lt',
+}
+CLOSED_POSITION_VALUES = (
+    'login__login', 'deal_id', 'symbol', 'volume', 'price', 'profit', 'position_type', 'date_closed', 'last_updated'
+)
+CLOSED_POSITION_SORTS = ('date_closed', 'deal_id', 'symbol', 'volume')
+
+ACCOUNT_FILTERS = {
+    'login': 'login__in',
+    'group': 'group__in',
+    'date_from': 'registration__gte',
+    'date_to': 'registration__lt',
+}
+ACCOUNT_VALUES = (
+    'id', 'login', 'name', 'email', 'group', 'leverage', 'balance', 'equity', 'profit',
+    'margin', 'margin_free', 'margin_level', 'last_access', 'registration', 'last_closed_sync',
+)
+ACCOUNT_SORTS = ('login', 'balance', 'equity', 'profit', 'margin_level')
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_open_positions_from_db(request, login_id=None):
@@ -80,76 +104,16 @@ def get_open_positions_from_db(request, login_id=None):
         from django.utils import timezone
         if login_id:
             # Update DB for specific login_id
-            positions = svc.get_open_positions(login_id)
             account = Accounts.objects.get(login=login_id)
-            existing_positions = set(OpenPositions.objects.filter(login=account).values_list('position_id', flat=True))
-            fetched_positions = set()
-            for pos in positions:
-                pos_id = pos.get('id')
-                if pos_id is None:
-                    continue
-                # Skip if required fields are None
-                symbol = pos.get('symbol')
-                volume = pos.get('volume')
-                price = pos.get('price')
-                position_type = pos.get('type')
-                if symbol is None or volume is None or price is None or position_type is None:
-                    continue
-                fetched_positions.add(pos_id)
-                OpenPositions.objects.update_or_create(
-                    login=account,
-                    position_id=pos_id,
-                    defaults={
-                        'symbol': symbol,
-                        'volume': volume,
-                        'price': price,
-                        'profit': pos.get('profit') or 0,
-                        'position_type': position_type,
-                        'date_created': pos.get('date') or timezone.now(),
-                    }
-                )
-            # Delete positions that are no longer open
-            to_delete = existing_positions - fetched_positions
-            OpenPositions.objects.filter(login=account, position_id__in=to_delete).delete()
+            reconcile_open_positions({account.login: svc.get_open_positions(login_id)}, accounts={account.login: account})
             # Retrieve updated positions from DB
             positions = OpenPositions.objects.filter(login__login=login_id).values(
                 'position_id', 'symbol', 'volume', 'price', 'profit', 'position_type', 'date_created', 'last_updated'
             )
         else:
-            # Update DB for all login_ids
-            login_ids = Accounts.objects.values_list('login', flat=True)
-            for lid in login_ids:
-                positions = svc.get_open_positions(lid)
-                account = Accounts.objects.get(login=lid)
-                existing_positions = set(OpenPositions.objects.filter(login=account).values_list('position_id', flat=True))
-                fetched_positions = set()
-                for pos in positions:
-                    pos_id = pos.get('id')
-                    if pos_id is None:
-                        continue
-                    # Skip if required fields are None
-                    symbol = pos.get('symbol')
-                    volume = pos.get('volume')
-                    price = pos.get('price')
-                    position_type = pos.get('type')
-                    if symbol is None or volume is None or price is None or position_type is None:
-                        continue
-                    fetched_positions.add(pos_id)
-                    OpenPositions.objects.update_or_create(
-                        login=account,
-                        position_id=pos_id,
-                        defaults={
-                            'symbol': symbol,
-                            'volume': volume,
-                            'price': price,
-                            'profit': pos.get('profit') or 0,
-                            'position_type': position_type,
-                            'date_created': pos.get('date') or timezone.now(),
-                        }
-                    )
-                # Delete positions that are no longer open
-                to_delete = existing_positions - fetched_positions
-                OpenPositions.objects.filter(login=account, position_id__in=to_delete).delete()
+            # Update DB for all accounts, one MT5 request per group mask
+            by_group = accounts_by_group(Accounts.objects.all())
+            reconcile_open_positions(fetch_open_positions_by_group(svc, by_group))
             # Retrieve all updated positions from DB
             positions = OpenPositions.objects.all().values(
                 'login__login', 'position_id', 'symbol', 'volume', 'price', 'profit', 'position_type', 'date_created', 'last_updated'
@@ -175,19 +139,16 @@ def sync_all_closed_positions(request):
 
         accounts = Accounts.objects.all()
         total_stored = 0
-        from_date = datetime.now() - timedelta(days=30)
-        to_date = datetime.now()
 
         results = []
 
         for account in accounts:
-            closed_positions = svc.get_closed_trades(account.login, from_date=from_date, to_date=to_date)
-            stored_count = store_closed_positions(account, closed_positions)
-            total_stored += stored_count
+            result = sync_closed_positions_for_account(svc, account)
+            total_stored += result["stored"]
             results.append({
                 "account": account.login,
-                "fetched": len(closed_positions),
-                "stored": stored_count
+                "fetched": result["fetched"],
+                "stored": result["stored"]
             })
 
         return JsonResponse({
@@ -235,47 +196,45 @@ def sync_positions_for_account(account):
 
     try:
         positions = svc.get_open_positions(login_id)
-        existing_positions = set(
-            OpenPositions.objects.filter(login=account)
-            .values_list('position_id', flat=True)
-        )
-        fetched_positions = set()
+        return reconcile_open_positions({login_id: positions}, accounts={login_id: account})
+    except Exception as e:
+        print(f"Error syncing account {login_id}: {e}")
 
-        for pos in positions:
-            pos_id = pos.get("id")
-            if not pos_id:
-                continue
 
-            symbol = pos.get("symbol")
-            volume = pos.get("volume")
-            price = pos.get("price")
-            position_type = pos.get("type")
+def accounts_by_group(accounts):
+    """Index accounts as {group: {login: account}}, skipping accounts without a group."""
+    by_group = {}
+    for account in accounts:
+        if account.group:
+            by_group.setdefault(account.group, {})[account.login] = account
+    return by_group
 
-            if any(v is None for v in [symbol, volume, price, position_type]):
-                continue
 
-            fetched_positions.add(pos_id)
+def fetch_open_positions_by_group(svc, by_group):
+    """Fetch open positions for every account in by_group with bulk group requests."""
+    logins = [login for group_accounts in by_group.values() for login in group_accounts]
+    return svc.get_open_positions_by_group(list(by_group), logins=logins)
 
-            OpenPositions.objects.update_or_create(
-                login=account,
-                position_id=pos_id,
-                defaults={
-                    "symbol": symbol,
-                    "volume": volume,
-                    "price": price,
-                    "profit": pos.get("profit") or 0,
-                    "position_type": position_type,
-                    "date_created": normalize_date(pos.get("date")),
-                },
-            )
 
-        # Delete closed positions
-        to_delete = existing_positions - fetched_positions
-        if to_delete:
-            OpenPositions.objects.filter(login=account, position_id__in=to_delete).delete()
+def sync_open_positions_for_all_accounts():
+    """Sync open positions for every stored account, one bulk MT5 request per group."""
+    svc = MT5Service()
 
-    except Exception as e:
-        print(f"Error syncing account {login_id}: {e}")
+    def fetch(item):
+        group, group_accounts = item
+        return svc.get_open_positions_by_group([group], logins=list(group_accounts))
+
+    def store(item, positions_by_login):
+        group, group_accounts = item
+        return reconcile_open_positions(positions_by_login, accounts=group_accounts)
+
+    return run_pool(
+        'open_positions',
+        accounts_by_group(Accounts.objects.all()).items(),
+        fetch,
+        store,
+        key=lambda item: item[0],
+    )
 
 @csrf_exempt  # Only use if necessary; remove in production
 @require_http_methods(["GET"])
@@ -355,184 +314,92 @@ def get_all_lots(request):
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)@csrf_exempt
 
-@csrf_exempt
-@require_http_methods(["GET"])
-def get_group_summary(request):
+def build_group_summary():
     """
     Group-wise trading summary:
     Accounts | Open Positions | Total / Avg Net Lot | Total / Avg USD P&L
-    """
-    try:
-        # ----- VALID GROUPS -----
-        valid_groups = set(
-            Groups.objects.values_list('Groups', flat=True)
-        )
 
-        # ----- ACCOUNTS -----
-        accounts = Accounts.objects.filter(group__in=valid_groups)
-
-        account_map = {
-            acc.login: acc.group for acc in accounts
-        }
-
-        logins = list(account_map.keys())
+    Aggregated from LoginSymbolTotals in one grouped query. Accounts counts the
+    accounts with open positions (at least 1 to keep the averages defined).
+    """
+    valid_groups = set(
+        Groups.objects.values_list('Groups', flat=True)
+    )
 
-        # ----- OPEN POSITIONS -----
-        open_positions = (
-            OpenPositions.objects
-            .filter(login__login__in=logins)
-            .values('login__login')
-            .annotate(
-                open_lot=Sum(
-                    Cast('volume', DecimalField(max_digits=20, decimal_places=8))
-                ),
-                open_usd=Sum(
-                    Cast('profit', DecimalField(max_digits=20, decimal_places=8))
-                ),
-                open_positions=Count('id')
-            )
+    group_data = (
+        LoginSymbolTotals.objects
+        .filter(login__group__in=valid_groups)
+        .values('login__group')
+        .annotate(
+            accounts=Count('login', filter=Q(open_count__gt=0), distinct=True),
+            open_positions=Sum('open_count'),
+            total_net_lot=Sum(F('open_lot') + F('closed_lot')),
+            total_usd=Sum(F('open_usd') + F('closed_usd')),
         )
+    )
 
-        # ----- CLOSED POSITIONS -----
-        closed_positions = (
-            ClosedPositions.objects
-            .filter(login__login__in=logins)
-            .values('login__login')
-            .annotate(
-                closed_lot=Sum(
-                    Cast('volume', DecimalField(max_digits=20, decimal_places=8))
-                ),
-                closed_usd=Sum(
-                    Cast('profit', DecimalField(max_digits=20, decimal_places=8))
-                )
-            )
-        )
-
-        # ----- AGGREGATE BY GROUP -----
-        group_data = {}
-
-        def init_group(group):
-            group_data[group] = {
-                "group": group,
-                "accounts": set(),
-                "open_positions": 0,
-                "total_net_lot": 0,
-                "total_usd": 0
-            }
-
-        for row in open_positions:
-            login = row['login__login']
-            group = account_map.get(login)
-            if not group:
-                continue
-
-            if group not in group_data:
-                init_group(group)
-
-            group_data[group]["accounts"].add(login)
-            group_data[group]["open_positions"] += row['open_positions'] or 0
-            group_data[group]["total_net_lot"] += row['open_lot'] or 0
-            group_data[group]["total_usd"] += row['open_usd'] or 0
-
-        for row in closed_positions:
-            login = row['login__login']
-            group = account_map.get(login)
-            if not group:
-                continue
+    response = []
+    for data in group_data:
+        acc_count = data["accounts"] or 1
+        total_net_lot = data["total_net_lot"] or 0
+        total_usd = data["total_usd"] or 0
+
+        response.append({
+            "group": data["login__group"],
+            "accounts": acc_count,
+            "open_positions": data["open_positions"] or 0,
+            "total_net_lot": float(total_net_lot),
+            "total_usd_pnl": float(total_usd),
+            "avg_net_lot": float(total_net_lot / acc_count),
+            "avg_usd_pnl": float(total_usd / acc_count),
+        })
+    return response
 
-            if group not in group_data:
-                init_group(group)
-
-            group_data[group]["total_net_lot"] += row['closed_lot'] or 0
-            group_data[group]["total_usd"] += row['closed_usd'] or 0
-
-        # ----- FINAL RESPONSE -----
-        response = []
-        for group, data in group_data.items():
-            acc_count = len(data["accounts"]) or 1
-
-            response.append({
-                "group": group,
-                "accounts": acc_count,
-                "open_positions": data["open_positions"],
-                "total_net_lot": float(data["total_net_lot"]),
-                "total_usd_pnl": float(data["total_usd"]),
-                "avg_net_lot": float(data["total_net_lot"] / acc_count),
-                "avg_usd_pnl": float(data["total_usd"] / acc_count),
-            })
 
-        return JsonResponse({"data": response})
+@csrf_exempt
+@require_http_methods(["GET"])
+@cache_control(no_cache=True)
+@condition(etag_func=generation.etag)
+def get_group_summary(request):
+    """Group summary, rebuilt at most once per data generation (see core.generation)."""
+    try:
+        response, data_generation, built_at = generation.cached('group_summary', build_group_summary)
+        return JsonResponse({
+            "data": response,
+            "generation": data_generation,
+            "generated_at": built_at,
+            "data_updated_at": generation.updated_at(),
+        })
 
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 @require_http_methods(["GET"])
+@cache_control(no_cache=True)
+@condition(etag_func=generation.etag)
 def get_all_lots(request):
     """
     Fetch total lot (volume) and USD profit per symbol per account,
     combining OpenPositions + ClosedPositions.
+
+    Reads the LoginSymbolTotals table kept up to date by the sync writers
+    instead of aggregating both position tables on every request.
     """
     try:
-        # ----- OPEN POSITIONS -----
-        open_data = (
-            OpenPositions.objects
-            .values('login__login', 'symbol')
-            .annotate(
-                total_open_lot=Sum(
-                    Cast('volume', DecimalField(max_digits=20, decimal_places=8))
-                ),
-                total_open_usd=Sum(
-                    Cast('profit', DecimalField(max_digits=20, decimal_places=8))
-                )
-            )
-        )
-
-        open_dict = {
-            (item['login__login'], item['symbol']): {
-                "open_lot": item['total_open_lot'] or 0,
-                "open_usd": item['total_open_usd'] or 0
-            }
-            for item in open_data
-        }
-
-        # ----- CLOSED POSITIONS -----
-        closed_data = (
-            ClosedPositions.objects
-            .values('login__login', 'symbol')
-            .annotate(
-                total_closed_lot=Sum(
-                    Cast('volume', DecimalField(max_digits=20, decimal_places=8))
-                ),
-                total_closed_usd=Sum(
-                    Cast('profit', DecimalField(max_digits=20, decimal_places=8))
-                )
-            )
+        totals = LoginSymbolTotals.objects.values(
+            'login__login', 'symbol', 'open_lot', 'closed_lot', 'open_usd', 'closed_usd'
         )
 
-        closed_dict = {
-            (item['login__login'], item['symbol']): {
-                "closed_lot": item['total_closed_lot'] or 0,
-                "closed_usd": item['total_closed_usd'] or 0
-            }
-            for item in closed_data
-        }
-
-        # ----- MERGE BOTH -----
-        combined_keys = set(open_dict.keys()) | set(closed_dict.keys())
-
         all_data = []
-        for (login, symbol) in combined_keys:
-            open_vals = open_dict.get((login, symbol), {})
-            closed_vals = closed_dict.get((login, symbol), {})
-
-            open_lot = open_vals.get("open_lot", 0)
-            closed_lot = closed_vals.get("closed_lot", 0)
-            open_usd = open_vals.get("open_usd", 0)
-            closed_usd = closed_vals.get("closed_usd", 0)
+        for item in totals.iterator(chunk_size=5000):
+            open_lot = item['open_lot']
+            closed_lot = item['closed_lot']
+            open_usd = item['open_usd']
+            closed_usd = item['closed_usd']
 
             all_data.append({
-                "login_id": login,
-                "symbol": symbol,
+                "login_id": item['login__login'],
+                "symbol": item['symbol'],
 
                 # LOTS
                 "open_lot": float(open_lot),
@@ -556,10 +423,9 @@ def get_all_lots_by_login(request, login_id):
     try:
         # Fetch and aggregate positions for the given login_id
         lot_data = (
-            OpenPositions.objects
-            .filter(login__login=login_id)  # Filter by the login_id
-            .values('symbol')  # Group by symbol
-            .annotate(total_volume=Sum('volume'))  # Sum the volume for each symbol
+            LoginSymbolTotals.objects
+            .filter(login__login=login_id, open_count__gt=0)  # Symbols with open positions
+            .values('symbol', 'open_lot')
             .order_by('symbol')  # Order results by symbol
         )
 
@@ -568,7 +434,7 @@ def get_all_lots_by_login(request, login_id):
             {
                 "login_id": login_id,  # The login_id provided in the URL
                 "symbol": item['symbol'],
-                "lot": item['total_volume']
+                "lot": item['open_lot']
             }
             for item in lot_data
         ]
@@ -643,12 +509,11 @@ def get_user_profile(request, login_id):
 @require_http_methods(["GET"])
 def sync_all_open_positions(request):
     """Start background sync for all accounts."""
-    accounts = Accounts.objects.all()
+    if is_running('open_positions'):
+        return JsonResponse({"status": "success", "message": "Sync already running"}, status=200)
 
     # Run the sync in a background thread
-    thread = threading.Thread(
-        target=lambda: [sync_positions_for_account(a) for a in accounts]
-    )
+    thread = threading.Thread(target=sync_open_positions_for_all_accounts)
     thread.start()
 
     # Immediately return response
@@ -659,63 +524,368 @@ def sync_all_open_positions(request):
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_open_positions_from_db(request):
-    """Fetch open positions from the database."""
+    """Fetch open positions from the database.
+
+    Filters: login, group, symbol, position_type (comma-separated lists) and
+    date_from/date_to on date_created. Pass limit and/or cursor to get keyset
+    pages ordered by sort (default position_id) with a next_cursor.
+    """
     try:
-        # Fetch open positions from the database
-        positions = OpenPositions.objects.all().values(
-            'login__login', 'position_id', 'symbol', 'volume', 'price', 'profit', 'position_type', 'date_created', 'last_updated'
-        )
+        positions = filter_queryset(OpenPositions.objects.all(), request.GET, OPEN_POSITION_FILTERS)
+        if wants_page(request.GET):
+            rows, next_cursor = keyset_page(
+                positions, request.GET, OPEN_POSITION_VALUES, OPEN_POSITION_SORTS, 'position_id'
+            )
+            return JsonResponse({'positions': rows, 'next_cursor': next_cursor}, safe=False)
 
         # Return the data as JSON
-        return JsonResponse({'positions': list(positions)}, safe=False)
+        return JsonResponse({'positions': list(positions.values(*OPEN_POSITION_VALUES))}, safe=False)
 
+    except QueryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+
+# Changes returned per request by get_position_changes
+POSITION_CHANGES_PAGE = 5000
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
-def get_closed_positions_from_db(request):
-    """Fetch closed positions from the database."""
+def get_position_changes(request):
+    """Open-position changes after version ``since``, for clients that keep their own book.
+
+    Returns {"mode": "changes", "version", "changes", "has_more"}: apply the changes
+    in order and ask again with since=version. Without since, or when changes after
+    it have already been pruned, returns {"mode": "snapshot", "version", "positions"}
+    instead: replace the book and continue from that version. Filter: login
+    (comma-separated list).
+
+    Only opens, closes and structural edits are logged; price and profit moves
+    are not, read them from /api/positions/open/ or the ``prices`` SSE events.
+    """
+    try:
+        since = request.GET.get('since')
+        since = int(since) if since else None
+        logins = [int(l) for l in request.GET.get('login', '').split(',') if l.strip()]
+    except ValueError:
+        return JsonResponse({'error': 'since and login must be integers'}, status=400)
+
     try:
-        # Fetch closed positions from the database
-        positions = ClosedPositions.objects.all().values(
-            'login__login', 'deal_id', 'symbol', 'volume', 'price', 'profit', 'position_type', 'date_closed', 'last_updated'
+        # Read before the data: a change committed in between is sent again, never skipped
+        versions = PositionChange.objects.values_list('version', flat=True)
+        latest = versions.order_by('-version').first() or 0
+        oldest = versions.order_by('version').first()
+
+        if since is None or since > latest or (oldest is not None and since < oldest - 1):
+            positions = OpenPositions.objects.all()
+            if logins:
+                positions = positions.filter(login__login__in=logins)
+            return JsonResponse({
+                'mode': 'snapshot',
+                'version': latest,
+                'positions': list(positions.values(*OPEN_POSITION_VALUES)),
+            })
+
+        changes = PositionChange.objects.filter(version__gt=since)
+        if logins:
+            changes = changes.filter(login__in=logins)
+        changes = list(
+            changes.order_by('version').values('version', 'login', 'position_id', 'action', 'data')[:POSITION_CHANGES_PAGE + 1]
         )
+        has_more = len(changes) > POSITION_CHANGES_PAGE
+        changes = changes[:POSITION_CHANGES_PAGE]
+        if has_more:
+            version = changes[-1]['version']
+        else:
+            version = max(latest, changes[-1]['version'] if changes else since)
+        return JsonResponse({'mode': 'changes', 'version': version, 'changes': changes, 'has_more': has_more})
 
-        # Process the positions to format volume, price, and profit
-        processed_positions = []
-        for pos in positions:
-            processed_pos = pos.copy()
-            # Process volume
-            try:
-                volume_val = float(pos['volume']) / 10000
-                processed_pos['volume'] = f"{volume_val:.2f}"
-            except (ValueError, TypeError):
-                processed_pos['volume'] = pos['volume']  # Keep original if conversion fails
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
 
-            # Process price
-            try:
-                price_val = float(pos['price']) / 10000
-                processed_pos['price'] = f"{price_val:.2f}"
-            except (ValueError, TypeError):
-                processed_pos['price'] = pos['price']  # Keep original if conversion fails
+# Breakdowns offered by get_exposure: extra GROUP BY columns per ?by= value
+EXPOSURE_BREAKDOWNS = {
+    'symbol': (),
+    'group': ('login__group',),
+    'login': ('login__login', 'login__name', 'login__group'),
+}
 
-            # Process profit
-            try:
-                profit_val = float(pos['profit']) / 10000
-                processed_pos['profit'] = f"{profit_val:.2f}"
-            except (ValueError, TypeError):
-                processed_pos['profit'] = pos['profit']  # Keep original if conversion fails
 
-            processed_positions.append(processed_pos)
+@csrf_exempt
+@require_http_methods(["GET"])
+@cache_control(no_cache=True)
+@condition(etag_func=generation.etag)
+def get_exposure(request):
+    """Buy/sell/net lots, position count and floating P&L per symbol in one grouped query.
+
+    by=group or by=login breaks each symbol down further. Accepts the same filters
+    as /api/positions/open/ (login, group, symbol, position_type, date_from/date_to).
+    """
+    by = request.GET.get('by') or 'symbol'
+    if by not in EXPOSURE_BREAKDOWNS:
+        return JsonResponse({'error': f"by must be one of: {', '.join(EXPOSURE_BREAKDOWNS)}"}, status=400)
+    columns = ('symbol', *EXPOSURE_BREAKDOWNS[by])
+    try:
+        positions = filter_queryset(OpenPositions.objects.all(), request.GET, OPEN_POSITION_FILTERS)
+        rows = (
+            positions
+            .values(*columns)
+            .annotate(
+                buy_lots=Sum('volume', filter=Q(position_type='Buy'), default=0),
+                sell_lots=Sum('volume', filter=Q(position_type='Sell'), default=0),
+                positions=Count('id'),
+                profit=Sum('profit', default=0),
+            )
+            .order_by(*columns)
+        )
+
+        data = []
+        for row in rows:
+            item = {key.replace('login__', ''): row[key] for key in columns}
+            item.update({
+                "buy_lots": float(row['buy_lots']),
+                "sell_lots": float(row['sell_lots']),
+                "net_lots": float(row['buy_lots'] - row['sell_lots']),
+                "positions": row['positions'],
+                "profit": float(row['profit']),
+            })
+            data.append(item)
+        return JsonResponse({'by': by, 'data': data})
+
+    except QueryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+# Cell values offered by get_matrix, computed from LoginSymbolTotals columns
+MATRIX_VALUES = {
+    'net_lot': F('open_lot') + F('closed_lot'),
+    'net_usd': F('open_usd') + F('closed_usd'),
+    'open_lot': F('open_lot'),
+    'closed_lot': F('closed_lot'),
+    'open_usd': F('open_usd'),
+    'closed_usd': F('closed_usd'),
+}
+MATRIX_FILTERS = {
+    'login': 'login__login__in',
+    'group': 'login__group__in',
+    'symbol': 'symbol__in',
+    'search': 'login__login__contains',
+}
+MATRIX_PAGE_SIZE = 50
+MATRIX_MAX_PAGE_SIZE = 1000
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@cache_control(no_cache=True)
+@condition(etag_func=generation.etag)
+def get_matrix(request):
+    """Login x symbol pivot of LoginSymbolTotals in sparse form, one page of logins at a time.
+
+    value picks the cell value (net_lot by default, see MATRIX_VALUES). sort is
+    login or a symbol, prefix - for descending; logins without a position in that
+    symbol sort last. page/page_size page over logins. Filters: login, group,
+    symbol (comma-separated lists) and search (substring of the login).
+
+    Returns the symbols and their totals over all matching logins, the logins of
+    the page and cells as [login index, symbol index, value] for non-empty cells.
+    """
+    value = request.GET.get('value') or 'net_lot'
+    if value not in MATRIX_VALUES:
+        return JsonResponse({'error': f"value must be one of: {', '.join(MATRIX_VALUES)}"}, status=400)
+    expression = MATRIX_VALUES[value]
+    try:
+        page = max(1, int(request.GET.get('page') or 1))
+        page_size = max(1, min(int(request.GET.get('page_size') or MATRIX_PAGE_SIZE), MATRIX_MAX_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'page and page_size must be integers'}, status=400)
+    sort = request.GET.get('sort') or 'login'
+    descending = sort.startswith('-')
+    sort_column = sort.lstrip('-')
+
+    try:
+        totals = filter_queryset(LoginSymbolTotals.objects.all(), request.GET, MATRIX_FILTERS)
+
+        columns = list(totals.values('symbol').annotate(total=Sum(expression)).order_by('symbol'))
+        symbols = [c['symbol'] for c in columns]
+        if sort_column != 'login' and sort_column not in symbols:
+            raise QueryError(f"Cannot sort by '{sort_column}', use login or one of the symbols")
+
+        logins = totals.values('login__login')
+        if sort_column == 'login':
+            logins = logins.distinct().order_by('-login__login' if descending else 'login__login')
+        else:
+            order = F('sort_value').desc(nulls_last=True) if descending else F('sort_value').asc(nulls_last=True)
+            logins = logins.annotate(sort_value=Sum(expression, filter=Q(symbol=sort_column))).order_by(order, 'login__login')
+        total_logins = totals.values('login').distinct().count()
+        offset = (page - 1) * page_size
+        page_logins = [row['login__login'] for row in logins[offset:offset + page_size]]
+
+        login_index = {login: i for i, login in enumerate(page_logins)}
+        symbol_index = {symbol: i for i, symbol in enumerate(symbols)}
+        cells = [
+            [login_index[login], symbol_index[symbol], round(float(cell), 2)]
+            for login, symbol, cell in (
+                totals.filter(login__login__in=page_logins)
+                .annotate(cell=expression)
+                .values_list('login__login', 'symbol', 'cell')
+            )
+        ]
+
+        return JsonResponse({
+            'value': value,
+            'sort': sort,
+            'page': page,
+            'page_size': page_size,
+            'total_logins': total_logins,
+            'symbols': symbols,
+            'totals': [round(float(c['total'] or 0), 2) for c in columns],
+            'logins': page_logins,
+            'cells': cells,
+        })
+
+    except QueryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+def format_closed_position(pos):
+    """Format volume, price and profit of a ClosedPositions row as display strings.
+
+    Values are stored in lots and account currency already; no scaling happens here.
+    """
+    processed_pos = pos.copy()
+    for field, places in (('volume', 2), ('price', 5), ('profit', 2)):
+        if pos.get(field) is not None:
+            processed_pos[field] = f"{pos[field]:.{places}f}"
+    return processed_pos
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_closed_positions_from_db(request):
+    """Fetch closed positions from the database.
+
+    Filters: login, group, symbol, position_type (comma-separated lists) and
+    date_from/date_to on date_closed. Pass limit and/or cursor to get keyset
+    pages ordered by sort (default -date_closed) with a next_cursor.
+    """
+    try:
+        positions = filter_queryset(ClosedPositions.objects.all(), request.GET, CLOSED_POSITION_FILTERS)
+        next_cursor = None
+        if wants_page(request.GET):
+            rows, next_cursor = keyset_page(
+                positions, request.GET, CLOSED_POSITION_VALUES, CLOSED_POSITION_SORTS, '-date_closed'
+            )
+        else:
+            rows = positions.values(*CLOSED_POSITION_VALUES)
+
+        # Format volume, price, and profit for display
+        processed_positions = [format_closed_position(pos) for pos in rows]
 
         # Return the data as JSON
-        return JsonResponse({'closed_positions': processed_positions}, safe=False)
+        response = {'closed_positions': processed_positions}
+        if wants_page(request.GET):
+            response['next_cursor'] = next_cursor
+        return JsonResponse(response, safe=False)
 
+    except QueryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
+EXPORT_CHUNK_SIZE = 2000  # rows read per query while exporting
+
+
+class _Echo:
+    """File-like object whose write() hands the CSV line back instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def _export_chunk(positions, after):
+    """Read the next EXPORT_CHUNK_SIZE rows in (date_closed, id) order after ``after``.
+
+    Returns ``(rows, after)`` with ``after`` the key to continue from.
+    """
+    if after is not None:
+        date_closed, pk = after
+        positions = positions.filter(Q(date_closed__gt=date_closed) | Q(date_closed=date_closed, id__gt=pk))
+    rows = list(positions.order_by('date_closed', 'id').values(*CLOSED_POSITION_VALUES, 'id')[:EXPORT_CHUNK_SIZE])
+    if not rows:
+        return rows, after
+    after = (rows[-1]['date_closed'], rows[-1]['id'])
+    for row in rows:
+        del row['id']
+    return rows, after
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def export_closed_positions(request):
+    """Stream closed positions as NDJSON (default) or CSV (?format=csv).
+
+    Accepts the same filters as get_closed_positions_from_db. Rows are read in
+    keyset chunks of EXPORT_CHUNK_SIZE and written out chunk by chunk, so memory
+    use does not grow with the size of the export. Under ASGI the chunks come from
+    an async iterator; Django reads a sync one into memory before sending it there.
+    """
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return JsonResponse({'error': "format must be 'ndjson' or 'csv'"}, status=400)
+    try:
+        positions = filter_queryset(ClosedPositions.objects.all(), request.GET, CLOSED_POSITION_FILTERS)
+    except QueryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if export_format == 'csv':
+        import csv
+        writer = csv.writer(_Echo())
+        header = writer.writerow(CLOSED_POSITION_VALUES)
+
+        def render(pos):
+            return writer.writerow([pos[f] for f in CLOSED_POSITION_VALUES])
+        content_type = 'text/csv'
+    else:
+        from django.core.serializers.json import DjangoJSONEncoder
+        header = None
+
+        def render(pos):
+            return json.dumps(pos, cls=DjangoJSONEncoder) + '\n'
+        content_type = 'application/x-ndjson'
+
+    def chunks():
+        if header:
+            yield header
+        after = None
+        while True:
+            rows, after = _export_chunk(positions, after)
+            if not rows:
+                return
+            yield ''.join(render(format_closed_position(pos)) for pos in rows)
+
+    async def async_chunks():
+        if header:
+            yield header
+        read = sync_to_async(_export_chunk)
+        after = None
+        while True:
+            rows, after = await read(positions, after)
+            if not rows:
+                return
+            yield ''.join(render(format_closed_position(pos)) for pos in rows)
+
+    streaming = async_chunks() if isinstance(request, ASGIRequest) else chunks()
+    response = StreamingHttpResponse(streaming, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="closed_positions.{export_format}"'
+    return response
+
+
 def sync_mt5_data(request):
     try:
         call_command("sync_mt5")   # or the exact name of your command file
@@ -723,21 +893,103 @@ def sync_mt5_data(request):
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+@require_http_methods(["GET"])
+def get_sync_status(request):
+    """Return sync job, pool run, live-sync, MT5 session pool and event stream statistics."""
+    from .tasks import scheduler
+    return JsonResponse({
+        "jobs": scheduler.status(),
+        "runs": run_summaries(),
+        "live_sync": live_sync.registry.status(),
+        "mt5_pool": MT5Service.pool_status(),
+        "events": events.broker.status(),
+    })
+
+
+# Seconds between keep-alive comments, so proxies don't drop an idle stream
+EVENT_KEEPALIVE = 15
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+async def stream_events(request):
+    """Push data changes as Server-Sent Events (see core.events); needs the ASGI app.
+
+    topics picks any of positions, accounts, group_summary (default all) and
+    logins (comma-separated) limits positions/accounts events to those accounts.
+    Reconnecting with Last-Event-ID replays missed events or sends a reset.
+    """
+    topics = [t for t in request.GET.get('topics', '').split(',') if t] or list(events.TOPICS)
+    unknown = set(topics) - set(events.TOPICS)
+    if unknown:
+        return JsonResponse({"error": f"Unknown topics: {', '.join(sorted(unknown))}"}, status=400)
+    try:
+        logins = [int(l) for l in request.GET.get('logins', '').split(',') if l.strip()]
+        last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return JsonResponse({"error": "logins and Last-Event-ID must be integers"}, status=400)
+
+    subscription = events.broker.subscribe(asyncio.get_running_loop(), topics, logins)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            sent = last_id or 0
+            if last_id is not None:
+                missed = events.broker.since(last_id, subscription.topics)
+                if missed is None:
+                    yield "event: reset\ndata: {}\n\n"
+                    missed = []
+                for event in missed:
+                    if subscription.accepts(event):
+                        frame = subscription.render(event)
+                        if frame:
+                            yield frame
+                    sent = event['id']
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), EVENT_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    # Fell too far behind; the client reloads and reconnects
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+                if event['id'] <= sent:
+                    continue  # already replayed from the history
+                frame = subscription.render(event)
+                if frame:
+                    yield frame
+        finally:
+            events.broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 def index(request):
     file_path = os.path.join(settings.BASE_DIR, 'static', 'index.html')
     return FileResponse(open(file_path, 'rb'))
 
+def sync_groups_to_db():
+    """Fetch the group list from MT5 and store any new groups; returns the MT5 list."""
+    svc = MT5Service()
+    groups = svc.get_group_list()
+    created = Groups.objects.bulk_create([Groups(Groups=name) for name in groups], ignore_conflicts=True)
+    if created:
+        generation.bump()
+    return groups
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_groups(request):
     """Get list of groups from MT5 and store in DB."""
     try:
-        svc = MT5Service()
-        groups = svc.get_group_list()
-        # Explicitly save groups to database
-        from .models import Groups
-        for group_name in groups:
-            Groups.objects.get_or_create(Groups=group_name)
+        groups = sync_groups_to_db()
         return JsonResponse({'groups': groups, 'stored': True}, safe=False)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -759,127 +1011,20 @@ def get_account_details(request, login_id):
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_open_positions(request, login_id):
-    """Get open positions for a specific login ID from MT5 and store in DB."""
-    try:
-        # Start the background thread for auto-sync
-        sync_thread = threading.Thread(target=sync_open_positions_periodically, args=(login_id,))
-        sync_thread.daemon = True  # Daemonize the thread so it stops when the main program stops
-        sync_thread.start()
-
-        # Fetch and return the current positions
-        svc = MT5Service()
-        positions = svc.get_open_positions(login_id)
-        print(f"Fetched {len(positions)} positions from MT5 for login {login_id}")
-
-        # Store positions in the database
-        account = Accounts.objects.get(login=login_id)
-        existing_positions = set(OpenPositions.objects.filter(login=account).values_list('position_id', flat=True))
-        fetched_positions = set()
-        stored_count = 0
-        for pos in positions:
-            pos_id = pos.get('id')
-            if pos_id is None:
-                print(f"Warning: Position missing 'id' field: {pos}")
-                continue
-            symbol = pos.get('symbol')
-            volume = pos.get('volume')
-            price = pos.get('price')
-            position_type = pos.get('type')
-            if symbol is None or volume is None or price is None or position_type is None:
-                print(f"Warning: Position {pos_id} has None values for required fields: symbol={symbol}, volume={volume}, price={price}, type={position_type}")
-                continue
-            fetched_positions.add(pos_id)
-            try:
-                obj, created = OpenPositions.objects.update_or_create(
-                    login=account,
-                    position_id=pos_id,
-                    defaults={
-                        'symbol': symbol,
-                        'volume': volume,
-                        'price': price,
-                        'profit': pos.get('profit') or 0,
-                        'position_type': position_type,
-                        'date_created': normalize_date(pos.get('date')),
-                    }
-                )
-                stored_count += 1
-                print(f"Stored position {pos_id}: created={created}")
-            except Exception as e:
-                print(f"Error storing position {pos_id}: {e}")
-                continue
-
-        # Delete positions that are no longer open
-        to_delete = existing_positions - fetched_positions
-        if to_delete:
-            deleted_count = OpenPositions.objects.filter(login=account, position_id__in=to_delete).delete()[0]
-            print(f"Deleted {deleted_count} closed positions")
+    """Get open positions for a specific login ID from MT5 and store in DB.
 
-        print(f"Successfully stored {stored_count} positions for login {login_id}")
-        return JsonResponse({'positions': positions, 'stored': True, 'stored_count': stored_count}, safe=False)
+    Keeps the login refreshed in the background while it is being watched; see core/live_sync.py.
+    """
+    try:
+        result = live_sync.registry.get(login_id)
+        positions = result['positions']
+        print(f"Successfully stored {result['stored_count']} positions for login {login_id}")
+        return JsonResponse({'positions': positions, 'stored': True, 'stored_count': result['stored_count']}, safe=False)
 
     except Exception as e:
         print(f"Error in get_open_positions: {e}")
         return JsonResponse({'error': str(e)}, status=500)
 
-# Function to perform the sync periodically in a background thread
-def sync_open_positions_periodically(login_id):
-    """Background thread to sync open positions periodically for a specific login_id."""
-    while True:
-        try:
-            svc = MT5Service()
-            positions = svc.get_open_positions(login_id)
-            print(f"Fetched {len(positions)} positions from MT5 for login {login_id}")
-            # Store positions in the database
-            account = Accounts.objects.get(login=login_id)
-            existing_positions = set(OpenPositions.objects.filter(login=account).values_list('position_id', flat=True))
-            fetched_positions = set()
-            stored_count = 0
-            for pos in positions:
-                pos_id = pos.get('id')
-                if pos_id is None:
-                    print(f"Warning: Position missing 'id' field: {pos}")
-                    continue
-                # Skip if required fields are None
-                symbol = pos.get('symbol')
-                volume = pos.get('volume')
-                price = pos.get('price')
-                position_type = pos.get('type')
-                if symbol is None or volume is None or price is None or position_type is None:
-                    print(f"Warning: Position {pos_id} has None values for required fields: symbol={symbol}, volume={volume}, price={price}, type={position_type}")
-                    continue
-                fetched_positions.add(pos_id)
-                try:
-                    obj, created = OpenPositions.objects.update_or_create(
-                        login=account,
-                        position_id=pos_id,
-                        defaults={
-                            'symbol': symbol,
-                            'volume': volume,
-                            'price': price,
-                            'profit': pos.get('profit') or 0,
-                            'position_type': position_type,
-                            'date_created': normalize_date(pos.get('date')),
-                        }
-                    )
-                    stored_count += 1
-                    print(f"Stored position {pos_id}: created={created}")
-                except Exception as e:
-                    print(f"Error storing position {pos_id}: {e}")
-                    continue
-
-            # Delete positions that are no longer open
-            to_delete = existing_positions - fetched_positions
-            if to_delete:
-                deleted_count = OpenPositions.objects.filter(login=account, position_id__in=to_delete).delete()[0]
-                print(f"Deleted {deleted_count} closed positions")
-
-            print(f"Successfully stored {stored_count} positions for login {login_id}")
-        except Exception as e:
-            print(f"Error in sync_open_positions_periodically for login {login_id}: {str(e)}")
-
-        # Sleep for the desired period before syncing again (e.g., every 60 seconds)
-        time.sleep(60)  # Adjust the interval as needed
-
 @csrf_exempt
 @require_http_methods(["GET"])
 def fetch_all_open_positions(request):
@@ -888,102 +1033,53 @@ def fetch_all_open_positions(request):
         svc = MT5Service()
         from .models import Accounts, OpenPositions
         from django.utils import timezone
-        login_ids = Accounts.objects.values_list('login', flat=True)
-        all_positions = []
-        stored_count = 0
-        for login_id in login_ids:
-            positions = svc.get_open_positions(login_id)
-            account = Accounts.objects.get(login=login_id)
-            # Get current positions in DB for this login
-            existing_positions = set(OpenPositions.objects.filter(login=account).values_list('position_id', flat=True))
-            fetched_positions = set()
-            for pos in positions:
-                pos_id = pos.get('id')
-                if pos_id is None:
-                    continue
-                # Skip if required fields are None
-                symbol = pos.get('symbol')
-                volume = pos.get('volume')
-                price = pos.get('price')
-                position_type = pos.get('type')
-                if symbol is None or volume is None or price is None or position_type is None:
-                    continue
-                fetched_positions.add(pos_id)
-                OpenPositions.objects.update_or_create(
-                    login=account,
-                    position_id=pos_id,
-                    defaults={
-                        'symbol': symbol,
-                        'volume': volume,
-                        'price': price,
-                        'profit': pos.get('profit') or 0,
-                        'position_type': position_type,
-                        'date_created': pos.get('date') or timezone.now(),
-                    }
-                )
-                stored_count += 1
-            # Delete positions that are no longer open
-            to_delete = existing_positions - fetched_positions
-            OpenPositions.objects.filter(login=account, position_id__in=to_delete).delete()
-            all_positions.extend(positions)
-        return JsonResponse({'positions': all_positions, 'stored_count': stored_count}, safe=False)
+        by_group = accounts_by_group(Accounts.objects.all())
+        positions_by_login = fetch_open_positions_by_group(svc, by_group)
+        all_positions = [p for positions in positions_by_login.values() for p in positions]
+        summary = reconcile_open_positions(positions_by_login)
+        stored_count = summary['stored']
+        return JsonResponse({'positions': all_positions, 'stored_count': stored_count, 'summary': summary}, safe=False)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
 
+def store_accounts(accounts):
+    """Store account dicts from MT5 in the Accounts table in bulk; returns the ingest summary."""
+    return ingest_accounts(accounts)
+
+
+def sync_accounts():
+    """Stream all accounts from MT5 into the Accounts table; returns the ingest summary."""
+    svc = MT5Service()
+    stats = []
+    summary = store_accounts(svc.iter_accounts_by_groups(stats=stats))
+    print(f"Fetched {summary['fetched']} accounts from {len(stats)} groups "
+          f"with {sum(g['calls'] for g in stats)} MT5 calls")
+    return summary
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def list_accounts(request):
-    """List all accounts and store in DB."""
+    """Fetch all accounts from MT5 and store in DB.
+
+    Returns an ingest summary; pass ?include_accounts=1 to also get the account list.
+    """
     try:
         svc = MT5Service()
-        accounts = svc.list_accounts_by_groups()
-        print(f"Fetched {len(accounts)} accounts from MT5")
-        
-        # Store accounts in database
-        from .models import Accounts
-        from datetime import datetime
-        
-        stored_count = 0
-        for acc in accounts:
-            try:
-                last_access = None
-                registration = None
-                
-                # Handle last_access (either string, datetime, or timestamp)
-                if acc.get('last_access'):
-                    last_access = normalize_date(acc['last_access'])
-
-                # Handle registration (either string, datetime, or timestamp)
-                if acc.get('registration'):
-                    registration = normalize_date(acc['registration'])
-                
-                account_obj, created = Accounts.objects.update_or_create(
-                    login=acc['login'],
-                    defaults={
-                        'name': acc.get('name'),
-                        'email': acc.get('email'),
-                        'group': acc.get('group'),
-                        'leverage': acc.get('leverage'),
-                        'balance': acc.get('balance', 0),
-                        'equity': acc.get('equity', 0),
-                        'profit': acc.get('profit', 0),
-                        'margin': acc.get('margin', 0),
-                        'margin_free': acc.get('margin_free', 0),
-                        'margin_level': acc.get('margin_level', 0),
-                        'last_access': last_access,
-                        'registration': registration,
-                    }
-                )
-                stored_count += 1
-                # print(f"Stored account {acc['login']}: created={created}")
-            except Exception as e:
-                print(f"Error storing account {acc.get('login')}: {e}")
-                continue
-        
-        print(f"Successfully stored {stored_count} accounts in database")
-        return JsonResponse({'accounts': accounts, 'stored': True, 'stored_count': stored_count}, safe=False)
+        stats = []
+        accounts = svc.iter_accounts_by_groups(stats=stats)
+        include_accounts = request.GET.get('include_accounts', '').lower() in ('1', 'true', 'yes')
+        if include_accounts:
+            accounts = list(accounts)
+
+        summary = store_accounts(accounts)
+        print(f"Successfully stored {summary['stored']} accounts in database")
+        response = {'stored': True, 'stored_count': summary['stored'], 'summary': summary, 'groups': stats}
+        if include_accounts:
+            response['accounts'] = accounts
+        return JsonResponse(response, safe=False)
     
     except Exception as e:
         print(f"Error in list_accounts: {e}")
@@ -992,6 +1088,8 @@ def list_accounts(request):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@cache_control(no_cache=True)
+@condition(etag_func=generation.etag)
 def get_groups_from_db(request):
     """Get list of groups from database."""
     try:
@@ -1005,12 +1103,25 @@ def get_groups_from_db(request):
     
 @csrf_exempt
 @require_http_methods(["GET"])
+@cache_control(no_cache=True)
+@condition(etag_func=generation.etag)
 def get_accounts_from_db(request):
-    """Get list of accounts from database."""
+    """Get list of accounts from database.
+
+    Filters: login, group (comma-separated lists) and date_from/date_to on
+    registration. Pass limit and/or cursor to get keyset pages ordered by sort
+    (default login) with a next_cursor.
+    """
     try:
         from .models import Accounts
-        accounts = list(Accounts.objects.values())
+        accounts = filter_queryset(Accounts.objects.all(), request.GET, ACCOUNT_FILTERS)
+        if wants_page(request.GET):
+            rows, next_cursor = keyset_page(accounts, request.GET, ACCOUNT_VALUES, ACCOUNT_SORTS, 'login')
+            return JsonResponse({'accounts': rows, 'next_cursor': next_cursor}, safe=False)
+        accounts = list(accounts.values(*ACCOUNT_VALUES))
         return JsonResponse({'accounts': accounts}, safe=False)
+    except QueryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -1090,6 +1201,7 @@ def sync_closed_positions(request, login_id):
                 print(f"Error storing deal {deal_id}: {e}")
                 continue
 
+        refresh_symbol_totals([account.pk], open_positions=False, closed_positions=True)
         print(f"Successfully stored {stored_count} closed positions for login {login_id}")
         return JsonResponse({'deals': closed_positions, 'stored_count': stored_count}, safe=False)
 
@@ -1102,11 +1214,12 @@ def sync_closed_positions(request, login_id):
 @require_http_methods(["GET"])
 def sync_all_close_positions(request):
     """Start background sync for all closed positions."""
-    # For debugging, run synchronously
     try:
-        sync_closed_positions_for_all_accounts()
+        if is_running('closed_positions'):
+            return JsonResponse({"status": "success", "message": "Sync already running"}, status=200)
+        threading.Thread(target=sync_closed_positions_for_all_accounts, daemon=True).start()
         return JsonResponse(
-            {"status": "success", "message": "Sync completed synchronously"},
+            {"status": "success", "message": "Sync started in background, see /api/sync/status/"},
             status=200
         )
     except Exception as e:
@@ -1119,129 +1232,106 @@ def sync_all_close_positions(request):
 
 def store_open_positions(account, positions):
     """Store the open positions for a given account."""
-    stored_count = 0
-    existing_positions = set(OpenPositions.objects.filter(login=account).values_list('position_id', flat=True))
-    fetched_positions = set()
+    return reconcile_open_positions({account.login: positions}, accounts={account.login: account})['stored']
 
-    for pos in positions:
-        pos_id = pos.get("id")
-        if not pos_id:
-            continue
 
-        symbol = pos.get("symbol")
-        volume = pos.get("volume")
-        price = pos.get("price")
-        position_type = pos.get("type")
+from datetime import datetime, timedelta
 
-        if any(v is None for v in [symbol, volume, price, position_type]):
-            continue
+# First sync of an account loads this much history; later syncs start at the watermark
+CLOSED_SYNC_INITIAL_DAYS = 30
+# Re-read a little before the watermark to catch deals stamped late by the server
+CLOSED_SYNC_OVERLAP = timedelta(minutes=10)
 
-        fetched_positions.add(pos_id)
 
-        try:
-            # Store the open position in DB
-            OpenPositions.objects.update_or_create(
-                login=account,
-                position_id=pos_id,
-                defaults={
-                    "symbol": symbol,
-                    "volume": volume,
-                    "price": price,
-                    "profit": pos.get("profit", 0),
-                    "position_type": position_type,
-                    "date_created": normalize_date(pos.get("date"))
-                }
-            )
-            stored_count += 1
-        except Exception as e:
-            print(f"Error storing position {pos_id}: {e}")
+def closed_sync_window(account, to_date):
+    """Return the (from_date, to_date) deal window for an account's next closed sync.
 
-    # Delete closed positions that no longer exist
-    to_delete = existing_positions - fetched_positions
-    if to_delete:
-        OpenPositions.objects.filter(login=account, position_id__in=to_delete).delete()
+    Both ends are MT5 server time (see MT5Service.server_time), like the watermark.
+    """
+    if account.last_closed_sync:
+        return account.last_closed_sync - CLOSED_SYNC_OVERLAP, to_date
+    return to_date - timedelta(days=CLOSED_SYNC_INITIAL_DAYS), to_date
 
-    return stored_count
 
+def closed_sync_now(svc):
+    """MT5 server time to sync up to; a host clock in another timezone would skip or delay deals."""
+    now = svc.server_time()
+    if now is None:
+        raise Exception("MT5 server time unavailable, closed positions not synced")
+    return now
 
-from datetime import datetime, timedelta
 
-def sync_closed_positions_for_all_accounts():
-    print("Starting background sync for closed positions.")
-    try:
-        svc = MT5Service()
-        svc.connect()  # Make sure MT5 Manager is connected
-        accounts = Accounts.objects.all()
-        total_stored = 0
-        from_date = datetime.now() - timedelta(days=30)
-        to_date = datetime.now()
+def sync_closed_positions_for_account(svc, account, to_date=None):
+    """Fetch closed deals since the account's watermark and store them.
 
-        for account in accounts:
-            login_id = account.login
-            
+    The watermark (Accounts.last_closed_sync) only moves forward once the deals
+    are committed, so a failed run is retried from the same point next time.
+    """
+    to_date = to_date or closed_sync_now(svc)
+    from_date, to_date = closed_sync_window(account, to_date)
+    closed_positions = svc.get_closed_trades(
+        account.login, from_date=to_mt5_time(from_date), to_date=to_mt5_time(to_date)
+    )
+    with transaction.atomic():
+        stored_count = store_closed_positions(account, closed_positions)
+        Accounts.objects.filter(pk=account.pk).update(last_closed_sync=to_date)
+        generation.bump()  # last_closed_sync is shown by /api/accounts/db/
+    account.last_closed_sync = to_date
+    return {
+        "account": account.login,
+        "from": from_date,
+        "to": to_date,
+        "fetched": len(closed_positions),
+        "stored": stored_count,
+    }
 
-            closed_positions = svc.get_closed_trades(login_id, from_date=from_date, to_date=to_date)
-            
 
-            stored_closed_positions = store_closed_positions(account, closed_positions)
-            
+def sync_closed_positions_for_all_accounts():
+    """Sync closed deals for every account in the enabled groups, one group per pool task.
 
-            total_stored += stored_closed_positions
+    Each group's deals are requested with one bulk MT5 call from the group's oldest
+    watermark, then stored and the fetched accounts' watermarks advanced in one
+    transaction, so a failing group doesn't hold back the others.
+    """
+    print("Starting background sync for closed positions.")
+    svc = MT5Service()
+    svc.connect()  # Make sure MT5 Manager is connected
+    to_date = closed_sync_now(svc)
+
+    groups = svc.enabled_group_names()
+    accounts = Accounts.objects.filter(group__in=groups) if groups else Accounts.objects.all()
+    by_group = accounts_by_group(accounts)
+
+    def fetch(item):
+        group, group_accounts = item
+        from_date = min(closed_sync_window(account, to_date)[0] for account in group_accounts.values())
+        return svc.get_closed_trades_by_group(
+            [group], from_date=to_mt5_time(from_date), to_date=to_mt5_time(to_date),
+            logins=list(group_accounts),
+        )
 
-        print(f"Synced {total_stored} closed positions across all accounts.")
+    def store(item, deals_by_login):
+        group, group_accounts = item
+        fetched = {login: deals for login, deals in deals_by_login.items() if login in group_accounts}
+        with transaction.atomic():
+            result = store_closed_deals(fetched, accounts=group_accounts)
+            Accounts.objects.filter(login__in=list(fetched)).update(last_closed_sync=to_date)
+            generation.bump()  # last_closed_sync is shown by /api/accounts/db/
+        return {
+            "accounts": len(fetched),
+            "not_fetched": len(group_accounts) - len(fetched),
+            "fetched": result["fetched"],
+            "stored": result["stored"],
+        }
 
-    except Exception as e:
-        import traceback
-        print(f"Error in sync_closed_positions_for_all_accounts: {e}")
-        traceback.print_exc()
+    summary = run_pool('closed_positions', by_group.items(), fetch, store, key=lambda item: item[0])
+    print(f"Synced {summary['totals'].get('stored', 0)} closed positions across all accounts.")
+    return summary
 
 
 def store_closed_positions(account, deals):
     """Store the closed positions for a given account."""
-    stored_count = 0
-
-    for deal in deals:
-        position_id = getattr(deal, "PositionID", None)  # <-- Unique per account
-        deal_id = getattr(deal, "Deal", None)
-        if not position_id:
-            continue  # Skip if PositionID missing
-
-        entry = getattr(deal, "Entry", None)
-        if entry != 1:
-            continue
-
-        symbol = getattr(deal, "Symbol", None)
-        volume = getattr(deal, "Volume", getattr(deal, "VolumeClosed", None))
-        volume= round(getattr(deal, 'Volume', 0) / 10000, 2)
-        price = getattr(deal, "Price", None)
-        profit = getattr(deal, "Profit", 0)
-        action = getattr(deal, "Action", None)
-        position_type = 'Buy' if action == 0 else 'Sell' if action == 1 else None
-        date_closed = getattr(deal, "Time", None)
-
-        if any(v is None for v in [symbol, volume, price, position_type, position_id]):
-            print(f"Missing data for deal {deal_id}. Skipping.")
-            continue
-
-        try:
-            ClosedPositions.objects.update_or_create(
-                login=account,
-                position=position_id,  # <-- use position as unique
-                defaults={
-                    "deal_id": deal_id,
-                    "symbol": symbol,
-                    "volume": str(volume),
-                    "price": str(price),
-                    "profit": str(profit or 0),
-                    "position_type": position_type,
-                    "date_closed": normalize_date(date_closed),
-                }
-            )
-            stored_count += 1
-        except Exception as e:
-            print(f"Error storing position {position_id}: {e}")
-
-    return stored_count
+    return store_closed_deals({account.login: deals}, accounts={account.login: account})['stored']
 
 
 import logging
@@ -1333,6 +1423,7 @@ class ServerSettingsAPIView(APIView):
             )
 
     def put(self, request, *args, **kwargs):
+        logger = logging.getLogger(__name__)
         try:
             data = request.data
             required_fields = ['server_ip', 'login_id', 'server_password', 'server_name']
@@ -1361,7 +1452,7 @@ class ServerSettingsAPIView(APIView):
                 server_setting.save()
 
             # Delete all existing accounts to prevent mixing old and new data
-            Accounts.objects.all().delete()
+            delete_accounts(Accounts.objects.all())
 
             # Force refresh MT5 Manager connection with new credentials
             try:
@@ -1421,7 +1512,7 @@ class ServerSettingsAPIView(APIView):
                 with transaction.atomic():
                     MT5GroupConfig.objects.all().delete()
                 # Delete all existing accounts to prevent mixing old and new data
-                Accounts.objects.all().delete()
+                delete_accounts(Accounts.objects.all())
                 # Clear all Django cache
                 cache.clear()
                 # Clear MT5-specific cache keys
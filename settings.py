@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -137,3 +138,17 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  # Vite dev server
     "http://127.0.0.1:5173",
 ]
+
+# Run the sync scheduler (and pump ingestion) in the serving process; management commands
+# never run it. Set RMS_RUN_SCHEDULER=0 on extra web workers so only one process owns the syncs.
+RMS_RUN_SCHEDULER = os.environ.get('RMS_RUN_SCHEDULER', '1').lower() not in ('0', 'false', 'no', 'off')
+
+# Write MT5 pump callbacks (positions, deals, users) to the DB as they arrive
+MT5_PUMP_INGESTION = True
+
+# Worker threads for bulk account syncs, and how many of them may call MT5 at once
+SYNC_WORKERS = 8
+SYNC_MT5_CONCURRENCY = 4
+
+# MT5 manager sessions shared by API reads and syncs (0 = single shared connection)
+MT5_POOL_SIZE = 4